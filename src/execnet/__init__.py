@@ -8,6 +8,7 @@ pure python lib for connecting to local and remote Python Interpreters.
 """
 
 from ._version import version as __version__
+from .executor import Executor
 from .gateway import Gateway
 from .gateway_base import Channel
 from .gateway_base import DataFormatError
@@ -20,6 +21,7 @@ from .gateway_base import dumps
 from .gateway_base import load
 from .gateway_base import loads
 from .gateway_bootstrap import HostNotFound
+from .multi import GatewayPool
 from .multi import Group
 from .multi import MultiChannel
 from .multi import default_group
@@ -32,7 +34,9 @@ __all__ = [
     "Channel",
     "DataFormatError",
     "DumpError",
+    "Executor",
     "Gateway",
+    "GatewayPool",
     "Group",
     "HostNotFound",
     "LoadError",
@@ -0,0 +1,308 @@
+"""
+A ``concurrent.futures.Executor`` running functions on the gateways of a Group.
+"""
+
+from __future__ import annotations
+
+import inspect
+import itertools
+import os
+import time
+import types
+from collections.abc import Callable
+from collections.abc import Iterable
+from collections.abc import Iterator
+from concurrent import futures
+from contextlib import suppress
+from functools import partial
+from threading import Lock
+from typing import TYPE_CHECKING
+from typing import Any
+
+from . import executor_remote
+from .gateway import _source_of_function
+from .gateway_base import DumpError
+from .gateway_base import RemoteError
+from .gateway_base import WorkerPool
+from .multi import Group
+from .scheduler import Scheduler
+from .scheduler import Task
+
+if TYPE_CHECKING:
+    from .gateway import Gateway
+    from .gateway_base import Channel
+
+# put into the event queue by channels that closed
+_CLOSED = object()
+
+
+class _Worker:
+    """The task channel to one gateway and the tasks sent through it."""
+
+    def __init__(self, gateway: Gateway, channel: Channel) -> None:
+        self.gateway = gateway
+        self.channel = channel
+        self.defined: set[int] = set()
+        self.outstanding: dict[int, Task] = {}
+
+
+class Executor(futures.Executor):
+    """Run pure functions on the gateways of 'group', like a
+    ``ProcessPoolExecutor`` whose processes may be on other hosts.
+
+    As for ``remote_exec`` the functions must not use closures or
+    non-builtin globals, their arguments and results must be
+    serializable like channel items.  Only functions defined with
+    ``def`` in a source file can be submitted, not lambdas, builtins
+    like ``len`` or ``functools.partial`` objects; wrap those in a
+    function.  A remote exception is raised as ``RemoteError``, a
+    gateway going away fails its tasks.
+
+    Each gateway runs one task at a time.  The 'scheduler' decides
+    which gateway gets which task.  By default tasks are queued locally
+    and sent to the gateway with the fewest outstanding tasks, at most
+    'max_pending' to each, so that a gateway has its next task at hand
+    without a fast one waiting for a slow one.  Gateways added to the
+    group later get tasks as well.
+
+    Without a 'group' the executor makes its own with 'max_workers'
+    popen gateways, ``os.cpu_count()`` by default, and terminates it on
+    shutdown.  Done-callbacks of the futures run in a thread of the
+    executor and should not block; ``shutdown()`` called from them
+    does not wait.
+    """
+
+    def __init__(
+        self,
+        group: Group | None = None,
+        max_workers: int | None = None,
+        max_pending: int | None = None,
+        scheduler: Scheduler | None = None,
+    ) -> None:
+        if scheduler is None:
+            scheduler = Scheduler(2 if max_pending is None else max_pending)
+        elif max_pending is not None:
+            raise ValueError("max_pending can only be given without a scheduler")
+        self._ownsgroup = group is None
+        if group is None:
+            if max_workers is None:
+                max_workers = os.cpu_count() or 1
+            if max_workers < 1:
+                raise ValueError(f"max_workers must be positive, got {max_workers!r}")
+            group = Group()
+            group.makegateways(["popen"] * max_workers)
+        elif max_workers is not None:
+            raise ValueError("max_workers can only be given without a group")
+        if not len(group):
+            raise ValueError(f"{group!r} has no gateways")
+        self.group = group
+        self.scheduler = scheduler
+        self._lock = Lock()
+        self._shutdown = False
+        self._broken: futures.BrokenExecutor | None = None
+        self._cancel_futures = False
+        self._functions: dict[
+            Callable[..., object], tuple[int, str, str | None, str]
+        ] = {}
+        self._taskids = itertools.count()
+        self._events = group.execmodel.queue.Queue()
+        # owned by the manager thread
+        self._workers: dict[Gateway, _Worker] = {}
+        self._lost: set[Gateway] = set()
+        # ident of the thread running _manage(), which runs the callbacks
+        self._manager: int | None = None
+        self._workerpool = WorkerPool(group.execmodel)
+        self._workerpool.spawn(self._manage)
+
+    def __repr__(self) -> str:
+        return f"<Executor {self.group!r}>"
+
+    def submit(  # type: ignore[override]
+        self, fn: Callable[..., object], /, *args: object, **kwargs: object
+    ) -> futures.Future[Any]:
+        """Schedule ``fn(*args, **kwargs)`` to run on one of the gateways
+        and return a Future for its result."""
+        return self._submit(fn, [(args, kwargs or None)], single=True)
+
+    def map(  # type: ignore[override]
+        self,
+        fn: Callable[..., object],
+        *iterables: Iterable[object],
+        timeout: float | None = None,
+        chunksize: int = 1,
+        ordered: bool = True,
+    ) -> Iterator[Any]:
+        """Return an iterator over ``fn`` applied to the items of the
+        iterables, which are submitted right away.
+
+        The items are sent in tasks of 'chunksize' calls, which saves
+        round trips for short calls.  With 'ordered' set to False the
+        results come as soon as their task is done, which need not be
+        the order of the items.  Iteration raises ``TimeoutError`` if
+        a result is not available 'timeout' seconds after the call.
+        """
+        if chunksize < 1:
+            raise ValueError("chunksize must be >= 1.")
+        end_time = None if timeout is None else timeout + time.monotonic()
+        calls = zip(*iterables, strict=False)
+        fs = []
+        while chunk := list(itertools.islice(calls, chunksize)):
+            fs.append(self._submit(fn, [(args, None) for args in chunk], single=False))
+        return self._results(fs, end_time, ordered)
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False) -> None:
+        """Stop accepting tasks and let the gateways finish those
+        submitted, or only those already sent with 'cancel_futures'.
+        If 'wait' is true, wait for them to finish, unless called from
+        a done-callback which the executor's own thread runs."""
+        with self._lock:
+            if cancel_futures:
+                self._cancel_futures = True
+            if not self._shutdown:
+                self._shutdown = True
+                self._events.put(None)
+        if wait and self.group.execmodel.get_ident() != self._manager:
+            self._workerpool.waitall()
+
+    def _submit(
+        self,
+        fn: Callable[..., object],
+        calls: list[tuple[tuple[object, ...], dict[str, object] | None]],
+        single: bool,
+    ) -> futures.Future[Any]:
+        with self._lock:
+            if self._broken is not None:
+                raise self._broken
+            if self._shutdown:
+                raise RuntimeError("cannot schedule new futures after shutdown")
+            if not isinstance(fn, types.FunctionType):
+                raise TypeError(f"only functions can be submitted, not {fn!r}")
+            if fn not in self._functions:
+                source = _source_of_function(fn, needs_channel=False)
+                self._functions[fn] = (
+                    len(self._functions),
+                    source,
+                    inspect.getsourcefile(fn),
+                    fn.__name__,
+                )
+            future: futures.Future[Any] = futures.Future()
+            self._events.put(Task(next(self._taskids), future, fn, calls, single))
+        return future
+
+    def _results(
+        self, fs: list[futures.Future[Any]], end_time: float | None, ordered: bool
+    ) -> Iterator[Any]:
+        try:
+            if ordered:
+                done: Iterable[futures.Future[Any]] = fs
+            else:
+                timeout = None if end_time is None else end_time - time.monotonic()
+                done = futures.as_completed(fs, timeout)
+            for future in done:
+                if end_time is None:
+                    yield from future.result()
+                else:
+                    yield from future.result(end_time - time.monotonic())
+        finally:
+            for future in fs:
+                future.cancel()
+
+    def _manage(self) -> None:
+        self._manager = self.group.execmodel.get_ident()
+        shutdown = False
+        while 1:
+            try:
+                event = self._events.get(timeout=self.scheduler.next_check())
+            except self.group.execmodel.queue.Empty:
+                pass  # time for the scheduler to look at running tasks
+            else:
+                if event is None:
+                    # put by shutdown() after all submitted tasks
+                    shutdown = True
+                elif isinstance(event, Task):
+                    self.scheduler.submit(event)
+                else:
+                    self._finished(*event)
+            if self._cancel_futures:
+                for task in self.scheduler.drain():
+                    task.future.cancel()
+            self._dispatch()
+            if shutdown and not self.scheduler.pending():
+                break
+        for worker in self._workers.values():
+            worker.channel.close()
+        if self._ownsgroup:
+            self.group.terminate()
+
+    def _finished(self, worker: _Worker, item: tuple[int, bool, Any] | object) -> None:
+        if item is _CLOSED:
+            error = worker.channel._getremoteerror() or EOFError(
+                f"{worker.gateway.id} closed while running a task"
+            )
+            for task in self.scheduler.leave(worker.gateway):
+                if not task.future.done():
+                    task.future.set_exception(error)
+            del self._workers[worker.gateway]
+            self._lost.add(worker.gateway)
+            return
+        assert isinstance(item, tuple)
+        taskid, ok, result = item
+        task = worker.outstanding.pop(taskid)
+        if ok is None:
+            self.scheduler.returned(worker.gateway, task)
+            return
+        self.scheduler.done(worker.gateway, task)
+        if task.future.done():
+            return  # the other run of a hedged task finished first
+        if not ok:
+            task.future.set_exception(RemoteError(result))
+        elif task.single:
+            task.future.set_result(result[0])
+        else:
+            task.future.set_result(result)
+
+    def _dispatch(self) -> None:
+        self._addworkers()
+        if not self._workers:
+            if self.scheduler.pending():
+                self._break(futures.BrokenExecutor("all gateways are gone"))
+            return
+        for gateway, task in self.scheduler.steal():
+            # a closed channel is reported through its callback
+            with suppress(OSError):
+                self._workers[gateway].channel.send((task.taskid,))
+        for gateway, task in self.scheduler.schedule():
+            self._send(self._workers[gateway], task)
+
+    def _send(self, worker: _Worker, task: Task) -> None:
+        definition = self._functions[task.function]
+        number = definition[0]
+        worker.outstanding[task.taskid] = task
+        try:
+            if number not in worker.defined:
+                worker.channel.send(definition)
+                worker.defined.add(number)
+            worker.channel.send((task.taskid, number, task.calls))
+        except (DumpError, OSError) as e:
+            del worker.outstanding[task.taskid]
+            self.scheduler.done(worker.gateway, task)
+            task.future.set_exception(e)
+
+    def _addworkers(self) -> None:
+        for gw in self.group:
+            if gw not in self._workers and gw not in self._lost and gw.hasreceiver():
+                channel = gw.remote_exec(executor_remote)
+                worker = _Worker(gw, channel)
+                self.scheduler.join(gw)
+                channel.setcallback(partial(self._received, worker), endmarker=_CLOSED)
+                self._workers[gw] = worker
+
+    def _received(self, worker: _Worker, item: object) -> None:
+        self._events.put((worker, item))
+
+    def _break(self, error: futures.BrokenExecutor) -> None:
+        with self._lock:
+            self._broken = error
+        for task in self.scheduler.drain():
+            if task.start():
+                task.future.set_exception(error)
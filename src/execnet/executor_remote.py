@@ -0,0 +1,84 @@
+"""
+Worker side of ``execnet.Executor``.
+"""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+from typing import Any
+
+if TYPE_CHECKING:
+    from execnet.gateway_base import Channel
+
+
+def serve_executor(channel: Channel) -> None:
+    """Run the tasks received through 'channel' one after another.
+
+    ``(number, source, file_name, function_name)`` defines the function
+    ``number``, ``(taskid, number, calls)`` calls it for each
+    ``(args, kwargs)`` pair of the calls list, kwargs being None if
+    empty.  Each task is answered with ``(taskid, ok, results)`` where
+    the results of a failed task are the error text.  ``(taskid,)``
+    asks to hand back a task which did not start yet, which is answered
+    with ``(taskid, None, None)`` instead.
+    """
+    gateway = channel.gateway
+    functions: dict[int, Any] = {}
+    queued: dict[int, tuple[Any, ...]] = {}
+    lock = gateway.execmodel.Lock()
+    wakeup = gateway.execmodel.Event()
+    closed = gateway.execmodel.Event()
+
+    def receive(request: tuple[Any, ...] | None) -> None:
+        if request is None:
+            closed.set()
+        elif len(request) == 4:
+            number, source, file_name, function_name = request
+            namespace = {"__name__": "__channelexec__"}
+            try:
+                co = compile(source + "\n", file_name or "<executor>", "exec")
+                exec(co, namespace)  # noqa: S102
+                functions[number] = namespace[function_name]
+            except Exception as exc:  # noqa: BLE001 - raised by the tasks
+                functions[number] = gateway._geterrortext(exc)
+            return
+        elif len(request) == 1:
+            with lock:
+                handback = queued.pop(request[0], None)
+            if handback is not None:
+                channel.send((request[0], None, None))
+            return
+        else:
+            with lock:
+                queued[request[0]] = request
+        wakeup.set()
+
+    channel.setcallback(receive, endmarker=None)
+    while 1:
+        wakeup.wait()
+        with lock:
+            if not queued:
+                if closed.is_set():
+                    break
+                wakeup.clear()
+                continue
+            taskid, number, calls = queued.pop(next(iter(queued)))
+        function = functions[number]
+        reply: tuple[int, bool, Any]
+        if isinstance(function, str):
+            reply = (taskid, False, function)
+        else:
+            try:
+                results = [function(*args, **(kwargs or {})) for args, kwargs in calls]
+            except Exception as exc:  # noqa: BLE001 - raised by the caller
+                reply = (taskid, False, gateway._geterrortext(exc))
+            else:
+                reply = (taskid, True, results)
+        try:
+            channel.send(reply)
+        except Exception as exc:  # noqa: BLE001 - e.g. an unserializable result
+            channel.send((taskid, False, gateway._geterrortext(exc)))
+
+
+if __name__ == "__channelexec__":
+    serve_executor(channel)  # type: ignore[name-defined]  # noqa:F821
@@ -5,32 +5,76 @@
 
 from __future__ import annotations
 
+import functools
+import hashlib
 import inspect
+import itertools
 import linecache
+import os
 import textwrap
 import types
+import weakref
+from collections import OrderedDict
 from collections.abc import Callable
 from typing import TYPE_CHECKING
 from typing import Any
 
 from . import gateway_base
+from . import rpc_remote
 from .gateway_base import IO
 from .gateway_base import Channel
 from .gateway_base import Message
 from .multi import Group
 from .xspec import XSpec
 
+if TYPE_CHECKING:
+    from .ioloop import IOLoop
+
 
 class Gateway(gateway_base.BaseGateway):
     """Gateway to a local or remote Python Interpreter."""
 
     _group: Group
 
-    def __init__(self, io: IO, spec: XSpec) -> None:
+    def __init__(self, io: IO, spec: XSpec, ioloop: IOLoop | None = None) -> None:
         """:private:"""
         super().__init__(io=io, id=spec.id, _startcount=1)
         self.spec = spec
-        self._initreceive()
+        # digests of the code the worker caches, least recently used first
+        self._sentcode: OrderedDict[bytes, None] = OrderedDict()
+        self._codelock = self.execmodel.Lock()
+        self._rpc: _RPCClient | None = None
+        self._rpclock = self.execmodel.Lock()
+        self._ioloop_done = self.execmodel.Event()
+        if ioloop is not None and ioloop.register(self):
+            self._ioloop: IOLoop | None = ioloop
+        else:
+            self._ioloop = None
+            self._initreceive()
+
+    @property
+    def features(self) -> frozenset[str]:
+        """Protocol extensions which both sides of this gateway support.
+
+        ``"frames"``: large channel items are sent in several frames.
+        ``"credit"``: ``Channel.setwindow()`` limits the other side.
+        ``"zlib"``, ``"lzma"``: the codecs usable with ``compress``.
+        ``"fds"``: ``Channel.sendfd()`` passes file descriptors.
+        """
+        return self._features
+
+    def _negotiate_features(self) -> None:
+        channel = self.remote_exec(
+            "channel.send(channel.gateway._agree_features(channel.receive()))"
+        )
+        channel.send(sorted(self._local_features()))
+        try:
+            features = channel.receive()
+            channel.waitclose()
+        except channel.RemoteError:
+            # the other side predates feature negotiation
+            features = []
+        self._features = frozenset(features)
 
     @property
     def remoteaddress(self) -> str:
@@ -61,6 +105,7 @@ class Gateway(gateway_base.BaseGateway):
         try:
             self._trace("--> sending GATEWAY_TERMINATE")
             self._send(Message.GATEWAY_TERMINATE)
+            self._writer.stop_sender()
             self._trace("--> io.close_write")
             self._io.close_write()
         except (ValueError, EOFError, OSError) as exc:
@@ -79,6 +124,19 @@ class Gateway(gateway_base.BaseGateway):
         data = gateway_base.dumps_internal(self._strconfig)
         self._send(Message.RECONFIGURE, data=data)
 
+    def setexeclimit(self, limit: int | None) -> None:
+        """Let the remote side execute at most 'limit' ``remote_exec``
+        sources at a time, or any number if None.  Further sources wait
+        until one finishes, ``remote_status()`` reports how many wait
+        and for how long.  The "main_thread_only" execution model
+        executes one at a time anyway and ignores this.
+        """
+        if limit is not None and limit < 1:
+            raise ValueError(f"limit must be positive, got {limit!r}")
+        if "admission" not in self._features:
+            raise OSError(f"{self!r} does not support execution limits")
+        self._send(Message.EXEC_LIMIT, data=gateway_base.dumps_internal(limit))
+
     def _rinfo(self, update: bool = False) -> RInfo:
         """Return some sys/env information from remote."""
         if update or not hasattr(self, "_cache_rinfo"):
@@ -91,16 +149,32 @@ class Gateway(gateway_base.BaseGateway):
 
     def hasreceiver(self) -> bool:
         """Whether gateway is able to receive data."""
+        if self._ioloop is not None:
+            return not self._ioloop_done.is_set()
         return self._receivepool.active_count() > 0
 
-    def remote_status(self) -> RemoteStatus:
-        """Obtain information about the remote execution status."""
+    def join(self, timeout: float | None = None) -> None:
+        """Wait for receiving to terminate."""
+        if self._ioloop is None:
+            super().join(timeout)
+        else:
+            self._trace("waiting for ioloop to finish receiving")
+            self._ioloop_done.wait(timeout)
+
+    def remote_status(self, timeout: float | None = None) -> RemoteStatus:
+        """Obtain information about the remote execution status.
+
+        Raises ``channel.TimeoutError`` if the remote side does not answer
+        within 'timeout' seconds.
+        """
         channel = self.newchannel()
         self._send(Message.STATUS, channel.id)
-        statusdict = channel.receive()
-        # the other side didn't actually instantiate a channel
-        # so we just delete the internal id/channel mapping
-        self._channelfactory._local_close(channel.id)
+        try:
+            statusdict = channel.receive(timeout)
+        finally:
+            # the other side didn't actually instantiate a channel
+            # so we just delete the internal id/channel mapping
+            self._channelfactory._local_close(channel.id)
         return RemoteStatus(statusdict)
 
     def remote_exec(
@@ -123,35 +197,193 @@ class Gateway(gateway_base.BaseGateway):
         will be available in the global namespace of the remotely
         executing code.
         """
+        return self.remote_exec_ex(source, kwargs)
+
+    def remote_exec_ex(
+        self,
+        source: str | types.FunctionType | Callable[..., object] | types.ModuleType,
+        kwargs: dict[str, object] | None = None,
+        priority: int = 0,
+    ) -> Channel:
+        """Like ``remote_exec()``, taking the keyword arguments for a
+        function as 'kwargs' to make room for options of the execution.
+
+        Once the remote side executes as many sources as its limit
+        allows, see ``setexeclimit()``, further ones wait, those with
+        a higher 'priority' first.
+        """
+        if kwargs is None:
+            kwargs = {}
+        if priority and "admission" not in self._features:
+            raise OSError(f"{self!r} does not support priorities")
         call_name = None
         file_name = None
-        if isinstance(source, types.ModuleType):
-            file_name = inspect.getsourcefile(source)
-            linecache.updatecache(file_name)  # type: ignore[arg-type]
-            source = inspect.getsource(source)
-        elif isinstance(source, types.FunctionType):
-            call_name = source.__name__
-            file_name = inspect.getsourcefile(source)
-            source = _source_of_function(source)
+        if isinstance(source, (types.ModuleType, types.FunctionType)):
+            if isinstance(source, types.FunctionType):
+                call_name = source.__name__
+            source, file_name, digest = _source_for_exec(source)
         else:
-            source = textwrap.dedent(str(source))
+            source, digest = _dedented_source(str(source))
 
         if not call_name and kwargs:
             raise TypeError("can't pass kwargs to non-function remote_exec")
 
         channel = self.newchannel()
-        self._send(
-            Message.CHANNEL_EXEC,
-            channel.id,
-            gateway_base.dumps_internal((source, file_name, call_name, kwargs)),
-        )
+        if "codecache" not in self._features:
+            self._send(
+                Message.CHANNEL_EXEC,
+                channel.id,
+                gateway_base.dumps_internal((source, file_name, call_name, kwargs)),
+            )
+            return channel
+        # the worker keeps the code of the digests we remember, sending
+        # under the lock keeps the order of our decisions on the wire
+        with self._codelock:
+            forget = []
+            if digest in self._sentcode:
+                self._sentcode.move_to_end(digest)
+                sent: str | None = None
+            else:
+                sent = source
+                self._sentcode[digest] = None
+                while len(self._sentcode) > CODECACHE_SIZE:
+                    forget.append(self._sentcode.popitem(last=False)[0])
+            task: tuple[object, ...] = (
+                sent,
+                file_name,
+                call_name,
+                kwargs,
+                digest,
+                forget,
+            )
+            if priority:
+                task += (priority,)
+            self._send(
+                Message.CHANNEL_EXEC, channel.id, gateway_base.dumps_internal(task)
+            )
         return channel
 
+    def register(
+        self,
+        function: types.FunctionType | Callable[..., object],
+        name: str | None = None,
+    ) -> None:
+        """Define a pure function remotely, to be invoked with ``call()``.
+
+        The function is registered under 'name', its own name by default,
+        replacing an earlier registration.  Like functions passed to
+        ``remote_exec`` it must not use closures or non-builtin globals,
+        but it does not take a channel argument.
+
+        Registered functions run one at a time in the receiver thread of
+        the remote side, so they should return quickly and must not wait
+        for channel data; use ``remote_exec`` for longer running work.
+        """
+        file_name = inspect.getsourcefile(function)
+        source = _source_of_function(function, needs_channel=False)
+        self._getrpc().register(
+            name or function.__name__, source, file_name, function.__name__
+        )
+
+    def call(self, name: str, *args: object, **kwargs: object) -> Any:
+        """Call the function registered as 'name' remotely and return its result.
+
+        Arguments and result must be serializable like channel items.  A
+        remote exception is raised as ``RemoteError``.  Calls from several
+        threads are pipelined over one channel, without any per-call
+        channel or thread.
+        """
+        return self.call_nowait(name, *args, **kwargs).get()
+
+    def call_nowait(
+        self, name: str, *args: object, **kwargs: object
+    ) -> gateway_base.Reply:
+        """Like ``call()`` but return right away, with a Reply whose
+        ``get(timeout)`` method waits for the result."""
+        return self._getrpc().call(name, args, kwargs)
+
+    def _getrpc(self) -> _RPCClient:
+        rpc = self._rpc
+        if rpc is None:
+            with self._rpclock:
+                if self._rpc is None:
+                    self._rpc = _RPCClient(self)
+                rpc = self._rpc
+        return rpc
+
     def remote_init_threads(self, num: int | None = None) -> None:
         """DEPRECATED.  Is currently a NO-OPERATION already."""
         print("WARNING: remote_init_threads() is a no-operation in execnet-1.2")
 
 
+class _RPCClient:
+    """Master side of the channel served by ``rpc_remote.serve_rpc()``."""
+
+    def __init__(self, gateway: Gateway) -> None:
+        self.gateway = gateway
+        # numbers of the names being registered, and of the registered ones
+        self._lock = gateway.execmodel.Lock()
+        self._allocated: dict[str, int] = {}
+        self._numbers: dict[str, int] = {}
+        self._pending: dict[int, gateway_base.Reply] = {}
+        self._ids = itertools.count()
+        self._error: BaseException | None = None
+        channel = gateway.remote_exec(rpc_remote)
+        self.channel: Channel = channel.receive()
+        channel.waitclose()
+        self.channel.setcallback(self._received, endmarker=None)
+
+    def register(self, name: str, *definition: object) -> None:
+        with self._lock:
+            number = self._allocated.setdefault(name, len(self._allocated))
+        self._request(number, *definition).get()
+        self._numbers[name] = number
+
+    def call(
+        self, name: str, args: tuple[object, ...], kwargs: dict[str, object]
+    ) -> gateway_base.Reply:
+        try:
+            number = self._numbers[name]
+        except KeyError:
+            raise LookupError(f"no function registered as {name!r}") from None
+        return self._request(number, args, kwargs or None)
+
+    def _request(self, *request: object) -> gateway_base.Reply:
+        callid = next(self._ids)
+        reply = gateway_base.Reply(request[:1], self.gateway.execmodel)
+        self._pending[callid] = reply
+        try:
+            data = gateway_base.dumps_internal((callid, *request))
+            if self._error is None and len(data) <= Channel._FRAMESIZE:
+                # nothing limits the window of this channel, skip send()
+                self.gateway._send(Message.CHANNEL_DATA, self.channel.id, data)
+            else:
+                self.channel.send((callid, *request))
+        except BaseException:
+            del self._pending[callid]
+            raise
+        if self._error is not None and callid in self._pending:
+            # the channel closed before our request went out
+            del self._pending[callid]
+            reply._finish(exc=self._error)
+        return reply
+
+    def _received(self, item: tuple[int, bool, Any] | None) -> None:
+        if item is None:
+            self._error = self.channel._getremoteerror() or EOFError(
+                "rpc channel closed"
+            )
+            while self._pending:
+                self._pending.popitem()[1]._finish(exc=self._error)
+            return
+        callid, ok, result = item
+        reply = self._pending.pop(callid)
+        if ok:
+            reply._finish(result)
+        else:
+            reply._finish(exc=gateway_base.RemoteError(result))
+
+
 class RInfo:
     def __init__(self, kwargs) -> None:
         self.__dict__.update(kwargs)
@@ -183,6 +415,54 @@ def rinfo_source(channel) -> None:
     )
 
 
+# number of remote_exec sources a worker keeps compiled
+CODECACHE_SIZE = 256
+
+_source_cache: weakref.WeakKeyDictionary[
+    types.FunctionType | types.ModuleType,
+    tuple[tuple[int, int] | None, tuple[str, str | None, bytes]],
+] = weakref.WeakKeyDictionary()
+
+
+def _code_digest(source: str, file_name: str | None) -> bytes:
+    # the file name is part of the compiled code
+    data = f"{file_name}\0{source}".encode("utf-8", "surrogatepass")
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+@functools.lru_cache(maxsize=CODECACHE_SIZE)
+def _dedented_source(source: str) -> tuple[str, bytes]:
+    source = textwrap.dedent(source)
+    return source, _code_digest(source, None)
+
+
+def _source_for_exec(
+    obj: types.FunctionType | types.ModuleType,
+) -> tuple[str, str | None, bytes]:
+    """Return source, file name and digest of a function or module,
+    extracting and checking them again only if a module file changed."""
+    stamp = None
+    if isinstance(obj, types.ModuleType):
+        try:
+            st = os.stat(obj.__file__)  # type: ignore[arg-type]
+        except (OSError, TypeError):
+            pass
+        else:
+            stamp = (st.st_mtime_ns, st.st_size)
+    cached = _source_cache.get(obj)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    file_name = inspect.getsourcefile(obj)
+    if isinstance(obj, types.ModuleType):
+        linecache.updatecache(file_name)  # type: ignore[arg-type]
+        source = inspect.getsource(obj)
+    else:
+        source = _source_of_function(obj)
+    result = source, file_name, _code_digest(source, file_name)
+    _source_cache[obj] = stamp, result
+    return result
+
+
 def _find_non_builtin_globals(source: str, codeobj: types.CodeType) -> list[str]:
     import ast
     import builtins
@@ -197,7 +477,9 @@ def _find_non_builtin_globals(source: str, codeobj: types.CodeType) -> list[str]
     ]
 
 
-def _source_of_function(function: types.FunctionType | Callable[..., object]) -> str:
+def _source_of_function(
+    function: types.FunctionType | Callable[..., object], needs_channel: bool = True
+) -> str:
     if function.__name__ == "<lambda>":
         raise ValueError("can't evaluate lambda functions'")
     # XXX: we dont check before remote instantiation
@@ -208,7 +490,7 @@ def _source_of_function(function: types.FunctionType | Callable[..., object]) ->
         args = inspect.getargspec(function)[0]
     else:
         args = sig.args
-    if not args or args[0] != "channel":
+    if needs_channel and (not args or args[0] != "channel"):
         raise ValueError("expected first function argument to be `channel`")
 
     closure = function.__closure__
@@ -12,16 +12,22 @@
 from __future__ import annotations
 
 import abc
+import heapq
+import itertools
 import os
 import struct
 import sys
+import time
 import traceback
+import types
 import weakref
 from _thread import interrupt_main
 from collections.abc import Callable
 from collections.abc import Iterator
 from contextlib import suppress
+from io import BufferedReader
 from io import BytesIO
+from io import RawIOBase
 from typing import Any
 from typing import Literal
 from typing import Protocol
@@ -157,6 +163,8 @@ class ThreadExecModel(ExecModel):
     def fdopen(self, fd, mode, bufsize=1, closefd=True):
         import os
 
+        if "b" in mode:
+            return os.fdopen(fd, mode, bufsize, closefd=closefd)
         return os.fdopen(fd, mode, bufsize, encoding="utf-8", closefd=closefd)
 
     def Lock(self):
@@ -336,6 +344,15 @@ class Reply:
         if not self._result_ready.wait(timeout):
             raise OSError(f"timeout waiting for {self.task!r}")
 
+    def _finish(self, result: object = None, exc: BaseException | None = None) -> None:
+        """Provide the outcome of a task which is not run by run()."""
+        if exc is None:
+            self._result = result
+        else:
+            self._exc = exc
+        self._result_ready.set()
+        self.running = False
+
     def run(self) -> None:
         func, args, kwargs = self.task
         try:
@@ -358,17 +375,49 @@ class WorkerPool:
     calling integrate_as_primary_thread() which will return
     when the pool received a trigger_shutdown().
 
-    By default allows unlimited number of spawns.
+    By default allows unlimited number of spawns, each in a new thread.
+    With 'idle_timeout' a thread which finished a function waits that
+    many seconds for the next one before it goes away.  With 'size' at
+    most that many threads run functions, besides the primary thread,
+    and further spawns are queued; once 'backlog' functions are queued
+    spawn() blocks until a thread is free.  Without a 'backlog' the
+    queue is unbounded; a 'backlog' needs a 'size'.
     """
 
     _primary_thread_task: Reply | None
 
-    def __init__(self, execmodel: ExecModel, hasprimary: bool = False) -> None:
+    def __init__(
+        self,
+        execmodel: ExecModel,
+        hasprimary: bool = False,
+        size: int | None = None,
+        idle_timeout: float = 0.0,
+        backlog: int | None = None,
+    ) -> None:
+        if size is not None and size < 1:
+            raise ValueError(f"size must be positive, got {size!r}")
+        if backlog is not None and backlog < 0:
+            raise ValueError(f"backlog must not be negative, got {backlog!r}")
+        if backlog is not None and size is None:
+            raise ValueError("backlog can only be given with a size")
         self.execmodel = execmodel
+        self.size = size
+        self.idle_timeout = idle_timeout
         self._running_lock = self.execmodel.Lock()
         self._running: set[Reply] = set()
         self._shuttingdown = False
         self._waitall_events: list[Event] = []
+        # replies for the threads to take, None tells a thread to go away
+        self._queue = self.execmodel.queue.Queue()
+        # number of threads, of those waiting for a reply, and of replies
+        # queued for them (or about to be)
+        self._threads = 0
+        self._idle = 0
+        self._queued = 0
+        # a token per spawned reply which is not done, if spawn() blocks
+        self._slots = None
+        if size is not None and backlog is not None:
+            self._slots = self.execmodel.queue.Queue(maxsize=size + backlog)
         if hasprimary:
             if self.execmodel.backend not in ("thread", "main_thread_only"):
                 raise ValueError("hasprimary=True requires thread model")
@@ -405,6 +454,9 @@ class WorkerPool:
             if self._primary_thread_task_ready is not None:
                 self._primary_thread_task = None
                 self._primary_thread_task_ready.set()
+            # wake up the idle threads, busy ones go after their reply
+            for _ in range(self._threads):
+                self._queue.put(None)
 
     def active_count(self) -> int:
         return len(self._running)
@@ -413,11 +465,36 @@ class WorkerPool:
         reply.run()
         with self._running_lock:
             self._running.remove(reply)
+            if self._slots is not None:
+                self._slots.get_nowait()
             if not self._running:
                 while self._waitall_events:
                     waitall_event = self._waitall_events.pop()
                     waitall_event.set()
 
+    def _work(self, reply: Reply | None) -> None:
+        while reply is not None:
+            self._perform_spawn(reply)
+            with self._running_lock:
+                self._idle += 1
+            try:
+                if self.idle_timeout > 0:
+                    reply = self._queue.get(timeout=self.idle_timeout)
+                else:
+                    reply = self._queue.get_nowait()
+                timedout = False
+            except self.execmodel.queue.Empty:
+                reply, timedout = None, True
+            with self._running_lock:
+                self._idle -= 1
+                if timedout and self._queued:
+                    # spawn() queued it after the wait timed out
+                    reply = self._queue.get_nowait()
+                if reply is not None:
+                    self._queued -= 1
+                else:
+                    self._threads -= 1
+
     def _try_send_to_primary_thread(self, reply: Reply) -> bool:
         # REF1 in 'thread' model we give priority to running in main thread
         # note that we should be called with _running_lock hold
@@ -446,12 +523,25 @@ class WorkerPool:
     def spawn(self, func, *args, **kwargs) -> Reply:
         """Asynchronously dispatch func(*args, **kwargs) and return a Reply."""
         reply = Reply((func, args, kwargs), self.execmodel)
+        if self._slots is not None:
+            # blocks while the threads are busy and the backlog is full
+            self._slots.put(None)
         with self._running_lock:
             if self._shuttingdown:
+                if self._slots is not None:
+                    self._slots.get_nowait()
                 raise ValueError("pool is shutting down")
             self._running.add(reply)
-            if not self._try_send_to_primary_thread(reply):
-                self.execmodel.start(self._perform_spawn, (reply,))
+            if self._try_send_to_primary_thread(reply):
+                pass
+            elif self._idle <= self._queued and (
+                self.size is None or self._threads < self.size
+            ):
+                self._threads += 1
+                self.execmodel.start(self._work, (reply,))
+            else:
+                self._queued += 1
+                self._queue.put(reply)
         return reply
 
     def terminate(self, timeout: float | None = None) -> bool:
@@ -510,6 +600,132 @@ else:
     notrace = trace = lambda *msg: None
 
 
+class ReadBuffer:
+    """Exact-size reads on top of a ``readinto`` callable.
+
+    Headers and small payloads are served from a preallocated buffer
+    which is refilled with as few calls as possible.  Larger payloads
+    are received directly into the bytes object which gets returned.
+    """
+
+    def __init__(self, readinto: Callable[[memoryview], int | None], size: int = 65536):
+        self._readinto = readinto
+        self._buf = bytearray(size)
+        self._view = memoryview(self._buf)
+        # unread bytes live in _buf[_start:_end]
+        self._start = self._end = 0
+        self._payload = _PayloadRawIO(self)
+        self._payloadfile = BufferedReader(self._payload)
+
+    def _fill(self, numbytes: int) -> None:
+        if self._start:
+            pending = self._end - self._start
+            self._buf[:pending] = self._view[self._start : self._end]
+            self._start, self._end = 0, pending
+        while self._end < numbytes:
+            n = self._readinto(self._view[self._end :])
+            if not n:
+                raise EOFError("expected %d bytes, got %d" % (numbytes, self._end))
+            self._end += n
+
+    def readview(self, numbytes: int) -> memoryview:
+        """Return a view on the next 'numbytes' bytes.
+
+        The view is only valid until the next read.
+        """
+        assert numbytes <= len(self._buf)
+        if self._end - self._start < numbytes:
+            self._fill(numbytes)
+        start = self._start
+        self._start += numbytes
+        return self._view[start : self._start]
+
+    def read(self, numbytes: int) -> bytes:
+        """Read exactly 'numbytes' bytes."""
+        if numbytes <= len(self._buf):
+            return bytes(self.readview(numbytes))
+        # BufferedReader.read() allocates the result and has our raw
+        # file fill it in place, avoiding any further copies
+        self._payload.remaining = numbytes
+        data = self._payloadfile.read(numbytes)
+        if len(data) < numbytes:
+            raise EOFError("expected %d bytes, got %d" % (numbytes, len(data)))
+        return data
+
+    def pending(self) -> bytes:
+        """Return and forget the bytes which were read ahead."""
+        data = bytes(self._view[self._start : self._end])
+        self._start = self._end = 0
+        return data
+
+
+class _PayloadRawIO(RawIOBase):
+    """Raw file yielding the next 'remaining' bytes of a ReadBuffer.
+
+    Never reading past them keeps the wrapping BufferedReader empty.
+    """
+
+    def __init__(self, reader: ReadBuffer) -> None:
+        self._reader = reader
+        self.remaining = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int | None:
+        view = memoryview(buffer)[: self.remaining]
+        reader = self._reader
+        if reader._start < reader._end:
+            n = min(reader._end - reader._start, len(view))
+            view[:n] = reader._view[reader._start : reader._start + n]
+            reader._start += n
+        else:
+            n = reader._readinto(view)  # type: ignore[assignment]
+            if not n:
+                return n
+        self.remaining -= n
+        return n
+
+
+try:
+    IOV_MAX = os.sysconf("SC_IOV_MAX")
+except (AttributeError, ValueError, OSError):
+    IOV_MAX = 16
+
+
+def write_all(writev: Callable[[list[Any]], int], buffers: list[bytes]) -> None:
+    """Write out all buffers through a vectored 'writev' call.
+
+    'writev' is ``os.writev`` or ``socket.sendmsg`` like: it returns the
+    number of bytes written, partial writes are continued.
+    """
+    buffers = list(buffers)
+    pos = 0
+    while pos < len(buffers):
+        n = writev(buffers[pos : pos + IOV_MAX])
+        while pos < len(buffers) and n >= len(buffers[pos]):
+            n -= len(buffers[pos])
+            pos += 1
+        if n:
+            buffers[pos] = memoryview(buffers[pos])[n:]  # type: ignore[call-overload]
+
+
+def _get_readinto(infile) -> Callable[[memoryview], int | None]:
+    # readinto1 performs at most one read on buffered files and thus
+    # does not block once some bytes are available
+    readinto = getattr(infile, "readinto1", None) or getattr(infile, "readinto", None)
+    if readinto is not None:
+        return readinto  # type: ignore[no-any-return]
+    read = infile.read
+
+    def readinto_from_read(view: memoryview) -> int:
+        data = read(len(view))
+        view[: len(data)] = data
+        return len(data)
+
+    return readinto_from_read
+
+
 class Popen2IO:
     error = (IOError, OSError, EOFError)
 
@@ -524,20 +740,27 @@ class Popen2IO:
                 msvcrt.setmode(outfile.fileno(), os.O_BINARY)
             except (AttributeError, OSError):
                 pass
-        self._read = getattr(infile, "buffer", infile).read
+        # ReadBuffer does the buffering, so read from the raw file if possible
+        infile = getattr(infile, "buffer", infile)
+        self._reader = ReadBuffer(_get_readinto(getattr(infile, "raw", infile)))
         self._write = getattr(outfile, "buffer", outfile).write
         self.execmodel = execmodel
+        # green execmodels need their file objects for cooperative writing
+        self._outfd = None
+        if hasattr(os, "writev") and execmodel.backend in (
+            "thread",
+            "main_thread_only",
+        ):
+            with suppress(AttributeError, OSError, ValueError):
+                self._outfd = outfile.fileno()
 
     def read(self, numbytes: int) -> bytes:
         """Read exactly 'numbytes' bytes from the pipe."""
-        # a file in non-blocking mode may return less bytes, so we loop
-        buf = b""
-        while numbytes > len(buf):
-            data = self._read(numbytes - len(buf))
-            if not data:
-                raise EOFError("expected %d bytes, got %d" % (numbytes, len(buf)))
-            buf += data
-        return buf
+        return self._reader.read(numbytes)
+
+    def readview(self, numbytes: int) -> memoryview:
+        """Return a view on the next 'numbytes' bytes, see ReadBuffer.readview."""
+        return self._reader.readview(numbytes)
 
     def write(self, data: bytes) -> None:
         """Write out all data bytes."""
@@ -545,6 +768,17 @@ class Popen2IO:
         self._write(data)
         self.outfile.flush()
 
+    def writev(self, buffers: list[bytes]) -> None:
+        """Write out all buffers, without joining them if possible."""
+        if self._outfd is None:
+            self.write(b"".join(buffers))
+            return
+        if self.outfile.closed:
+            raise ValueError("I/O operation on closed file")
+        # write() always flushes, so the file buffer is empty here
+        fd = self._outfd
+        write_all(lambda buffers: os.writev(fd, buffers), buffers)
+
     def close_read(self) -> None:
         self.infile.close()
 
@@ -552,11 +786,61 @@ class Popen2IO:
         self.outfile.close()
 
 
+#: compression of frame payloads, name -> codec id; the codec id
+#: of a compressed frame is kept in the upper bits of its message code,
+#: which leaves room for message codes below 32 and codec ids up to 3
+COMPRESSION = {"zlib": 1, "lzma": 2}
+_CODEC_SHIFT = 5
+#: payloads smaller than this are always sent uncompressed
+COMPRESS_MINSIZE = 1024
+
+#: protocol extensions beyond the basic message set, both sides
+#: of a gateway agree on the ones they use at bootstrap
+FEATURES = frozenset({"admission", "cancel", "codecache", "credit", "frames"})
+
+
+def local_features() -> frozenset[str]:
+    """Return the protocol extensions this interpreter supports."""
+    features = set(FEATURES)
+    for name in COMPRESSION:
+        try:
+            __import__(name)
+        except ImportError:
+            continue
+        features.add(name)
+    return frozenset(features)
+
+
+def _get_compress(codec: int) -> Callable[[bytes], bytes]:
+    # favour speed, compression has to keep up with the network
+    if codec == COMPRESSION["zlib"]:
+        import zlib
+
+        return lambda data: zlib.compress(data, 1)
+    import lzma
+
+    return lambda data: lzma.compress(data, preset=0)
+
+
+def _decompress(codec: int, data: bytes) -> bytes:
+    if codec == COMPRESSION["zlib"]:
+        import zlib
+
+        return zlib.decompress(data)
+    if codec == COMPRESSION["lzma"]:
+        import lzma
+
+        return lzma.decompress(data)
+    raise ValueError(f"unknown compression codec {codec} - wire protocol corruption?")
+
+
 class Message:
     """Encapsulates Messages and their wire protocol."""
 
     # message code -> name, handler
     _types: dict[int, tuple[str, Callable[[Message, BaseGateway], None]]] = {}
+    # compression codec of data, see COMPRESSION
+    codec = 0
 
     def __init__(self, msgcode: int, channelid: int = 0, data: bytes = b"") -> None:
         self.msgcode = msgcode
@@ -565,18 +849,38 @@ class Message:
 
     @staticmethod
     def from_io(io: ReadIO) -> Message:
+        # avoid a copy of the header if the IO can hand out views
+        read: Callable[[int], bytes | memoryview] = getattr(io, "readview", io.read)
         try:
-            header = io.read(9)  # type 1, channel 4, payload 4
+            header = read(9)  # type 1, channel 4, payload 4
             if not header:
                 raise EOFError("empty read")
         except EOFError as e:
             raise EOFError("couldn't load message header, " + e.args[0]) from None
         msgtype, channel, payload = struct.unpack("!bii", header)
-        return Message(msgtype, channel, io.read(payload))
+        return Message.from_frame(msgtype, channel, io.read(payload))
+
+    @staticmethod
+    def from_frame(msgcode: int, channelid: int, data: bytes) -> Message:
+        """Return the Message of a received frame, decompressing its data."""
+        codec = msgcode >> _CODEC_SHIFT
+        if codec:
+            msgcode &= (1 << _CODEC_SHIFT) - 1
+            data = _decompress(codec, data)
+        return Message(msgcode, channelid, data)
 
     def to_io(self, io: WriteIO) -> None:
-        header = struct.pack("!bii", self.msgcode, self.channelid, len(self.data))
-        io.write(header + self.data)
+        writev = getattr(io, "writev", None)
+        if writev is not None:
+            writev(self.buffers())
+        else:
+            io.write(b"".join(self.buffers()))
+
+    def buffers(self) -> list[bytes]:
+        """Return the header and payload of this message's frame."""
+        msgcode = self.msgcode | self.codec << _CODEC_SHIFT
+        header = struct.pack("!bii", msgcode, self.channelid, len(self.data))
+        return [header, self.data]
 
     def received(self, gateway: BaseGateway) -> None:
         handler = self._types[self.msgcode][1]
@@ -591,10 +895,12 @@ class Message:
         # but don't instantiate a channel object
         d = {
             "numchannels": len(gateway._channelfactory._channels),
-            # TODO(typing): Attribute `_execpool` is only on WorkerGateway.
-            "numexecuting": gateway._execpool.active_count(),  # type: ignore[attr-defined]
             "execmodel": gateway.execmodel.backend,
+            "rss": _rss(),
+            "maxrss": _maxrss(),
         }
+        # TODO(typing): Method `_execstatus` is only on WorkerGateway.
+        d.update(gateway._execstatus())  # type: ignore[attr-defined]
         gateway._send(Message.CHANNEL_DATA, message.channelid, dumps_internal(d))
         gateway._send(Message.CHANNEL_CLOSE, message.channelid)
 
@@ -653,6 +959,49 @@ class Message:
     CHANNEL_LAST_MESSAGE = 7
     _types[CHANNEL_LAST_MESSAGE] = ("CHANNEL_LAST_MESSAGE", _channel_last_message)
 
+    def _channel_credit(message: Message, gateway: BaseGateway) -> None:
+        limit = loads_internal(message.data)
+        assert limit is None or isinstance(limit, int)
+        gateway._channelfactory._local_credit(message.channelid, limit)
+
+    CHANNEL_CREDIT = 8
+    _types[CHANNEL_CREDIT] = ("CHANNEL_CREDIT", _channel_credit)
+
+    def _channel_data_part(message: Message, gateway: BaseGateway) -> None:
+        gateway._channelfactory._local_receive_part(message.channelid, message.data)
+
+    CHANNEL_DATA_PART = 9
+    _types[CHANNEL_DATA_PART] = ("CHANNEL_DATA_PART", _channel_data_part)
+
+    def _channel_fd(message: Message, gateway: BaseGateway) -> None:
+        # the descriptor arrived along with this message or before it
+        fd = gateway._io.receivedfds.pop(0)  # type: ignore[attr-defined]
+        gateway._channelfactory._local_receive_fd(message.channelid, fd)
+
+    CHANNEL_FD = 10
+    _types[CHANNEL_FD] = ("CHANNEL_FD", _channel_fd)
+
+    def _channel_cancel(message: Message, gateway: BaseGateway) -> None:
+        delay = loads_internal(message.data)
+        assert delay is None or isinstance(delay, (int, float))
+        gateway._local_cancel(message.channelid, delay)
+
+    CHANNEL_CANCEL = 11
+    _types[CHANNEL_CANCEL] = ("CHANNEL_CANCEL", _channel_cancel)
+
+    def _exec_limit(message: Message, gateway: BaseGateway) -> None:
+        limit = loads_internal(message.data)
+        assert limit is None or isinstance(limit, int)
+        gateway._local_execlimit(limit)
+
+    EXEC_LIMIT = 12
+    _types[EXEC_LIMIT] = ("EXEC_LIMIT", _exec_limit)
+
+
+# message codes and codec ids share the signed type byte of the header
+assert max(Message._types) < 1 << _CODEC_SHIFT, "out of message codes"
+assert max(COMPRESSION.values()) < 1 << (7 - _CODEC_SHIFT), "out of codec ids"
+
 
 class GatewayReceivedTerminate(Exception):
     """Receiverthread got termination message."""
@@ -675,6 +1024,27 @@ def geterrortext(
     return errortext
 
 
+def _rss() -> int | None:
+    """Return the resident set size of this process in bytes, if the
+    system tells (Linux)."""
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _maxrss() -> int | None:
+    """Return the peak resident set size of this process in bytes."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes, except on macOS
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
 class RemoteError(Exception):
     """Exception containing a stringified error from the other side."""
 
@@ -698,6 +1068,31 @@ class TimeoutError(IOError):
     """Exception indicating that a timeout was reached."""
 
 
+class TaskCancelled(BaseException):
+    """Raised in remotely executing code which the other side cancelled."""
+
+
+def _get_raise_in_thread() -> (
+    Callable[[int, type[BaseException] | None], object] | None
+):
+    """Return a function which makes a thread raise an exception once it
+    executes Python code again, or forget such a pending exception if
+    passed None; or None if the interpreter lacks this."""
+    try:
+        import ctypes
+
+        set_async_exc = ctypes.pythonapi.PyThreadState_SetAsyncExc
+    except (ImportError, AttributeError):
+        return None
+
+    def raise_in_thread(ident: int, exc_type: type[BaseException] | None) -> object:
+        # None is passed as NULL, which clears a pending exception
+        exc = None if exc_type is None else ctypes.py_object(exc_type)
+        return set_async_exc(ctypes.c_ulong(ident), exc)
+
+    return raise_in_thread
+
+
 NO_ENDMARKER_WANTED = object()
 
 
@@ -706,8 +1101,20 @@ class Channel:
 
     RemoteError = RemoteError
     TimeoutError = TimeoutError
+    TaskCancelled = TaskCancelled
     _INTERNALWAKEUP = 1000
+    # items serializing to more bytes are sent in several frames, which
+    # lets messages of other channels get written in between
+    _FRAMESIZE = 1 << 18
     _executing = False
+    # set on the executing side by a cancellation from the other side
+    _cancelled = False
+    # the thread executing code for the channel while it can be cancelled
+    _taskthread: int | None = None
+    # the concurrent.futures.Future of an async function executing
+    _asyncfuture: Any = None
+    # (loop, future) pairs of tasks waiting in areceive() or awaitclose()
+    _waiters: list[tuple[Any, Any]] | None = None
 
     def __init__(self, gateway: BaseGateway, id: int) -> None:
         """:private:"""
@@ -721,6 +1128,15 @@ class Channel:
         self._closed = False
         self._receiveclosed = self.gateway.execmodel.Event()
         self._remoteerrors: list[RemoteError] = []
+        self._sendlock = self.gateway.execmodel.Lock()
+        # flow control, see setwindow()
+        self._creditlock = self.gateway.execmodel.Lock()
+        self._credit: Event | None = None
+        self._sendlimit: int | None = None
+        self._sentcount = 0
+        self._window: int | None = None
+        self._consumed = 0
+        self._granted = 0
 
     def _trace(self, *msg: object) -> None:
         self.gateway._trace(self.id, *msg)
@@ -760,6 +1176,7 @@ class Channel:
                         break
                     else:
                         callback(olditem)
+                        self._consumed_item()
 
     def __repr__(self) -> str:
         flag = (self.isclosed() and "closed") or "open"
@@ -872,8 +1289,25 @@ class Channel:
             queue = self._items
             if queue is not None:
                 queue.put(ENDMARKER)
+            if self._waiters is not None:
+                self._wakeup_waiters()
             self.gateway._channelfactory._no_longer_opened(self.id)
 
+    def cancel(self, after: float | None = None) -> None:
+        """Cancel the code the other side executes for this channel,
+        or with 'after' set, once it still runs that many seconds after
+        the other side got this request.
+
+        The code gets a ``channel.TaskCancelled`` exception raised once
+        it next executes Python code, or waits for an item of this
+        channel; code which did not start yet does not run.  The channel
+        is then closed with an error, unless the code finished before.
+        """
+        if "cancel" not in self.gateway._features:
+            raise OSError(f"{self.gateway!r} does not support cancelling")
+        if not self._receiveclosed.is_set():
+            self.gateway._send(Message.CHANNEL_CANCEL, self.id, dumps_internal(after))
+
     def waitclose(self, timeout: float | None = None) -> None:
         """Wait until this channel is closed (or the remote side
         otherwise signalled that no more data was being sent).
@@ -898,18 +1332,112 @@ class Channel:
         if error:
             raise error
 
-    def send(self, item: object) -> None:
+    def send(self, item: object, timeout: float | None = None) -> None:
         """Sends the given item to the other side of the channel,
-        possibly blocking if the sender queue is full.
+        possibly blocking if the other side limited the number of
+        items it has not yet consumed, see ``setwindow()``.
 
         The item must be a simple Python type and will be
         copied to the other side by value.
 
+        timeout: None [default] blocked waiting. A positive number
+        indicates the number of seconds after which a channel.TimeoutError
+        exception will be raised if the item could not be sent yet.
+
         OSError is raised if the write pipe was prematurely closed.
         """
         if self.isclosed():
             raise OSError(f"cannot send to {self!r}")
-        self.gateway._send(Message.CHANNEL_DATA, self.id, dumps_internal(item))
+        self.gateway._nocancel(self._waitcredit, timeout)
+        if "frames" in self.gateway._features:
+            frames = _dumps_frames(item, self._FRAMESIZE)
+        else:
+            frames = iter((dumps_internal(item),))
+        with self._sendlock:
+            # all but the last frame of an item go out as parts which
+            # the other side collects until the final CHANNEL_DATA arrives
+            data = next(frames)
+            for nextdata in frames:
+                self.gateway._send(Message.CHANNEL_DATA_PART, self.id, data)
+                data = nextdata
+            self.gateway._send(Message.CHANNEL_DATA, self.id, data)
+
+    def sendfd(self, fd: int, timeout: float | None = None) -> None:
+        """Pass a duplicate of the open file descriptor 'fd' to the other side.
+
+        The other side receives it as a new descriptor number, like an
+        item sent with ``send()``, and is responsible for closing it.
+        No data is copied, which makes this suitable for handing over
+        large files.  The caller may close 'fd' once this returns.
+
+        OSError is raised unless the gateway uses a ``unix`` socket
+        and both sides support passing descriptors.
+        """
+        if self.isclosed():
+            raise OSError(f"cannot send to {self!r}")
+        passfd = getattr(self.gateway._io, "passfd", None)
+        if passfd is None or "fds" not in self.gateway._features:
+            raise OSError(f"{self.gateway!r} cannot pass file descriptors")
+        self.gateway._nocancel(self._waitcredit, timeout)
+        passfd(fd, lambda: self.gateway._send(Message.CHANNEL_FD, self.id))
+
+    def _waitcredit(self, timeout: float | None) -> None:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while 1:
+            with self._creditlock:
+                limit = self._sendlimit
+                if (
+                    limit is None
+                    or self._sentcount < limit
+                    or self._receiveclosed.is_set()
+                ):
+                    self._sentcount += 1
+                    return
+                assert self._credit is not None
+                self._credit.clear()
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if not self._credit.wait(remaining):
+                raise self.TimeoutError("no credit after %r seconds" % timeout)
+            if self._cancelled:
+                raise TaskCancelled()
+            if self.isclosed():
+                raise OSError(f"cannot send to {self!r}")
+
+    def setwindow(self, size: int | None) -> None:
+        """Limit the number of items the other side may send ahead.
+
+        Once 'size' items sent by the other side were not consumed
+        by ``receive()`` or a callback yet, its ``send()`` blocks.
+        None removes the limit.  Items which were sent before the
+        other side learned about the window are not limited.
+        Does nothing if the other side does not support flow control.
+        """
+        if "credit" not in self.gateway._features:
+            return
+        with self._creditlock:
+            self._window = size
+            self._granted = self._consumed
+            limit = None if size is None else self._consumed + size
+        self.gateway._send(Message.CHANNEL_CREDIT, self.id, dumps_internal(limit))
+
+    def _consumed_item(self) -> None:
+        with self._creditlock:
+            self._consumed += 1
+            window = self._window
+            # grant new credit once half of the window was consumed
+            if window is None or self._consumed - self._granted < (window + 1) // 2:
+                return
+            self._granted = self._consumed
+            limit = self._consumed + window
+        with suppress(OSError, ValueError):
+            self.gateway._send(Message.CHANNEL_CREDIT, self.id, dumps_internal(limit))
+
+    def _setsendlimit(self, limit: int | None) -> None:
+        with self._creditlock:
+            if self._credit is None:
+                self._credit = self.gateway.execmodel.Event()
+            self._sendlimit = limit
+            self._credit.set()
 
     def receive(self, timeout: float | None = None) -> Any:
         """Receive a data item that was sent from the other side.
@@ -925,14 +1453,23 @@ class Channel:
         itemqueue = self._items
         if itemqueue is None:
             raise OSError("cannot receive(), channel has receiver callback")
+        return self.gateway._nocancel(self._receive, itemqueue, timeout)
+
+    def _receive(self, itemqueue, timeout: float | None) -> Any:
         try:
             x = itemqueue.get(timeout=timeout)
         except self.gateway.execmodel.queue.Empty:
             raise self.TimeoutError("no item after %r seconds" % timeout) from None
+        return self._received(itemqueue, x)
+
+    def _received(self, itemqueue, x: Any) -> Any:
         if x is ENDMARKER:
             itemqueue.put(x)  # for other receivers
+            if self._cancelled:
+                raise TaskCancelled()
             raise self._getremoteerror() or EOFError()
         else:
+            self._consumed_item()
             return x
 
     def __iter__(self) -> Iterator[Any]:
@@ -946,6 +1483,79 @@ class Channel:
 
     __next__ = next
 
+    async def areceive(self, timeout: float | None = None) -> Any:
+        """Like ``receive()``, but wait for the item in the running
+        asyncio event loop instead of blocking the thread."""
+        loop = _asyncio().get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        while 1:
+            with self.gateway._receivelock:
+                itemqueue = self._items
+                if itemqueue is None:
+                    raise OSError("cannot receive(), channel has receiver callback")
+                try:
+                    x = itemqueue.get(block=False)
+                except self.gateway.execmodel.queue.Empty:
+                    future = self._addwaiter(loop)
+                else:
+                    return self._received(itemqueue, x)
+            await self._await(future, deadline, "no item after %r seconds" % timeout)
+
+    async def awaitclose(self, timeout: float | None = None) -> None:
+        """Like ``waitclose()``, but wait in the running asyncio event loop."""
+        loop = _asyncio().get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        while 1:
+            with self.gateway._receivelock:
+                if self._receiveclosed.is_set():
+                    break
+                future = self._addwaiter(loop)
+            await self._await(future, deadline, "Timeout after %r seconds" % timeout)
+        self.waitclose(timeout=0)
+
+    def __aiter__(self) -> Channel:
+        return self
+
+    async def __anext__(self) -> Any:
+        try:
+            return await self.areceive()
+        except EOFError:
+            raise StopAsyncIteration from None
+
+    def _addwaiter(self, loop) -> Any:
+        # called with the receivelock held, see _wakeup_waiters()
+        future = loop.create_future()
+        if self._waiters is None:
+            self._waiters = []
+        self._waiters.append((loop, future))
+        return future
+
+    async def _await(self, future, deadline: float | None, timeouttext: str) -> None:
+        asyncio = _asyncio()
+        try:
+            if deadline is None:
+                await future
+            else:
+                remaining = deadline - asyncio.get_running_loop().time()
+                await asyncio.wait_for(future, max(remaining, 0))
+        except asyncio.TimeoutError:
+            raise self.TimeoutError(timeouttext) from None
+        finally:
+            if future.cancelled():
+                # timed out or the task was cancelled, forget the waiter
+                with self.gateway._receivelock:
+                    if self._waiters is not None:
+                        with suppress(ValueError):
+                            self._waiters.remove((future.get_loop(), future))
+
+    def _wakeup_waiters(self) -> None:
+        # an item was queued or the channel closed, waiters check again
+        with self.gateway._receivelock:
+            waiters, self._waiters = self._waiters, None
+        for loop, future in waiters or ():
+            with suppress(RuntimeError):  # the loop was closed
+                loop.call_soon_threadsafe(_set_waiter_result, future)
+
     def reconfigure(
         self, py2str_as_py3str: bool = True, py3str_as_py2str: bool = False
     ) -> None:
@@ -959,6 +1569,18 @@ class Channel:
         self.gateway._send(Message.RECONFIGURE, self.id, data=data)
 
 
+def _asyncio():
+    # imported on first use, most gateways never need it
+    import asyncio
+
+    return asyncio
+
+
+def _set_waiter_result(future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
 ENDMARKER = object()
 INTERRUPT_TEXT = "keyboard-interrupted"
 MAIN_THREAD_ONLY_DEADLOCK_TEXT = (
@@ -975,6 +1597,8 @@ class ChannelFactory:
         self._callbacks: dict[
             int, tuple[Callable[[Any], Any], object, tuple[bool, bool]]
         ] = {}
+        # Channel ID => frames of a partially received item
+        self._parts: dict[int, list[bytes]] = {}
         self._writelock = gateway.execmodel.Lock()
         self.gateway = gateway
         self.count = startcount
@@ -1003,6 +1627,7 @@ class ChannelFactory:
     #
     def _no_longer_opened(self, id: int) -> None:
         self._channels.pop(id, None)
+        self._parts.pop(id, None)
         item = self._callbacks.pop(id, None)
         if item is not None:
             callback, endmarker, _strconfig = item
@@ -1027,9 +1652,25 @@ class ChannelFactory:
             if not sendonly:  # otherwise #--> "sendonly"
                 channel._closed = True  # --> "closed"
             channel._receiveclosed.set()
+            if channel._credit is not None:
+                channel._credit.set()  # wake up senders waiting for credit
+            if channel._waiters is not None:
+                channel._wakeup_waiters()
+
+    def _local_credit(self, id: int, limit: int | None) -> None:
+        channel = self._channels.get(id)
+        if channel is not None:
+            channel._setsendlimit(limit)
+
+    def _local_receive_part(self, id: int, data: bytes) -> None:
+        self._parts.setdefault(id, []).append(data)
 
     def _local_receive(self, id: int, data) -> None:
         # executes in receiver thread
+        parts = self._parts.pop(id, None)
+        if parts is not None:
+            parts.append(data)
+            data = parts
         channel = self._channels.get(id)
         try:
             callback, _endmarker, strconfig = self._callbacks[id]
@@ -1040,10 +1681,15 @@ class ChannelFactory:
             else:
                 item = loads_internal(data, channel)
                 queue.put(item)
+                assert channel is not None
+                if channel._waiters is not None:
+                    channel._wakeup_waiters()
         else:
             try:
                 data = loads_internal(data, channel, strconfig)
                 callback(data)  # even if channel may be already closed
+                if channel is not None:
+                    channel._consumed_item()
             except Exception as exc:
                 self.gateway._trace("exception during callback: %s" % exc)
                 errortext = self.gateway._geterrortext(exc)
@@ -1052,6 +1698,13 @@ class ChannelFactory:
                 )
                 self._local_close(id, errortext)
 
+    def _local_receive_fd(self, id: int, fd: int) -> None:
+        # executes in receiver thread
+        if id not in self._channels and id not in self._callbacks:
+            os.close(fd)  # nobody could ever close it
+            return
+        self._local_receive(id, dumps_internal(fd))
+
     def _finished_receiving(self) -> None:
         with self._writelock:
             self.finished = True
@@ -1122,9 +1775,186 @@ class ChannelFileRead(ChannelFile):
         return line
 
 
+class _PendingWrite:
+    def __init__(self, buffers: list[bytes], event: Event | None) -> None:
+        self.buffers = buffers
+        self.event = event
+        self.done = False
+        self.error: BaseException | None = None
+
+
+class MessageWriter:
+    """Write Messages to an IO, coalescing concurrent senders.
+
+    A thread which finds another one writing queues its frame and
+    waits.  When the writing thread is done it hands over to the first
+    waiting thread which then writes all frames queued in the meantime
+    with one vectored write.
+
+    After ``start_sender()`` messages are instead queued for a sender
+    thread, see there.
+    """
+
+    #: queued bytes which make the sender thread write immediately
+    batchsize = 65536
+
+    def __init__(self, io: IO) -> None:
+        self.execmodel = io.execmodel
+        writev = getattr(io, "writev", None)
+        if writev is None:
+
+            def writev(buffers: list[bytes]) -> None:
+                io.write(b"".join(buffers))
+
+        self._writev = writev
+        self._lock = self.execmodel.Lock()
+        self._writing = False
+        self._queue: list[_PendingWrite] = []
+        self._sending = False
+
+    def send(self, message: Message) -> None:
+        if self._sending and self._send_queued(message):
+            return
+        self._write_buffers(message.buffers())
+
+    def _write_buffers(self, buffers: list[bytes]) -> None:
+        with self._lock:
+            if self._writing:
+                pending = _PendingWrite(buffers, self.execmodel.Event())
+                self._queue.append(pending)
+            else:
+                self._writing = True
+                pending = None
+        if pending is None:
+            self._write([], buffers)
+            return
+        assert pending.event is not None
+        pending.event.wait()
+        if not pending.done:
+            # we took over writing, our frame is the first queued one
+            with self._lock:
+                batch, self._queue = self._queue, []
+            self._write(batch, [])
+        elif pending.error is not None:
+            raise pending.error
+
+    def _write(self, batch: list[_PendingWrite], buffers: list[bytes]) -> None:
+        for pending in batch:
+            buffers.extend(pending.buffers)
+        try:
+            self._writev(buffers)
+        except BaseException as e:
+            self._finish(batch, e)
+            raise
+        self._finish(batch, None)
+
+    def _finish(self, batch: list[_PendingWrite], error: BaseException | None) -> None:
+        with self._lock:
+            for pending in batch:
+                pending.done = True
+                pending.error = error
+                assert pending.event is not None
+                pending.event.set()
+            if self._queue:
+                assert self._queue[0].event is not None
+                self._queue[0].event.set()
+            else:
+                self._writing = False
+
+    def start_sender(self, latency: float, maxbytes: int = 1 << 20) -> None:
+        """Write messages from a sender thread.
+
+        ``CHANNEL_DATA`` messages are queued and written together with
+        the ones following within 'latency' seconds.  Other messages
+        make the queue be written immediately and wait until they are
+        written, ``STATUS`` requests skip queued data.  Senders also
+        wait while more than 'maxbytes' bytes are queued.
+        """
+        with self._lock:
+            if self._sending:
+                return
+            self._latency = latency
+            self._maxbytes = maxbytes
+            self._sendqueue: list[_PendingWrite] = []
+            self._queuedbytes = 0
+            self._senderror: OSError | ValueError | None = None
+            self._stopping = False
+            self._wakeup = self.execmodel.Event()
+            self._flush = self.execmodel.Event()
+            self._sending = True
+        self._sender = WorkerPool(self.execmodel).spawn(self._sendloop)
+
+    def stop_sender(self) -> None:
+        """Write out all queued messages and stop the sender thread."""
+        with self._lock:
+            if not self._sending:
+                return
+            self._stopping = True
+            self._flush.set()
+            self._wakeup.set()
+        self._sender.waitfinish()
+
+    def _send_queued(self, message: Message) -> bool:
+        buffers = message.buffers()
+        with self._lock:
+            if not self._sending:
+                return False
+            if self._senderror is not None:
+                raise self._senderror
+            self._queuedbytes += len(buffers[0]) + len(buffers[1])
+            pending = _PendingWrite(buffers, None)
+            if (
+                message.msgcode != Message.CHANNEL_DATA
+                or self._queuedbytes > self._maxbytes
+            ):
+                pending.event = self.execmodel.Event()
+            if message.msgcode == Message.STATUS:
+                self._sendqueue.insert(0, pending)
+            else:
+                self._sendqueue.append(pending)
+            if pending.event is not None or self._queuedbytes >= self.batchsize:
+                self._flush.set()
+            if not self._wakeup.is_set():
+                self._wakeup.set()
+        if pending.event is not None:
+            pending.event.wait()
+            if pending.error is not None:
+                raise pending.error
+        return True
+
+    def _sendloop(self) -> None:
+        while 1:
+            self._wakeup.wait()
+            if not self._flush.is_set():
+                self._flush.wait(self._latency)
+            with self._lock:
+                if not self._stopping:
+                    self._wakeup.clear()
+                    self._flush.clear()
+                batch, self._sendqueue = self._sendqueue, []
+                self._queuedbytes = 0
+                if not batch and self._stopping:
+                    self._sending = False
+                    return
+            error = None
+            try:
+                self._write_buffers([buf for p in batch for buf in p.buffers])
+            except (OSError, ValueError) as e:
+                error = e
+            with self._lock:
+                if error is not None:
+                    self._senderror = error
+                for pending in batch:
+                    pending.error = error
+                    if pending.event is not None:
+                        pending.event.set()
+
+
 class BaseGateway:
     _sysex = sysex
     id = "<worker>"
+    # protocol extensions both sides support, see _agree_features()
+    _features: frozenset[str] = frozenset()
 
     def __init__(self, io: IO, id, _startcount: int = 2) -> None:
         self.execmodel = io.execmodel
@@ -1137,10 +1967,40 @@ class BaseGateway:
         self.__trace = trace
         self._geterrortext = geterrortext
         self._receivepool = WorkerPool(self.execmodel)
+        self._writer = MessageWriter(io)
+        # codec id and compress function, see _setcompression()
+        self._compression: tuple[int, Callable[[bytes], bytes]] | None = None
 
     def _trace(self, *msg: object) -> None:
         self.__trace(self.id, *msg)
 
+    def _local_features(self) -> frozenset[str]:
+        """Return the protocol extensions this side of the gateway supports."""
+        features = local_features()
+        if getattr(self._io, "fdpassing", False):
+            features |= {"fds"}
+        return features
+
+    def _agree_features(self, features: list[str]) -> list[str]:
+        """Use the extensions both sides support, return them to the other side."""
+        self._features = self._local_features().intersection(features)
+        return sorted(self._features)
+
+    def _setcompression(self, name: str | None) -> None:
+        """Compress the payload of sent frames with the given codec.
+
+        Received frames are decompressed whether or not compression
+        is enabled for sending.
+        """
+        if name is None:
+            self._compression = None
+            return
+        try:
+            codec = COMPRESSION[name]
+        except KeyError:
+            raise ValueError(f"unknown compression {name!r}") from None
+        self._compression = (codec, _get_compress(codec))
+
     def _initreceive(self) -> None:
         self._receivepool.spawn(self._thread_receiver)
 
@@ -1165,6 +2025,9 @@ class BaseGateway:
         except Exception as exc:
             log(self._geterrortext(exc))
         log("finishing receiving thread")
+        self._finish_receiving(log)
+
+    def _finish_receiving(self, log: Callable[..., None]) -> None:
         # wake up and terminate any execution waiting to receive
         self._channelfactory._finished_receiving()
         log("terminating execution")
@@ -1172,6 +2035,7 @@ class BaseGateway:
         log("closing read")
         self._io.close_read()
         log("closing write")
+        self._writer.stop_sender()
         self._io.close_write()
         log("terminating our receive pseudo pool")
         self._receivepool.trigger_shutdown()
@@ -1179,10 +2043,20 @@ class BaseGateway:
     def _terminate_execution(self) -> None:
         pass
 
+    def _nocancel(self, func: Callable[..., Any], *args: Any) -> Any:
+        """Call func(*args) without a cancellation raising in the middle."""
+        return func(*args)
+
     def _send(self, msgcode: int, channelid: int = 0, data: bytes = b"") -> None:
         message = Message(msgcode, channelid, data)
+        compression = self._compression
+        if compression is not None and len(data) >= COMPRESS_MINSIZE:
+            codec, compress = compression
+            compressed = compress(data)
+            if len(compressed) < len(data):
+                message.data, message.codec = compressed, codec
         try:
-            message.to_io(self._io)
+            self._writer.send(message)
             self._trace("sent", message)
         except (OSError, ValueError) as e:
             self._trace("failed to send", message, e)
@@ -1192,6 +2066,12 @@ class BaseGateway:
     def _local_schedulexec(self, channel: Channel, sourcetask: bytes) -> None:
         channel.close("execution disallowed")
 
+    def _local_cancel(self, channelid: int, delay: float | None) -> None:
+        self._trace("ignoring cancellation, nothing is executed here")
+
+    def _local_execlimit(self, limit: int | None) -> None:
+        self._trace("ignoring execution limit, nothing is executed here")
+
     # _____________________________________________________________________
     #
     # High Level Interface
@@ -1207,8 +2087,48 @@ class BaseGateway:
         self._receivepool.waitall(timeout)
 
 
+#: seconds a thread which executed code for the other side waits for
+#: the next execution before it goes away
+EXEC_IDLE_TIMEOUT = 5.0
+
+
 class WorkerGateway(BaseGateway):
+    # set once the other side gave a deadline, see _watch_deadlines()
+    _deadlinewakeup: Event | None = None
+    # executions admitted at a time, see _local_execlimit()
+    _execlimit: int | None = None
+    # executions which waited for admission, the seconds they waited
+    # altogether and the longest wait
+    _numwaited = 0
+    _queuewait = 0.0
+    _maxqueuewait = 0.0
+    # the event loop executing async functions, see _startasync()
+    _asyncloop: Any = None
+
     def _local_schedulexec(self, channel: Channel, sourcetask: bytes) -> None:
+        sourcetask_ = loads_internal(sourcetask)
+        priority = 0
+        if len(sourcetask_) == 7:
+            # with "admission" a priority other than 0 is sent along
+            *sourcetask_, priority = sourcetask_
+        if len(sourcetask_) == 6:
+            # with "codecache" the master sends the source of a digest once
+            # and tells which digests it dropped from its bookkeeping.  We
+            # are called in the order the master sent its tasks, so entries
+            # are looked up here and not in the execution thread.
+            source, file_name, call_name, kwargs, digest, forget = sourcetask_
+            for old in forget:
+                self._codecache.pop(old, None)
+            if source is None:
+                source = self._codecache.get(digest)
+                if source is None:
+                    channel.close(f"code {digest.hex()} is not cached")
+                    return
+            else:
+                self._codecache[digest] = source
+            sourcetask_ = (source, file_name, call_name, kwargs, digest)
+        else:
+            sourcetask_ = (*sourcetask_, None)
         if self._execpool.execmodel.backend == "main_thread_only":
             assert self._executetask_complete is not None
             # It's necessary to wait for a short time in order to ensure
@@ -1224,11 +2144,154 @@ class WorkerGateway(BaseGateway):
             # that there is not a previous task about to set it again.
             self._executetask_complete.clear()
 
-        sourcetask_ = loads_internal(sourcetask)
-        self._execpool.spawn(self.executetask, (channel, sourcetask_))
+        with self._admitlock:
+            if self._execlimit is not None and self._admitted >= self._execlimit:
+                entry = (-priority, next(self._execorder), time.monotonic())
+                heapq.heappush(self._execqueue, (*entry, channel, sourcetask_))
+                return
+            self._admitted += 1
+        self._execpool.spawn(self._executeadmitted, (channel, sourcetask_))
+
+    def _local_execlimit(self, limit: int | None) -> None:
+        if self.execmodel.backend == "main_thread_only":
+            self._trace("ignoring execution limit, executing one at a time")
+            return
+        self._trace(f"limiting executions to {limit}")
+        with self._admitlock:
+            self._execlimit = limit
+        self._admitqueued()
+
+    def _executeadmitted(self, item) -> None:
+        try:
+            self.executetask(item)
+        finally:
+            with self._admitlock:
+                self._admitted -= 1
+            self._admitqueued()
+
+    def _admitqueued(self) -> None:
+        while 1:
+            with self._admitlock:
+                if not self._execqueue or (
+                    self._execlimit is not None and self._admitted >= self._execlimit
+                ):
+                    return
+                _, _, queued, channel, sourcetask = heapq.heappop(self._execqueue)
+                wait = time.monotonic() - queued
+                self._numwaited += 1
+                self._queuewait += wait
+                self._maxqueuewait = max(self._maxqueuewait, wait)
+                self._admitted += 1
+            self._execpool.spawn(self._executeadmitted, (channel, sourcetask))
+
+    def _execstatus(self) -> dict[str, Any]:
+        with self._admitlock:
+            return {
+                "numexecuting": self._numexecuting,
+                "numqueued": len(self._execqueue),
+                "execlimit": self._execlimit,
+                "numwaited": self._numwaited,
+                "queuewait": self._queuewait,
+                "maxqueuewait": self._maxqueuewait,
+            }
+
+    def _local_cancel(self, channelid: int, delay: float | None) -> None:
+        channel = self._channelfactory._channels.get(channelid)
+        if channel is None:
+            return
+        if not delay or delay <= 0:
+            self._cancel(channel)
+            return
+        with self._cancellock:
+            # the channel is kept, the other side may drop its end meanwhile
+            heapq.heappush(
+                self._deadlines, (time.monotonic() + delay, channelid, channel)
+            )
+            if self._deadlinewakeup is None:
+                self._deadlinewakeup = self.execmodel.Event()
+                self.execmodel.start(self._watch_deadlines)
+        self._deadlinewakeup.set()
+
+    def _cancel(self, channel: Channel) -> None:
+        # the other side may have closed its end of a running task
+        if channel._cancelled:
+            return
+        self._trace(f"cancelling execution[{channel.id}]")
+        with self._cancellock:
+            channel._cancelled = True
+            taskthread = channel._taskthread
+            if taskthread in self._internal:
+                # raised once execnet code returns, see _nocancel()
+                self._deferred.add(taskthread)
+            elif taskthread is not None:
+                assert self._raise_in_thread is not None
+                self._raise_in_thread(taskthread, TaskCancelled)
+                self._injected.add(taskthread)
+            elif channel._asyncfuture is not None:
+                channel._asyncfuture.cancel()
+        # wake up the code if it waits for an item or for credit
+        if channel._items is not None:
+            channel._items.put(ENDMARKER)
+        if channel._credit is not None:
+            channel._credit.set()
+        if channel._waiters is not None:
+            channel._wakeup_waiters()
+
+    def _nocancel(self, func: Callable[..., Any], *args: Any) -> Any:
+        if self._raise_in_thread is None:
+            return func(*args)
+        # a cancellation raising in the middle of writing a message would
+        # garble the stream, and one raising in queue or lock code could
+        # leave that broken, so it waits until func returns
+        ident = self.execmodel.get_ident()
+        with self._cancellock:
+            if ident in self._injected:
+                # raised before this thread got here, or not yet; in the
+                # latter case it no longer can once this is cleared
+                self._raise_in_thread(ident, None)
+                self._injected.discard(ident)
+                self._deferred.add(ident)
+            # from here on no cancellation gets raised in this thread
+            # until the count is down again
+            self._internal[ident] = self._internal.get(ident, 0) + 1
+        try:
+            return func(*args)
+        finally:
+            with self._cancellock:
+                self._internal[ident] -= 1
+                deferred = False
+                if not self._internal[ident]:
+                    del self._internal[ident]
+                    deferred = ident in self._deferred
+                    self._deferred.discard(ident)
+            # unless the code is handling the cancellation already
+            if deferred and not isinstance(sys.exc_info()[1], TaskCancelled):
+                raise TaskCancelled()
+
+    def _send(self, msgcode: int, channelid: int = 0, data: bytes = b"") -> None:
+        self._nocancel(super()._send, msgcode, channelid, data)
+
+    def _watch_deadlines(self) -> None:
+        wakeup = self._deadlinewakeup
+        assert wakeup is not None
+        while not self._channelfactory.finished:
+            due = []
+            with self._cancellock:
+                now = time.monotonic()
+                while self._deadlines and self._deadlines[0][0] <= now:
+                    due.append(heapq.heappop(self._deadlines)[2])
+                timeout = self._deadlines[0][0] - now if self._deadlines else None
+                wakeup.clear()
+            for channel in due:
+                self._cancel(channel)
+            wakeup.wait(timeout)
 
     def _terminate_execution(self) -> None:
         # called from receiverthread
+        if self._deadlinewakeup is not None:
+            self._deadlinewakeup.set()
+        if self._asyncloop is not None:
+            self._asyncloop.call_soon_threadsafe(self._asyncloop.stop)
         self._trace("shutting down execution pool")
         self._execpool.trigger_shutdown()
         if not self._execpool.waitall(5.0):
@@ -1252,7 +2315,30 @@ class WorkerGateway(BaseGateway):
             self._trace("[serve] " + msg)
 
         hasprimary = self.execmodel.backend in ("thread", "main_thread_only")
-        self._execpool = WorkerPool(self.execmodel, hasprimary=hasprimary)
+        self._execpool = WorkerPool(
+            self.execmodel, hasprimary=hasprimary, idle_timeout=EXEC_IDLE_TIMEOUT
+        )
+        # source or compiled code by digest, see _local_schedulexec()
+        self._codecache: dict[bytes, str | types.CodeType] = {}
+        # threads can only be interrupted with the thread models
+        self._raise_in_thread = _get_raise_in_thread() if hasprimary else None
+        self._cancellock = self.execmodel.Lock()
+        self._numexecuting = 0
+        self._asyncfutures: set[Any] = set()
+        # nesting depth of the _nocancel() calls each thread is in, the
+        # threads to raise TaskCancelled in once they are out of them, and
+        # those it was raised in which may not have executed code since
+        self._internal: dict[int, int] = {}
+        self._deferred: set[int] = set()
+        self._injected: set[int] = set()
+        # (time, channel id, channel) of the deadlines set by the other side
+        self._deadlines: list[tuple[float, int, Channel]] = []
+        # admission control: executions beyond the limit wait in a heap
+        # of (-priority, arrival, time queued, channel, task)
+        self._admitlock = self.execmodel.Lock()
+        self._admitted = 0
+        self._execqueue: list[tuple[int, int, float, Channel, Any]] = []
+        self._execorder = itertools.count()
         self._executetask_complete = None
         if self.execmodel.backend == "main_thread_only":
             self._executetask_complete = self.execmodel.Event()
@@ -1272,25 +2358,135 @@ class WorkerGateway(BaseGateway):
             # in the worker we can't really do anything sensible
             trace("swallowing keyboardinterrupt, serve finished")
 
+    def _startasync(
+        self, channel: Channel, coroutine: types.CoroutineType[Any, Any, Any]
+    ) -> None:
+        if self.execmodel.backend != "thread":
+            coroutine.close()
+            raise ValueError("async functions need the 'thread' execution model")
+        asyncio = _asyncio()
+        self._trace(f"execution continues in the event loop[{channel.id}]")
+        with self._cancellock:
+            # the thread is done with the channel, see _cancel(); a
+            # cancellation raised in it is seen by _executeasync() instead
+            taskthread = channel._taskthread
+            channel._taskthread = None
+            if taskthread in self._injected:
+                assert self._raise_in_thread is not None
+                self._raise_in_thread(taskthread, None)
+                self._injected.discard(taskthread)
+            if self._asyncloop is None:
+                self._asyncloop = asyncio.new_event_loop()
+                self.execmodel.start(self._runasyncloop, (self._asyncloop,))
+            channel._asyncfuture = asyncio.run_coroutine_threadsafe(
+                self._executeasync(channel, coroutine), self._asyncloop
+            )
+            # the loop keeps no reference to its tasks
+            self._asyncfutures.add(channel._asyncfuture)
+
+    def _runasyncloop(self, loop) -> None:
+        _asyncio().set_event_loop(loop)
+        try:
+            loop.run_forever()
+        finally:
+            self._trace("event loop stopped")
+
+    async def _executeasync(self, channel: Channel, coroutine) -> None:
+        asyncio = _asyncio()
+        try:
+            try:
+                if channel._cancelled:
+                    coroutine.close()
+                    raise TaskCancelled()
+                await coroutine
+            finally:
+                self._finish_task(channel)
+                with self._cancellock:
+                    self._asyncfutures.discard(channel._asyncfuture)
+                    channel._asyncfuture = None
+                self._trace("execution finished")
+        except EOFError:
+            self._trace("ignoring EOFError because receiving finished")
+        except BaseException as exc:  # noqa: BLE001 - sent to the other side
+            if isinstance(exc, asyncio.CancelledError) and channel._cancelled:
+                exc = TaskCancelled()
+            if not channel.gateway._channelfactory.finished:
+                self._trace(f"got exception: {exc!r}")
+                channel.close(self._geterrortext(exc))
+            return
+        channel.close()
+
+    def _finish_task(self, channel: Channel) -> None:
+        with self._cancellock:
+            if channel._executing:
+                # before the channel closes, for remote_status() callers
+                channel._executing = False
+                self._numexecuting -= 1
+            taskthread = channel._taskthread
+            channel._taskthread = None
+            if channel._cancelled and taskthread is not None:
+                assert self._raise_in_thread is not None
+                self._raise_in_thread(taskthread, None)
+                self._deferred.discard(taskthread)
+                self._injected.discard(taskthread)
+
     def executetask(
         self,
-        item: tuple[Channel, tuple[str, str | None, str | None, dict[str, object]]],
+        item: tuple[
+            Channel,
+            tuple[
+                str | types.CodeType,
+                str | None,
+                str | None,
+                dict[str, object],
+                bytes | None,
+            ],
+        ],
     ) -> None:
         try:
-            channel, (source, file_name, call_name, kwargs) = item
+            channel, (source, file_name, call_name, kwargs, digest) = item
             loc: dict[str, Any] = {"channel": channel, "__name__": "__channelexec__"}
             self._trace(f"execution starts[{channel.id}]: {repr(source)[:50]}")
-            channel._executing = True
+            started = False
             try:
-                co = compile(source + "\n", file_name or "<remote exec>", "exec")
+                # _finish_task() undoes this, whichever part got done
+                # before a cancellation raised
+                with self._cancellock:
+                    channel._executing = True
+                    self._numexecuting += 1
+                    if self._raise_in_thread is not None:
+                        channel._taskthread = self.execmodel.get_ident()
+                if channel._cancelled:
+                    raise TaskCancelled()
+                if isinstance(source, types.CodeType):
+                    co = source
+                else:
+                    co = compile(source + "\n", file_name or "<remote exec>", "exec")
+                    # unless the master dropped the digest meanwhile
+                    if digest is not None and self._codecache.get(digest) is source:
+                        self._codecache[digest] = co
                 exec(co, loc)
                 if call_name:
                     self._trace("calling %s(**%60r)" % (call_name, kwargs))
                     function = loc[call_name]
-                    function(channel, **kwargs)
+                    result = function(channel, **kwargs)
+                    if isinstance(result, types.CoroutineType):
+                        self._startasync(channel, result)
+                        started = True
             finally:
-                channel._executing = False
-                self._trace("execution finished")
+                if not started:
+                    # a cancellation may raise in this thread until it is
+                    # no longer registered as the task thread
+                    while 1:
+                        try:
+                            self._finish_task(channel)
+                            break
+                        except TaskCancelled:
+                            pass
+                    self._trace("execution finished")
+            if started:
+                # the event loop closes the channel, see _executeasync()
+                return
         except KeyboardInterrupt:
             channel.close(INTERRUPT_TEXT)
             raise
@@ -1370,6 +2566,8 @@ class opcode:
     TRUE = b"R"
     UNICODE = b"S"
     COMPLEX = b"T"
+    BIGBYTES = b"U"
+    BIGPY3STRING = b"V"
 
 
 class Unserializer:
@@ -1475,6 +2673,10 @@ class Unserializer:
         as_bytes = self.stream.read(length)
         return as_bytes
 
+    def _read_big_byte_string(self) -> bytes:
+        length: int = struct.unpack("!Q", self.stream.read(8))[0]
+        return self.stream.read(length)
+
     def load_py3string(self) -> None:
         as_bytes = self._read_byte_string()
         if self.py3str_as_py2str:
@@ -1485,6 +2687,15 @@ class Unserializer:
 
     num2func[opcode.PY3STRING] = load_py3string
 
+    def load_bigpy3string(self) -> None:
+        as_bytes = self._read_big_byte_string()
+        if self.py3str_as_py2str:
+            self.stack.append(as_bytes)
+        else:
+            self.stack.append(as_bytes.decode("utf-8"))
+
+    num2func[opcode.BIGPY3STRING] = load_bigpy3string
+
     def load_py2string(self) -> None:
         as_bytes = self._read_byte_string()
         if self.py2str_as_py3str:
@@ -1501,6 +2712,11 @@ class Unserializer:
 
     num2func[opcode.BYTES] = load_bytes
 
+    def load_bigbytes(self) -> None:
+        self.stack.append(self._read_big_byte_string())
+
+    num2func[opcode.BIGBYTES] = load_bigbytes
+
     def load_unicode(self) -> None:
         self.stack.append(self._read_byte_string().decode("utf-8"))
 
@@ -1613,11 +2829,14 @@ def load(
 
 
 def loads_internal(
-    bytestring: bytes,
+    bytestring: bytes | list[bytes],
     channelfactory=None,
     strconfig: tuple[bool, bool] | None = None,
 ) -> Any:
-    io = BytesIO(bytestring)
+    if isinstance(bytestring, list):
+        io: ReadIO = _PartsIO(bytestring)
+    else:
+        io = BytesIO(bytestring)
     return Unserializer(io, channelfactory, strconfig).load()
 
 
@@ -1625,6 +2844,63 @@ def dumps_internal(obj: object) -> bytes:
     return _Serializer().save(obj)  # type: ignore[return-value]
 
 
+def _dumps_frames(obj: object, framesize: int) -> Iterator[bytes]:
+    """Serialize obj into byte strings of at most framesize bytes."""
+    serializer = _Serializer()
+    serializer._save(obj)
+    serializer._write(opcode.STOP)
+    pieces = serializer._streamlist
+    if sum(map(len, pieces)) <= framesize:
+        return iter((b"".join(pieces),))
+    return _split_frames(pieces, framesize)
+
+
+def _split_frames(pieces: list[bytes], framesize: int) -> Iterator[bytes]:
+    # big strings are sliced into the frames directly so that
+    # at most one frame is copied at any time
+    frame: list[memoryview] = []
+    size = 0
+    for piece in pieces:
+        view = memoryview(piece)
+        while view:
+            chunk = view[: framesize - size]
+            frame.append(chunk)
+            size += len(chunk)
+            view = view[len(chunk) :]
+            if size == framesize:
+                yield b"".join(frame)
+                frame = []
+                size = 0
+    if frame:
+        yield b"".join(frame)
+
+
+class _PartsIO:
+    """Read from a list of byte strings without joining them first.
+
+    The list is taken over and emptied, each part is released once
+    it was read.
+    """
+
+    def __init__(self, parts: list[bytes]) -> None:
+        parts.reverse()
+        self._parts = parts
+        self._current = BytesIO()
+
+    def read(self, n: int) -> bytes:
+        data = self._current.read(n)
+        if len(data) == n or not self._parts:
+            return data
+        chunks = [data]
+        n -= len(data)
+        while n and self._parts:
+            self._current = BytesIO(self._parts.pop())
+            data = self._current.read(n)
+            chunks.append(data)
+            n -= len(data)
+        return b"".join(chunks)
+
+
 class _Serializer:
     _dispatch: dict[type, Callable[[_Serializer, object], None]] = {}
 
@@ -1672,24 +2948,33 @@ class _Serializer:
             self._write(opcode.FALSE)
 
     def save_bytes(self, bytes_: bytes) -> None:
-        self._write(opcode.BYTES)
-        self._write_byte_sequence(bytes_)
+        if len(bytes_) > FOUR_BYTE_INT_MAX:
+            self._write(opcode.BIGBYTES)
+            self._write_big_byte_sequence(bytes_)
+        else:
+            self._write(opcode.BYTES)
+            self._write_byte_sequence(bytes_)
 
     def save_str(self, s: str) -> None:
-        self._write(opcode.PY3STRING)
-        self._write_unicode_string(s)
-
-    def _write_unicode_string(self, s: str) -> None:
         try:
             as_bytes = s.encode("utf-8")
         except UnicodeEncodeError as e:
             raise DumpError("strings must be utf-8 encodable") from e
-        self._write_byte_sequence(as_bytes)
+        if len(as_bytes) > FOUR_BYTE_INT_MAX:
+            self._write(opcode.BIGPY3STRING)
+            self._write_big_byte_sequence(as_bytes)
+        else:
+            self._write(opcode.PY3STRING)
+            self._write_byte_sequence(as_bytes)
 
     def _write_byte_sequence(self, bytes_: bytes) -> None:
         self._write_int4(len(bytes_), "string is too long")
         self._write(bytes_)
 
+    def _write_big_byte_sequence(self, bytes_: bytes) -> None:
+        self._write(struct.pack("!Q", len(bytes_)))
+        self._write(bytes_)
+
     def _save_integral(self, i: int, short_op: bytes, long_op: bytes) -> None:
         if i <= FOUR_BYTE_INT_MAX:
             self._write(short_op)
@@ -1771,7 +3056,7 @@ def init_popen_io(execmodel: ExecModel) -> Popen2IO:
         except AttributeError:
             devnull = "NUL" if os.name == "nt" else "/dev/null"
         # stdin
-        stdin = execmodel.fdopen(os.dup(0), "r", 1)
+        stdin = execmodel.fdopen(os.dup(0), "rb", 0)
         fd = os.open(devnull, os.O_RDONLY)
         os.dup2(fd, 0)
         os.close(fd)
@@ -2,8 +2,14 @@
 
 from __future__ import annotations
 
+import binascii
+import functools
+import importlib.util
 import inspect
+import marshal
 import os
+import zlib
+from typing import TYPE_CHECKING
 
 import execnet
 
@@ -11,6 +17,9 @@ from . import gateway_base
 from .gateway_base import IO
 from .xspec import XSpec
 
+if TYPE_CHECKING:
+    from .ioloop import IOLoop
+
 importdir = os.path.dirname(os.path.dirname(execnet.__file__))
 
 
@@ -39,40 +48,43 @@ def bootstrap_import(io: IO, spec: XSpec) -> None:
 
 def bootstrap_exec(io: IO, spec: XSpec) -> None:
     try:
-        sendexec(
+        sendbootstrap(
             io,
-            inspect.getsource(gateway_base),
-            "execmodel = get_execmodel(%r)" % spec.execmodel,
-            "io = init_popen_io(execmodel)",
-            "io.write('1'.encode('ascii'))",
-            "serve(io, id='%s-worker')" % spec.id,
+            spec,
+            [inspect.getsource(gateway_base)],
+            [
+                "execmodel = get_execmodel(%r)" % spec.execmodel,
+                "io = init_popen_io(execmodel)",
+                "io.write(b'1' + importlib.util.MAGIC_NUMBER)",
+                "serve(io, id='%s-worker')" % spec.id,
+            ],
+            reject="sys.stdout.write('?'); sys.stdout.flush()",
+            retry="exec(eval(sys.stdin.readline()))",
         )
-        s = io.read(1)
-        assert s == b"1"
     except EOFError:
         ret = io.wait()
         if ret == 255 and hasattr(io, "remoteaddress"):
             raise HostNotFound(io.remoteaddress) from None
 
 
-def bootstrap_socket(io: IO, id) -> None:
-    # XXX: switch to spec
+def bootstrap_socket(io: IO, spec: XSpec) -> None:
     from execnet.gateway_socket import SocketIO
 
-    sendexec(
+    sendbootstrap(
         io,
-        inspect.getsource(gateway_base),
-        "import socket",
-        inspect.getsource(SocketIO),
-        "try: execmodel",
-        "except NameError:",
-        "   execmodel = get_execmodel('thread')",
-        "io = SocketIO(clientsock, execmodel)",
-        "io.write('1'.encode('ascii'))",
-        "serve(io, id='%s-worker')" % id,
+        spec,
+        [inspect.getsource(gateway_base), "import socket", inspect.getsource(SocketIO)],
+        [
+            "try: execmodel",
+            "except NameError:",
+            "   execmodel = get_execmodel('thread')",
+            "io = SocketIO(clientsock, execmodel)",
+            "io.write(b'1' + importlib.util.MAGIC_NUMBER)",
+            "serve(io, id='%s-worker')" % spec.id,
+        ],
+        reject="clientsock.sendall(b'?')",
+        retry="exec(eval(clientsock.makefile('rb').readline()))",
     )
-    s = io.read(1)
-    assert s == b"1"
 
 
 def sendexec(io: IO, *sources: str) -> None:
@@ -80,17 +92,87 @@ def sendexec(io: IO, *sources: str) -> None:
     io.write((repr(source) + "\n").encode("utf-8"))
 
 
-def bootstrap(io: IO, spec: XSpec) -> execnet.Gateway:
-    if spec.popen:
+#: bytecode magic number reported by the interpreters of each target
+_target_magic: dict[tuple[str | bool | None, ...], bytes] = {}
+
+
+def _target(spec: XSpec) -> tuple[str | bool | None, ...]:
+    # specs which agree on these start the same remote interpreter
+    return (
+        spec.ssh,
+        spec.vagrant_ssh,
+        spec.socket,
+        spec.unix,
+        spec.via,
+        spec.installvia,
+        spec.python,
+    )
+
+
+@functools.lru_cache
+def compiled_payload(source: str) -> str:
+    """Return the compressed and base64 encoded bytecode of 'source'."""
+    code = compile(source, "<string>", "exec", dont_inherit=True)
+    data = zlib.compress(marshal.dumps(code))
+    return binascii.b2a_base64(data, newline=False).decode("ascii")
+
+
+def sendbootstrap(
+    io: IO, spec: XSpec, modules: list[str], tail: list[str], reject: str, retry: str
+) -> None:
+    """Make the other side execute the 'modules' sources and then 'tail',
+    which acknowledges with ``b'1'`` and its bytecode magic number.
+
+    If the target of 'spec' reported the magic number of this interpreter
+    before, 'modules' are sent precompiled.  Should the other side have
+    changed meanwhile it executes 'reject' to request the sources and
+    'retry' to execute them.
+    """
+    target = _target(spec)
+    tail = ["import importlib.util", *tail]
+    if _target_magic.get(target) == importlib.util.MAGIC_NUMBER:
+        payload = compiled_payload("\n".join(modules))
+        sendexec(
+            io,
+            "import importlib.util",
+            "if importlib.util.MAGIC_NUMBER != %r:" % importlib.util.MAGIC_NUMBER,
+            "    " + reject,
+            "    " + retry,
+            "else:",
+            "    import binascii, marshal, zlib",
+            "    exec(marshal.loads(zlib.decompress(binascii.a2b_base64(%r))))"
+            % payload,
+            "    exec(%r)" % "\n".join(tail),
+        )
+        s = io.read(1)
+        if s == b"?":
+            # a parallel bootstrap to the target may have found out too
+            _target_magic.pop(target, None)
+            sendexec(io, *modules, *tail)
+            s = io.read(1)
+    else:
+        sendexec(io, *modules, *tail)
+        s = io.read(1)
+    assert s == b"1", repr(s)
+    _target_magic[target] = bytes(io.read(4))
+
+
+def bootstrap(io: IO, spec: XSpec, ioloop: IOLoop | None = None) -> execnet.Gateway:
+    if spec.popen and spec.forkserver:
+        # the forked worker serves right away and just acknowledges
+        s = io.read(1)
+        assert s == b"1", repr(s)
+    elif spec.popen:
         if spec.via or spec.python:
             bootstrap_exec(io, spec)
         else:
             bootstrap_import(io, spec)
     elif spec.ssh or spec.vagrant_ssh:
         bootstrap_exec(io, spec)
-    elif spec.socket:
+    elif spec.socket or spec.unix:
         bootstrap_socket(io, spec)
     else:
         raise ValueError("unknown gateway type, can't bootstrap")
-    gw = execnet.Gateway(io, spec)
+    gw = execnet.Gateway(io, spec, ioloop=ioloop)
+    gw._negotiate_features()
     return gw
@@ -5,8 +5,16 @@ Creates IO instances used for gateway IO.
 
 from __future__ import annotations
 
+import inspect
+import os
 import shlex
+import signal
+import socket
+import struct
+import subprocess
 import sys
+from contextlib import suppress
+from threading import Condition
 from typing import TYPE_CHECKING
 from typing import cast
 
@@ -16,11 +24,19 @@ if TYPE_CHECKING:
     from execnet.xspec import XSpec
 
 try:
-    from execnet.gateway_base import Message
     from execnet.gateway_base import Popen2IO
+    from execnet.gateway_base import dumps_internal
+    from execnet.gateway_base import get_execmodel
+    from execnet.gateway_base import init_popen_io
+    from execnet.gateway_base import loads_internal
+    from execnet.gateway_base import serve
 except ImportError:
-    from __main__ import Message  # type: ignore[no-redef]
     from __main__ import Popen2IO  # type: ignore[no-redef]
+    from __main__ import dumps_internal  # type: ignore[no-redef]
+    from __main__ import get_execmodel  # type: ignore[no-redef]
+    from __main__ import init_popen_io  # type: ignore[no-redef]
+    from __main__ import loads_internal  # type: ignore[no-redef]
+    from __main__ import serve  # type: ignore[no-redef]
 
 from functools import partial
 
@@ -121,6 +137,218 @@ def create_io(spec: XSpec, execmodel: ExecModel) -> Popen2IOMaster:
     assert False
 
 
+class ForkedIOMaster(Popen2IO):
+    """IO of a gateway whose worker was forked by a ForkServer."""
+
+    def __init__(
+        self, pid: int, outfile, infile, execmodel: ExecModel, forkserver: ForkServer
+    ) -> None:
+        super().__init__(outfile, infile, execmodel)
+        self.pid = pid
+        self.forkserver = forkserver
+
+    def wait(self) -> int | None:
+        return self.forkserver.wait(self.pid)
+
+    def kill(self) -> None:
+        if self.forkserver.returncode(self.pid) is not None:
+            return  # reaped, the pid may belong to another process by now
+        try:
+            os.kill(self.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        except OSError as e:
+            sys.stderr.write("ERROR killing: %s\n" % e)
+            sys.stderr.flush()
+
+
+#: records the fork server sends: kind, pid and exit status.  The kind
+#: is b"F" for the pid of a worker forked on request, b"X" for a worker
+#: which exited.
+FORKSERVER_RECORD = struct.Struct("!cii")
+
+
+class ForkServer:
+    """A pre-started Python process which forks the workers of
+    ``popen//forkserver`` gateways.
+
+    The server imports execnet and the modules listed in the spec's
+    ``forkserver`` value once.  For each gateway the master passes
+    it the worker ends of two fresh pipes over a unix socket.  The
+    server reaps its workers and reports their exit status back over
+    that socket, which a thread of the master receives.
+    """
+
+    def __init__(self, spec: XSpec, execmodel: ExecModel) -> None:
+        from execnet import gateway_base
+
+        if sys.platform == "win32":
+            raise ValueError("forkserver is only supported on POSIX")
+        preload = [] if spec.forkserver is True else str(spec.forkserver).split(",")
+        self._sock, childsock = socket.socketpair()
+        childfd = childsock.fileno()
+        try:
+            self.popen = subprocess.Popen(
+                popen_args(spec), stdin=subprocess.PIPE, pass_fds=[childfd]
+            )
+        finally:
+            childsock.close()
+        source = "\n".join(
+            [
+                inspect.getsource(gateway_base),
+                inspect.getsource(serve_forkserver),
+                "serve_forkserver(%d, %r)" % (childfd, preload),
+            ]
+        )
+        assert self.popen.stdin is not None
+        self.popen.stdin.write((repr(source) + "\n").encode("utf-8"))
+        self.popen.stdin.close()
+        self._lock = execmodel.Lock()
+        # pids of forked workers, None once the server is gone
+        self._forked = execmodel.queue.Queue()
+        # exit status by pid of the workers which exited
+        self._returncodes: dict[int, int] = {}
+        self._exited = Condition()
+        self._closed = False
+        if self._sock.recv(1) != b"1":
+            self.popen.wait()
+            raise OSError(f"fork server for {spec} did not start")
+        execmodel.start(self._receive)
+
+    def _receive(self) -> None:
+        infile = self._sock.makefile("rb")
+        try:
+            while 1:
+                record = infile.read(FORKSERVER_RECORD.size)
+                if len(record) < FORKSERVER_RECORD.size:
+                    break
+                kind, pid, returncode = FORKSERVER_RECORD.unpack(record)
+                if kind == b"F":
+                    self._forked.put(pid)
+                else:
+                    with self._exited:
+                        self._returncodes[pid] = returncode
+                        self._exited.notify_all()
+        except OSError:
+            pass
+        finally:
+            infile.close()
+            with self._exited:
+                self._closed = True
+                self._exited.notify_all()
+            self._forked.put(None)
+
+    def create_io(self, spec: XSpec, execmodel: ExecModel) -> ForkedIOMaster:
+        """Fork a worker serving a gateway for 'spec' and return its IO."""
+        master_read, worker_write = os.pipe()
+        worker_read, master_write = os.pipe()
+        try:
+            request = dumps_internal((spec.execmodel, spec.id))
+            with self._lock:
+                try:
+                    socket.send_fds(self._sock, [request], [worker_read, worker_write])
+                except OSError:
+                    pid = None
+                else:
+                    pid = self._forked.get()
+        finally:
+            os.close(worker_read)
+            os.close(worker_write)
+        if pid is None:
+            os.close(master_read)
+            os.close(master_write)
+            raise OSError(f"fork server for {spec} exited")
+        outfile = execmodel.fdopen(master_write, "wb", 0)
+        infile = execmodel.fdopen(master_read, "rb", 0)
+        return ForkedIOMaster(pid, outfile, infile, execmodel, self)
+
+    def returncode(self, pid: int) -> int | None:
+        """Return the exit status of the worker 'pid' if it exited."""
+        with self._exited:
+            return self._returncodes.get(pid)
+
+    def wait(self, pid: int) -> int | None:
+        """Wait for the worker 'pid' to exit and return its exit status,
+        or None if the server went away before."""
+        with self._exited:
+            while pid not in self._returncodes and not self._closed:
+                self._exited.wait()
+            return self._returncodes.get(pid)
+
+    def close(self) -> None:
+        """Stop the server, forked workers keep running."""
+        # wakes up the receiving thread as well
+        with suppress(OSError):
+            self._sock.shutdown(socket.SHUT_RDWR)
+        self._sock.close()
+        self.popen.wait()
+
+
+def serve_forkserver(fd: int, preload: list[str]) -> None:
+    import select
+    import signal
+    import socket
+
+    sock = socket.socket(fileno=fd)
+    # import what every worker needs, see local_features() and ExecModel
+    for name in ["lzma", "queue", "threading", "zlib", *preload]:
+        __import__(name)
+    # keep the garbage collector of the workers away from the objects
+    # created so far, their pages would get copied
+    import gc
+
+    gc.collect()
+    gc.freeze()
+    # SIGCHLD makes the select() below return to reap exited workers
+    wakeup, wakeup_signal = socket.socketpair()
+    wakeup.setblocking(False)
+    wakeup_signal.setblocking(False)
+    signal.set_wakeup_fd(wakeup_signal.fileno())
+    signal.signal(signal.SIGCHLD, lambda signum, frame: None)
+    sock.sendall(b"1")
+    while 1:
+        if wakeup in select.select([sock, wakeup], [], [])[0]:
+            with suppress(OSError):
+                wakeup.recv(4096)
+            while 1:
+                try:
+                    pid, status = os.waitpid(-1, os.WNOHANG)
+                except ChildProcessError:
+                    break
+                if not pid:
+                    break
+                code = os.waitstatus_to_exitcode(status)
+                sock.sendall(struct.pack("!cii", b"X", pid, code))
+            continue
+        try:
+            request, fds, _, _ = socket.recv_fds(sock, 4096, 2)
+        except OSError:
+            return
+        if not request:
+            return  # the master closed the connection
+        execmodel_name, id = loads_internal(request)
+        pid = os.fork()
+        if pid == 0:
+            sock.close()
+            signal.set_wakeup_fd(-1)
+            signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+            wakeup.close()
+            wakeup_signal.close()
+            os.dup2(fds[0], 0)
+            os.dup2(fds[1], 1)
+            for received in fds:
+                os.close(received)
+            execmodel = get_execmodel(execmodel_name)
+            io = init_popen_io(execmodel)
+            io.write(b"1")
+            serve(io, id="%s-worker" % id)  # type: ignore[arg-type]
+            # leave through the interpreter, not back into the loop
+            raise SystemExit(0)
+        for received in fds:
+            os.close(received)
+        sock.sendall(struct.pack("!cii", b"F", pid, 0))
+
+
 #
 # Proxy Gateway handling code
 #
@@ -236,18 +464,25 @@ def serve_proxy_io(proxy_channelX: Channel) -> None:
     # read bootstrap byte from sub, send it on to master
     log("reading bootstrap byte from sub", spec.id)
     initial = sub_io.read(1)
+    while initial == b"?":
+        # the sub requests the sources instead of bytecode, see sendbootstrap()
+        forward_to_master_file.write(initial)
+        initial = sub_io.read(1)
     assert initial == b"1", initial
     log("forwarding bootstrap byte from sub", spec.id)
-    forward_to_master_file.write(initial)
+    # followed by the bytecode magic number of the sub
+    forward_to_master_file.write(initial + sub_io.read(4))
 
-    # enter message forwarding loop
+    # enter message forwarding loop, passing frames on as they are
+    # so that compressed data stays compressed
     while True:
         try:
-            message = Message.from_io(sub_io)
+            header = sub_io.read(9)  # type 1, channel 4, payload 4
         except EOFError:
             log("EOF from sub, terminating proxying loop", spec.id)
             break
-        message.to_io(forward_to_master_file)
+        (payload,) = struct.unpack_from("!i", header, 5)
+        forward_to_master_file.write(header + sub_io.read(payload))
     # proxy_channelX will be closed from remote_exec's finalization code
 
 
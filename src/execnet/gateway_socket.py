@@ -1,10 +1,16 @@
 from __future__ import annotations
 
+import os
+import struct
 import sys
+import tempfile
+from collections.abc import Callable
 from typing import cast
 
 from execnet.gateway import Gateway
 from execnet.gateway_base import ExecModel
+from execnet.gateway_base import ReadBuffer
+from execnet.gateway_base import write_all
 from execnet.gateway_bootstrap import HostNotFound
 from execnet.multi import Group
 from execnet.xspec import XSpec
@@ -12,31 +18,104 @@ from execnet.xspec import XSpec
 
 class SocketIO:
     remoteaddress: str
+    #: maximum number of descriptors received along with one read
+    MAXFDS = 16
 
     def __init__(self, sock, execmodel: ExecModel) -> None:
         self.sock = sock
         self.execmodel = execmodel
         socket = execmodel.socket
-        try:
-            # IPTOS_LOWDELAY
-            sock.setsockopt(socket.SOL_IP, socket.IP_TOS, 0x10)
-            sock.setsockopt(socket.SOL_TCP, socket.TCP_NODELAY, 1)
-        except (AttributeError, OSError):
-            sys.stderr.write("WARNING: cannot set socketoption")
+        unix = getattr(sock, "family", None) == getattr(socket, "AF_UNIX", None)
+        if not unix:
+            try:
+                # IPTOS_LOWDELAY
+                sock.setsockopt(socket.SOL_IP, socket.IP_TOS, 0x10)
+                sock.setsockopt(socket.SOL_TCP, socket.TCP_NODELAY, 1)
+            except (AttributeError, OSError):
+                sys.stderr.write("WARNING: cannot set socketoption")
+        # file descriptors can be passed over unix sockets, see passfd()
+        self.fdpassing = (
+            unix
+            and hasattr(socket, "SCM_RIGHTS")
+            and execmodel.backend in ("thread", "main_thread_only")
+        )
+        self._fdlock = execmodel.Lock()
+        self._sendfds: list[int] = []
+        self.receivedfds: list[int] = []
+        self._reader = ReadBuffer(self.recv_into)
+
+    def recv_into(self, view: memoryview, flags: int = 0) -> int:
+        """Receive into 'view', queueing passed descriptors in receivedfds."""
+        if not self.fdpassing:
+            return self.sock.recv_into(view, len(view), flags)  # type: ignore[no-any-return]
+        socket = self.execmodel.socket
+        nbytes, ancdata, msgflags, _ = self.sock.recvmsg_into(
+            [view],
+            socket.CMSG_SPACE(self.MAXFDS * 4),
+            flags | getattr(socket, "MSG_CMSG_CLOEXEC", 0),
+        )
+        for level, kind, data in ancdata:
+            if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+                count = len(data) // 4
+                self.receivedfds.extend(struct.unpack("%di" % count, data[: count * 4]))
+        if msgflags & socket.MSG_CTRUNC:
+            raise OSError("file descriptors were lost, too many passed at once")
+        return nbytes  # type: ignore[no-any-return]
+
+    def passfd(self, fd: int, send: Callable[[], None]) -> None:
+        """Pass a duplicate of 'fd' along with the message written by send().
+
+        Descriptors and the messages announcing them are received in
+        the same order, as no other descriptor is passed in between.
+        """
+        if not self.fdpassing:
+            raise OSError("file descriptors can only be passed over unix sockets")
+        with self._fdlock:
+            self._sendfds.append(fd)
+            try:
+                send()
+            finally:
+                self._sendfds.clear()
 
     def read(self, numbytes: int) -> bytes:
         "Read exactly 'bytes' bytes from the socket."
-        buf = b""
-        while len(buf) < numbytes:
-            t = self.sock.recv(numbytes - len(buf))
-            if not t:
-                raise EOFError
-            buf += t
-        return buf
+        return self._reader.read(numbytes)
+
+    def readview(self, numbytes: int) -> memoryview:
+        "Return a view on the next 'bytes' bytes, valid until the next read."
+        return self._reader.readview(numbytes)
 
     def write(self, data: bytes) -> None:
         self.sock.sendall(data)
 
+    def writev(self, buffers: list[bytes]) -> None:
+        # green sockets need sendall() for cooperative writing
+        if self.execmodel.backend not in ("thread", "main_thread_only") or not hasattr(
+            self.sock, "sendmsg"
+        ):
+            self.sock.sendall(b"".join(buffers))
+        elif self._sendfds:
+            socket = self.execmodel.socket
+            fds, self._sendfds = self._sendfds, []
+            ancdata = [
+                (
+                    socket.SOL_SOCKET,
+                    socket.SCM_RIGHTS,
+                    struct.pack("%di" % len(fds), *fds),
+                )
+            ]
+
+            def sendmsg(buffers: list[bytes]) -> int:
+                # the descriptors go with the first bytes written
+                nonlocal ancdata
+                n: int = self.sock.sendmsg(buffers, ancdata)
+                ancdata = []
+                return n
+
+            write_all(sendmsg, buffers)
+        else:
+            write_all(self.sock.sendmsg, buffers)
+
     def close_read(self) -> None:
         try:
             self.sock.shutdown(0)
@@ -57,14 +136,17 @@ class SocketIO:
 
 
 def start_via(
-    gateway: Gateway, hostport: tuple[str, int] | None = None
+    gateway: Gateway, hostport: tuple[str, int] | str | None = None
 ) -> tuple[str, int]:
     """Instantiate a socketserver on the given gateway.
 
-    Returns a host, port tuple.
+    Returns a host, port tuple, or the path if 'hostport' is the
+    path of a unix socket.
     """
     if hostport is None:
         host, port = ("localhost", 0)
+    elif isinstance(hostport, str):
+        host, port = hostport, 0
     else:
         host, port = hostport
 
@@ -72,8 +154,11 @@ def start_via(
 
     # execute the above socketserverbootstrap on the other side
     channel = gateway.remote_exec(socketserver)
-    channel.send((host, port))
-    realhost, realport = cast("tuple[str, int]", channel.receive())
+    channel.send(hostport if isinstance(hostport, str) else (host, port))
+    address = channel.receive()
+    if isinstance(address, str):
+        return address, 0
+    realhost, realport = cast("tuple[str, int]", address)
     # self._trace("new_remote received"
     #               "port=%r, hostname = %r" %(realport, hostname))
     if not realhost or realhost == "0.0.0.0":
@@ -82,6 +167,8 @@ def start_via(
 
 
 def create_io(spec: XSpec, group: Group, execmodel: ExecModel) -> SocketIO:
+    if spec.unix:
+        return create_unix_io(spec, group, execmodel)
     assert spec.socket is not None
     assert not spec.python, "socket: specifying python executables not yet supported"
     gateway_id = spec.installvia
@@ -100,3 +187,29 @@ def create_io(spec: XSpec, group: Group, execmodel: ExecModel) -> SocketIO:
     except execmodel.socket.gaierror as e:
         raise HostNotFound() from e
     return io
+
+
+def create_unix_io(spec: XSpec, group: Group, execmodel: ExecModel) -> SocketIO:
+    assert not spec.python, "unix: specifying python executables not yet supported"
+    socket = execmodel.socket
+    if not hasattr(socket, "AF_UNIX"):
+        raise ValueError("unix sockets are not supported on this platform")
+    path = spec.unix
+    gateway_id = spec.installvia
+    if gateway_id:
+        if not isinstance(path, str):
+            # the via gateway has to run on this host anyway
+            name = f"execnet-{os.getpid()}-{id(group):x}-{spec.id}.sock"
+            path = os.path.join(tempfile.gettempdir(), name)
+        path, _ = start_via(group[gateway_id], path)
+    elif not isinstance(path, str):
+        raise ValueError("unix: the path of the socket is required")
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    io = SocketIO(sock, execmodel)
+    io.remoteaddress = path
+    try:
+        sock.connect(path)
+    except (FileNotFoundError, ConnectionRefusedError) as e:
+        raise HostNotFound(path) from e
+    return io
@@ -0,0 +1,282 @@
+"""Selector based receiving for many master-side gateways.
+
+By default every Gateway runs its own receiver thread which blocks
+reading from the gateway's IO.  An IOLoop instead waits on the IO of
+all registered gateways with a single ``selectors`` based loop,
+assembles Messages incrementally from whatever bytes are available
+and dispatches them from its one thread.
+
+Only IO objects with a selectable file descriptor (popen/ssh pipes
+on POSIX and sockets) can be served; gateways on other IO (e.g. proxied
+``via=`` gateways) keep using a receiver thread.
+"""
+
+from __future__ import annotations
+
+import os
+import selectors
+import socket
+import struct
+import sys
+from collections.abc import Callable
+from typing import TYPE_CHECKING
+from typing import Any
+
+from .gateway_base import ExecModel
+from .gateway_base import GatewayReceivedTerminate
+from .gateway_base import Message
+from .gateway_base import Popen2IO
+from .gateway_base import ReadBuffer
+from .gateway_base import WorkerPool
+from .gateway_base import trace
+
+if TYPE_CHECKING:
+    from .gateway import Gateway
+
+#: size of the per-gateway receive buffer
+READSIZE = 65536
+
+HEADER = struct.Struct("!bii")
+
+
+def _selectable(io: object) -> tuple[Any, Callable[[memoryview], int | None]] | None:
+    """Return a (fileobj, readinto) pair for IO objects an IOLoop can serve.
+
+    ``readinto`` performs at most one non-blocking read and returns
+    the number of bytes read, 0 at EOF or None if nothing is available.
+    """
+    from .gateway_socket import SocketIO
+
+    if isinstance(io, SocketIO):
+        recv_into = io.recv_into
+        flags = getattr(socket, "MSG_DONTWAIT", 0)
+
+        def sock_readinto(view: memoryview) -> int | None:
+            try:
+                return recv_into(view, flags)
+            except (BlockingIOError, InterruptedError):
+                return None
+
+        return io.sock, _pending_first(io._reader, sock_readinto)
+    if isinstance(io, Popen2IO) and sys.platform != "win32":
+        infile = getattr(io.infile, "buffer", io.infile)
+        raw = getattr(infile, "raw", None)
+        if raw is None:
+            return None
+        # only the receiving end is switched to non-blocking,
+        # writing happens through a different file descriptor
+        os.set_blocking(raw.fileno(), False)
+        return raw, _pending_first(io._reader, raw.readinto)
+    return None
+
+
+def _pending_first(
+    reader: ReadBuffer, readinto: Callable[[memoryview], int | None]
+) -> Callable[[memoryview], int | None]:
+    # bytes which the IO read ahead while bootstrapping are
+    # handed out before reading from the file descriptor
+    pending = reader.pending()
+
+    def readinto_pending(view: memoryview) -> int | None:
+        nonlocal pending
+        if not pending:
+            return readinto(view)
+        n = min(len(view), len(pending))
+        view[:n] = pending[:n]
+        pending = pending[n:]
+        return n
+
+    return readinto_pending
+
+
+class _Receiver:
+    """Incrementally parse the Messages arriving on one gateway's IO."""
+
+    def __init__(self, gateway: Gateway, readinto) -> None:
+        self.gateway = gateway
+        self._readinto = readinto
+        self._buf = bytearray(READSIZE)
+        self._view = memoryview(self._buf)
+        # unparsed bytes live in _buf[_start:_end]
+        self._start = self._end = 0
+        # header and payload of a frame that did not fit into _buf
+        self._header: tuple[int, int] | None = None
+        self._payload: bytearray | None = None
+        self._filled = 0
+
+    def read_messages(self) -> list[Message] | None:
+        """Read available bytes, return complete messages or None at EOF."""
+        if self._payload is not None:
+            return self._read_payload()
+        if self._start:
+            pending = self._end - self._start
+            self._buf[:pending] = self._buf[self._start : self._end]
+            self._start, self._end = 0, pending
+        n = self._readinto(self._view[self._end :])
+        if n is None:
+            return []
+        if not n:
+            return None
+        self._end += n
+        messages = []
+        while self._end - self._start >= HEADER.size:
+            msgcode, channelid, length = HEADER.unpack_from(self._buf, self._start)
+            start = self._start + HEADER.size
+            if self._end - start >= length:
+                data = bytes(self._buf[start : start + length])
+                messages.append(Message.from_frame(msgcode, channelid, data))
+                self._start = start + length
+                continue
+            if length > READSIZE - HEADER.size:
+                # large frames get their own buffer which is filled directly
+                self._header = (msgcode, channelid)
+                self._payload = bytearray(length)
+                self._filled = self._end - start
+                self._payload[: self._filled] = self._buf[start : self._end]
+                self._start = self._end = 0
+            break
+        if self._start == self._end:
+            self._start = self._end = 0
+        return messages
+
+    def _read_payload(self) -> list[Message] | None:
+        assert self._payload is not None and self._header is not None
+        n = self._readinto(memoryview(self._payload)[self._filled :])
+        if n is None:
+            return []
+        if not n:
+            return None
+        self._filled += n
+        if self._filled < len(self._payload):
+            return []
+        msgcode, channelid = self._header
+        message = Message.from_frame(msgcode, channelid, bytes(self._payload))
+        self._header = self._payload = None
+        return [message]
+
+
+class IOLoop:
+    """Serve the receiving side of many gateways from one thread."""
+
+    def __init__(self, execmodel: ExecModel) -> None:
+        if execmodel.backend not in ("thread", "main_thread_only"):
+            raise ValueError(
+                f"selector IO engine requires the thread execmodel, not {execmodel.backend!r}"
+            )
+        self.execmodel = execmodel
+        self._lock = execmodel.Lock()
+        self._pool = WorkerPool(execmodel)
+        self._selector = selectors.DefaultSelector()
+        self._wakeup_recv, self._wakeup_send = socket.socketpair()
+        self._wakeup_recv.setblocking(False)
+        self._wakeup_send.setblocking(False)
+        self._selector.register(self._wakeup_recv, selectors.EVENT_READ)
+        self._new: list[tuple[Any, _Receiver]] = []
+        self._numgateways = 0
+        self._running = False
+        self._closed = False
+
+    def __repr__(self) -> str:
+        return f"<IOLoop {self._numgateways} gateways>"
+
+    def register(self, gateway: Gateway) -> bool:
+        """Start serving ``gateway``, return False if its IO is not selectable."""
+        selectable = _selectable(gateway._io)
+        if selectable is None:
+            return False
+        fileobj, readinto = selectable
+        with self._lock:
+            self._new.append((fileobj, _Receiver(gateway, readinto)))
+            self._numgateways += 1
+            if not self._running:
+                self._running = True
+                self._pool.spawn(self._loop)
+        self._wakeup()
+        return True
+
+    def close(self) -> None:
+        """Release the selector and the wakeup sockets.
+
+        If gateways are still being served this happens once the last
+        of them finished.
+        """
+        with self._lock:
+            self._closed = True
+            if self._running:
+                return  # see _loop()
+        self._close()
+
+    def _close(self) -> None:
+        self._selector.close()
+        self._wakeup_recv.close()
+        self._wakeup_send.close()
+
+    def _wakeup(self) -> None:
+        try:
+            self._wakeup_send.send(b"x")
+        except OSError:
+            pass  # wakeup pending already
+
+    def _loop(self) -> None:
+        trace("[ioloop] starting")
+        selector = self._selector
+        while 1:
+            with self._lock:
+                new, self._new = self._new, []
+                if not self._numgateways:
+                    self._running = False
+                    closed = self._closed
+                    break
+            for fileobj, receiver in new:
+                selector.register(fileobj, selectors.EVENT_READ, receiver)
+                # pick up data which arrived before we started selecting
+                if not self._serve(receiver):
+                    selector.unregister(fileobj)
+                    self._finish(receiver.gateway)
+            for key, _events in selector.select():
+                receiver = key.data
+                if receiver is None:
+                    try:
+                        self._wakeup_recv.recv(4096)
+                    except OSError:
+                        pass
+                    continue
+                if not self._serve(receiver):
+                    selector.unregister(key.fileobj)
+                    self._finish(receiver.gateway)
+        trace("[ioloop] no more gateways, leaving")
+        if closed:
+            self._close()
+
+    def _serve(self, receiver: _Receiver) -> bool:
+        gateway = receiver.gateway
+        try:
+            messages = receiver.read_messages()
+            if messages is None:
+                raise EOFError("connection closed by remote")
+            for msg in messages:
+                gateway._trace("[ioloop] received", msg)
+                with gateway._receivelock:
+                    msg.received(gateway)
+        except GatewayReceivedTerminate:
+            return False
+        except EOFError as exc:
+            gateway._trace("[ioloop] EOF without prior gateway termination message")
+            gateway._error = exc
+            return False
+        except Exception as exc:
+            gateway._trace("[ioloop]", gateway._geterrortext(exc))
+            return False
+        return True
+
+    def _finish(self, gateway: Gateway) -> None:
+        def log(*msg: object) -> None:
+            gateway._trace("[ioloop]", *msg)
+
+        log("finishing receiving")
+        try:
+            gateway._finish_receiving(log)
+        finally:
+            gateway._ioloop_done.set()
+            with self._lock:
+                self._numgateways -= 1
@@ -7,23 +7,31 @@ Managing Gateway Groups and interactions with multiple channels.
 from __future__ import annotations
 
 import atexit
+import time
 import types
 from collections.abc import Callable
 from collections.abc import Iterable
 from collections.abc import Iterator
 from collections.abc import Sequence
+from contextlib import contextmanager
+from contextlib import suppress
 from functools import partial
+from threading import Condition
 from threading import Lock
 from typing import TYPE_CHECKING
 from typing import Any
 from typing import Literal
 from typing import TypeAlias
+from typing import cast
 from typing import overload
 
 from . import gateway_bootstrap
 from . import gateway_io
+from .gateway_base import COMPRESSION
 from .gateway_base import Channel
 from .gateway_base import ExecModel
+from .gateway_base import RemoteError
+from .gateway_base import TimeoutError
 from .gateway_base import WorkerPool
 from .gateway_base import get_execmodel
 from .gateway_base import trace
@@ -31,6 +39,7 @@ from .xspec import XSpec
 
 if TYPE_CHECKING:
     from .gateway import Gateway
+    from .ioloop import IOLoop
 
 
 NO_ENDMARKER_WANTED = object()
@@ -42,12 +51,31 @@ class Group:
     defaultspec = "popen"
 
     def __init__(
-        self, xspecs: Iterable[XSpec | str | None] = (), execmodel: str = "thread"
+        self,
+        xspecs: Iterable[XSpec | str | None] = (),
+        execmodel: str = "thread",
+        ioengine: Literal["thread", "selector"] = "thread",
     ) -> None:
-        """Initialize a group and make gateways as specified.
+        """Initialize a group and make gateways as specified, in parallel,
+        see ``makegateways()``.  The first failure is raised after the
+        gateways which were made are terminated again.
 
         execmodel can be one of the supported execution models.
+
+        ioengine determines how the gateways of this group receive data:
+        "thread" starts a receiver thread per gateway, "selector" serves
+        all gateways from a single selectors-based loop.  Gateways whose
+        IO cannot be selected on (e.g. proxied ``via`` gateways and pipes
+        on Windows) keep using a receiver thread.  With the "selector"
+        engine channel callbacks of all gateways run in the loop thread
+        and thus must not block.
         """
+        if ioengine not in ("thread", "selector"):
+            raise ValueError(f"unknown ioengine {ioengine!r}")
+        self.ioengine = ioengine
+        self._ioloop: IOLoop | None = None
+        self._forkservers: dict[tuple[object, ...], gateway_io.ForkServer] = {}
+        self._forkserverlock = Lock()
         self._gateways: list[Gateway] = []
         self._autoidcounter = 0
         self._autoidlock = Lock()
@@ -58,9 +86,11 @@ class Group:
         # Note that "other side" execmodels may differ and is typically
         # specified by the spec passed to makegateway.
         self.set_execmodel(execmodel)
-        for xspec in xspecs:
-            self.makegateway(xspec)
         atexit.register(self._cleanup_atexit)
+        errors = [x for x in self.makegateways(xspecs) if isinstance(x, Exception)]
+        if errors:
+            self.terminate(timeout=1.0)
+            raise errors[0]
 
     @property
     def execmodel(self) -> ExecModel:
@@ -87,6 +117,8 @@ class Group:
             )
         if remote_execmodel is None:
             remote_execmodel = execmodel
+        # a selector loop is bound to the execmodel it was created with
+        self._close_ioloop()
         self._execmodel = get_execmodel(execmodel)
         self._remote_execmodel = get_execmodel(remote_execmodel)
 
@@ -124,7 +156,8 @@ class Group:
             key1=value1//key2=value2//...
 
         If you leave out the ``=value`` part a True value is assumed.
-        Valid types: ``popen``, ``ssh=hostname``, ``socket=host:port``.
+        Valid types: ``popen``, ``ssh=hostname``, ``socket=host:port``,
+        ``unix=path``.
         Valid configuration::
 
             id=<string>     specifies the gateway id
@@ -133,6 +166,14 @@ class Group:
             chdir=<path>    specifies to which directory to change
             nice=<path>     specifies process priority of new process
             env:NAME=value  specifies a remote environment variable setting.
+            coalesce[=ms]   send data from a sender thread on both sides, merging
+                            messages sent within ms milliseconds (default 1).
+            compress[=name] compress larger messages with 'zlib' (default)
+                            or 'lzma' if the remote side supports it.
+            forkserver[=m1,m2]  fork popen gateways from a server process
+                            which imported the modules m1 and m2 beforehand.
+            maxexec=<n>     execute at most n remote_exec sources at a time,
+                            see Gateway.setexeclimit().
 
         If no spec is given, self.defaultspec is used.
         """
@@ -140,33 +181,55 @@ class Group:
             spec = self.defaultspec
         if not isinstance(spec, XSpec):
             spec = XSpec(spec)
+        compress = None
+        if spec.compress:
+            compress = "zlib" if spec.compress is True else spec.compress
+            if compress not in COMPRESSION:
+                raise ValueError(f"unknown compression {compress!r}")
+        maxexec = None
+        if spec.maxexec is not None:
+            if not str(spec.maxexec).isdigit() or int(spec.maxexec) < 1:
+                raise ValueError(f"maxexec must be a positive number: {spec.maxexec!r}")
+            maxexec = int(spec.maxexec)
         self.allocate_id(spec)
         if spec.execmodel is None:
             spec.execmodel = self.remote_execmodel.backend
+        ioloop = self._get_ioloop()
         if spec.via:
-            assert not spec.socket
+            assert not spec.socket and not spec.unix
+            if spec.forkserver:
+                raise ValueError("forkserver is not supported for gateways via others")
             master = self[spec.via]
             proxy_channel = master.remote_exec(gateway_io)
             proxy_channel.send(vars(spec))
             proxy_io_master = gateway_io.ProxyIO(proxy_channel, self.execmodel)
             gw = gateway_bootstrap.bootstrap(proxy_io_master, spec)
+        elif spec.popen and spec.forkserver:
+            fio = self._get_forkserver(spec).create_io(spec, self.execmodel)
+            gw = gateway_bootstrap.bootstrap(fio, spec, ioloop=ioloop)
         elif spec.popen or spec.ssh or spec.vagrant_ssh:
             io = gateway_io.create_io(spec, execmodel=self.execmodel)
-            gw = gateway_bootstrap.bootstrap(io, spec)
-        elif spec.socket:
+            gw = gateway_bootstrap.bootstrap(io, spec, ioloop=ioloop)
+        elif spec.socket or spec.unix:
             from . import gateway_socket
 
             sio = gateway_socket.create_io(spec, self, execmodel=self.execmodel)
-            gw = gateway_bootstrap.bootstrap(sio, spec)
+            gw = gateway_bootstrap.bootstrap(sio, spec, ioloop=ioloop)
         else:
             raise ValueError(f"no gateway type found for {spec._spec!r}")
         gw.spec = spec
         self._register(gw)
-        if spec.chdir or spec.nice or spec.env:
+        if maxexec is not None:
+            gw.setexeclimit(maxexec)
+        latency = None
+        if spec.coalesce:
+            latency = 0.001 if spec.coalesce is True else float(spec.coalesce) / 1000
+            gw._writer.start_sender(latency)
+        if spec.chdir or spec.nice or spec.env or latency is not None or compress:
             channel = gw.remote_exec(
                 """
                 import os
-                path, nice, env = channel.receive()
+                path, nice, env, latency, compress = channel.receive()
                 if path:
                     if not os.path.exists(path):
                         os.mkdir(path)
@@ -176,13 +239,123 @@ class Group:
                 if env:
                     for name, value in env.items():
                         os.environ[name] = value
+                if latency is not None:
+                    channel.gateway._writer.start_sender(latency)
+                if compress:
+                    channel.gateway._setcompression(compress)
             """
             )
+            if compress not in gw.features:
+                compress = None  # one of the sides lacks the codec
             nice = (spec.nice and int(spec.nice)) or 0
-            channel.send((spec.chdir, nice, spec.env))
+            channel.send((spec.chdir, nice, spec.env, latency, compress))
+            gw._setcompression(compress)
             channel.waitclose()
         return gw
 
+    def makegateways(
+        self, specs: Iterable[XSpec | str | None], max_parallel: int = 16
+    ) -> list[Gateway | Exception]:
+        """Make gateways for all 'specs', bootstrapping up to 'max_parallel'
+        of them at the same time.
+
+        Returns a list with the gateway, or the exception which prevented
+        making it, for each spec.  A failing spec does not abort the others.
+        Specs going ``via`` or being ``installvia`` another spec of the same
+        call are made after that one.  Specs without an id get theirs
+        before any gateway is made, so the group lists the new gateways
+        and numbers them in the order of 'specs'.
+        """
+        if max_parallel < 1:
+            raise ValueError(f"max_parallel must be positive, got {max_parallel!r}")
+        xspecs = [
+            x if isinstance(x, XSpec) else XSpec(x or self.defaultspec) for x in specs
+        ]
+        results: list[Gateway | Exception | None] = [None] * len(xspecs)
+        # ids in the order of 'specs', for "popen//via=gw0" to find gw0
+        for i, xspec in enumerate(xspecs):
+            try:
+                self.allocate_id(xspec)
+            except ValueError as e:
+                results[i] = e
+        pending = [i for i in range(len(xspecs)) if results[i] is None]
+        while pending:
+            # make the specs whose via gateway is not pending anymore
+            pendingids = {xspecs[i].id for i in pending}
+            ready = [
+                i
+                for i in pending
+                if (xspecs[i].via or xspecs[i].installvia) not in pendingids
+            ] or pending  # circular references fail in makegateway()
+            self._makegateways_parallel(xspecs, ready, results, max_parallel)
+            pending = [i for i in pending if results[i] is None]
+        with self._autoidlock:
+            created = [gw for gw in results if gw in self._gateways]
+            positions = sorted(self._gateways.index(gw) for gw in created)
+            for position, gw in zip(positions, created, strict=True):
+                self._gateways[position] = gw
+        return cast("list[Gateway | Exception]", results)
+
+    def _makegateways_parallel(
+        self,
+        xspecs: list[XSpec],
+        indices: list[int],
+        results: list[Gateway | Exception | None],
+        max_parallel: int,
+    ) -> None:
+        todo = iter(indices)
+        lock = self.execmodel.Lock()
+
+        def work() -> None:
+            while 1:
+                with lock:
+                    i = next(todo, None)
+                if i is None:
+                    return
+                try:
+                    results[i] = self.makegateway(xspecs[i])
+                except Exception as e:  # noqa: BLE001 - reported to the caller
+                    results[i] = e
+
+        pool = WorkerPool(self.execmodel)
+        replies = [pool.spawn(work) for _ in range(min(max_parallel, len(indices)))]
+        for reply in replies:
+            reply.get()
+
+    async def amakegateway(self, spec: XSpec | str | None = None) -> Gateway:
+        """Like ``makegateway()``, but bootstrap the gateway in a worker
+        thread while the running asyncio event loop goes on."""
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.makegateway, spec)
+
+    def _get_forkserver(self, spec: XSpec) -> gateway_io.ForkServer:
+        # workers differing in these are forked from different servers
+        key = (spec.python, spec.forkserver, spec.dont_write_bytecode)
+        with self._forkserverlock:
+            forkserver = self._forkservers.get(key)
+            if forkserver is None:
+                forkserver = gateway_io.ForkServer(spec, self.execmodel)
+                self._forkservers[key] = forkserver
+            return forkserver
+
+    def _get_ioloop(self) -> IOLoop | None:
+        if self.ioengine != "selector":
+            return None
+        with self._autoidlock:
+            if self._ioloop is None:
+                from .ioloop import IOLoop
+
+                self._ioloop = IOLoop(self.execmodel)
+            return self._ioloop
+
+    def _close_ioloop(self) -> None:
+        with self._autoidlock:
+            ioloop, self._ioloop = self._ioloop, None
+        if ioloop is not None:
+            ioloop.close()
+
     def allocate_id(self, spec: XSpec) -> None:
         """(re-entrant) allocate id for the given xspec object."""
         if spec.id is None:
@@ -196,8 +369,9 @@ class Group:
     def _register(self, gateway: Gateway) -> None:
         assert not hasattr(gateway, "_group")
         assert gateway.id
-        assert gateway.id not in self
-        self._gateways.append(gateway)
+        with self._autoidlock:
+            assert gateway.id not in self
+            self._gateways.append(gateway)
         gateway._group = self
 
     def _unregister(self, gateway: Gateway) -> None:
@@ -226,24 +400,29 @@ class Group:
             for gw in self:
                 if gw.id not in vias:
                     gw.exit()
-
-            def join_wait(gw: Gateway) -> None:
-                gw.join()
-                gw._io.wait()
-
-            def kill(gw: Gateway) -> None:
-                trace("Gateways did not come down after timeout: %r" % gw)
-                gw._io.kill()
-
-            safe_terminate(
-                self.execmodel,
-                timeout,
-                [
-                    (partial(join_wait, gw), partial(kill, gw))
-                    for gw in self._gateways_to_join
-                ],
-            )
+            self._join_or_kill(self._gateways_to_join, timeout)
             self._gateways_to_join[:] = []
+        with self._forkserverlock:
+            forkservers = list(self._forkservers.values())
+            self._forkservers.clear()
+        for forkserver in forkservers:
+            forkserver.close()
+        self._close_ioloop()
+
+    def _join_or_kill(self, gateways: Sequence[Gateway], timeout: float | None) -> None:
+        def join_wait(gw: Gateway) -> None:
+            gw.join()
+            gw._io.wait()
+
+        def kill(gw: Gateway) -> None:
+            trace("Gateways did not come down after timeout: %r" % gw)
+            gw._io.kill()
+
+        safe_terminate(
+            self.execmodel,
+            timeout,
+            [(partial(join_wait, gw), partial(kill, gw)) for gw in gateways],
+        )
 
     def remote_exec(
         self,
@@ -258,6 +437,213 @@ class Group:
         return MultiChannel(channels)
 
 
+class GatewayPool:
+    """Keep 'size' warm gateways for each of some specs and lease them
+    out for reuse, so that users of a gateway do not wait for it to be
+    bootstrapped.
+
+    A gateway is checked with ``remote_status()`` before each lease.
+    It is replaced in the background once it served 'max_tasks' leases
+    or once its process uses more than 'max_rss' bytes of memory.  Only
+    Linux reports the current memory use; elsewhere 'max_rss' is ignored,
+    as the peak use of a gateway never drops once exceeded.
+    Health checks and exiting replaced gateways wait 'timeout' seconds.
+
+    Specs must not set an ``id``, the gateways get theirs from the group.
+    Without a 'group' the pool makes its own and terminates it on close.
+    """
+
+    def __init__(
+        self,
+        specs: Iterable[XSpec | str] | XSpec | str,
+        size: int = 1,
+        group: Group | None = None,
+        max_tasks: int | None = None,
+        max_rss: int | None = None,
+        timeout: float | None = 10.0,
+    ) -> None:
+        if isinstance(specs, (XSpec, str)):
+            specs = [specs]
+        self._specs = list(dict.fromkeys(str(spec) for spec in specs))
+        if not self._specs:
+            raise ValueError("no specs given")
+        for spec in self._specs:
+            if XSpec(spec).id is not None:
+                raise ValueError(f"pooled spec {spec!r} must not set an id")
+        if size < 1:
+            raise ValueError(f"size must be positive, got {size!r}")
+        self.size = size
+        self.max_tasks = max_tasks
+        self.max_rss = max_rss
+        self.timeout = timeout
+        self._ownsgroup = group is None
+        self.group = Group() if group is None else group
+        self._cond = Condition()
+        self._closed = False
+        self._members: dict[Gateway, str] = {}
+        self._tasks: dict[Gateway, int] = {}
+        self._idle: dict[str, list[Gateway]] = {spec: [] for spec in self._specs}
+        self._starting = dict.fromkeys(self._specs, 0)
+        self._errors: dict[str, Exception] = {}
+        self._workerpool = WorkerPool(self.group.execmodel)
+        tomake = [spec for spec in self._specs for _ in range(size)]
+        results = self.group.makegateways(tomake)
+        for spec, result in zip(tomake, results, strict=True):
+            if not isinstance(result, Exception):
+                self._add(spec, result)
+        for result in results:
+            if isinstance(result, Exception):
+                self.close()
+                raise result
+
+    def __repr__(self) -> str:
+        with self._cond:
+            idle = sum(len(gateways) for gateways in self._idle.values())
+            return f"<GatewayPool {self._specs!r} {len(self._members)} gateways, {idle} idle>"
+
+    @contextmanager
+    def lease(
+        self, spec: XSpec | str | None = None, timeout: float | None = None
+    ) -> Iterator[Gateway]:
+        """Lease a healthy idle gateway for the duration of a with block::
+
+            with pool.lease() as gw:
+                gw.remote_exec(...)
+
+        The gateway is made from 'spec', which must be one of the pool's
+        specs, or from any of them.  Waits up to 'timeout' seconds for a
+        gateway to become idle and raises ``execnet.TimeoutError`` if none
+        does.  If a replacement gateway could not be made while waiting,
+        its exception is raised.
+        """
+        gw = self._acquire(spec, timeout)
+        try:
+            yield gw
+        finally:
+            self._release(gw)
+
+    def close(self, timeout: float | None = None) -> None:
+        """Exit all gateways of the pool, including leased ones, and kill
+        them if they did not come down after 'timeout' seconds."""
+        with self._cond:
+            self._closed = True
+            gateways = list(self._members)
+            self._members.clear()
+            self._cond.notify_all()
+        # let gateways still being made or retired settle
+        self._workerpool.waitall()
+        if self._ownsgroup:
+            self.group.terminate(timeout)
+        else:
+            self._retire(gateways, timeout)
+
+    def _add(self, spec: str, gw: Gateway) -> None:
+        self._members[gw] = spec
+        self._tasks[gw] = 0
+        self._idle[spec].append(gw)
+
+    def _acquire(self, spec: XSpec | str | None, timeout: float | None) -> Gateway:
+        if spec is None:
+            specs = self._specs
+        elif str(spec) in self._idle:
+            specs = [str(spec)]
+        else:
+            raise ValueError(f"{spec!r} is not a spec of this pool")
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while 1:
+            with self._cond:
+                gw = self._popidle(specs, deadline)
+            if self._healthy(gw):
+                return gw
+            self._recycle(gw)
+
+    def _popidle(self, specs: list[str], deadline: float | None) -> Gateway:
+        # called with self._cond held
+        while 1:
+            if self._closed:
+                raise ValueError("pool is closed")
+            for spec in specs:
+                if self._idle[spec]:
+                    # the most recently used gateway has the warmest caches
+                    return self._idle[spec].pop()
+            for spec in specs:
+                error = self._errors.pop(spec, None)
+                if error is not None:
+                    raise error
+                self._fill(spec)
+            if deadline is None:
+                self._cond.wait()
+            else:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"no idle gateway for {specs!r}")
+                self._cond.wait(remaining)
+
+    def _healthy(self, gw: Gateway) -> bool:
+        if not gw.hasreceiver():
+            return False
+        try:
+            status = gw.remote_status(self.timeout)
+        except (OSError, EOFError, RemoteError):
+            return False
+        rss = getattr(status, "rss", None)
+        return self.max_rss is None or rss is None or rss <= self.max_rss
+
+    def _release(self, gw: Gateway) -> None:
+        with self._cond:
+            if gw not in self._members:
+                return  # the pool was closed meanwhile
+            self._tasks[gw] += 1
+            if gw.hasreceiver() and (
+                self.max_tasks is None or self._tasks[gw] < self.max_tasks
+            ):
+                self._idle[self._members[gw]].append(gw)
+                self._cond.notify_all()
+                return
+        self._recycle(gw)
+
+    def _recycle(self, gw: Gateway) -> None:
+        with self._cond:
+            if gw not in self._members:
+                return
+            spec = self._members.pop(gw)
+            del self._tasks[gw]
+            self._fill(spec)
+            self._workerpool.spawn(self._retire, [gw], self.timeout)
+
+    def _fill(self, spec: str) -> None:
+        # called with self._cond held, start making missing gateways
+        members = sum(1 for other in self._members.values() if other == spec)
+        for _ in range(self.size - members - self._starting[spec]):
+            self._starting[spec] += 1
+            self._workerpool.spawn(self._start, spec)
+
+    def _start(self, spec: str) -> None:
+        try:
+            gw = self.group.makegateway(spec)
+        except Exception as e:  # noqa: BLE001 - raised from a waiting lease
+            with self._cond:
+                self._starting[spec] -= 1
+                self._errors[spec] = e
+                self._cond.notify_all()
+            return
+        with self._cond:
+            self._starting[spec] -= 1
+            if not self._closed:
+                self._add(spec, gw)
+                self._cond.notify_all()
+                return
+        self._retire([gw], self.timeout)
+
+    def _retire(self, gateways: list[Gateway], timeout: float | None) -> None:
+        for gw in gateways:
+            gw.exit()
+        self.group._join_or_kill(gateways, timeout)
+        for gw in gateways:
+            with suppress(ValueError):
+                self.group._gateways_to_join.remove(gw)
+
+
 class MultiChannel:
     def __init__(self, channels: Sequence[Channel]) -> None:
         self._channels = channels
@@ -0,0 +1,55 @@
+"""
+Worker side of ``Gateway.register()`` and ``Gateway.call()``.
+"""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+from typing import Any
+
+if TYPE_CHECKING:
+    from execnet.gateway_base import Channel
+
+
+def serve_rpc(channel: Channel) -> None:
+    """Send back a channel whose requests are answered right from the
+    receiver thread, without a thread or channel per call.
+
+    Requests are kept small as they are serialized for every call:
+    ``(callid, number, source, file_name, function_name)`` defines the
+    function ``number``, ``(callid, number, args, kwargs)`` calls it,
+    kwargs being None if empty.  Each request is answered with
+    ``(callid, ok, result)`` where the result of a failed request is
+    the error text.
+    """
+    gateway = channel.gateway
+    functions: dict[int, Any] = {}
+    rpcchannel = gateway.newchannel()
+
+    def handle(request: tuple[Any, ...]) -> None:
+        callid, number = request[:2]
+        reply: tuple[int, bool, Any]
+        try:
+            if len(request) == 5:
+                source, file_name, function_name = request[2:]
+                namespace = {"__name__": "__channelexec__"}
+                co = compile(source + "\n", file_name or "<rpc>", "exec")
+                exec(co, namespace)  # noqa: S102
+                functions[number] = namespace[function_name]
+                reply = (callid, True, None)
+            else:
+                args, kwargs = request[2:]
+                reply = (callid, True, functions[number](*args, **(kwargs or {})))
+        except Exception as exc:  # noqa: BLE001 - raised by the caller
+            reply = (callid, False, gateway._geterrortext(exc))
+        try:
+            rpcchannel.send(reply)
+        except Exception as exc:  # noqa: BLE001 - e.g. an unserializable result
+            rpcchannel.send((callid, False, gateway._geterrortext(exc)))
+
+    rpcchannel.setcallback(handle)
+    channel.send(rpcchannel)
+
+
+if __name__ == "__channelexec__":
+    serve_rpc(channel)  # type: ignore[name-defined]  # noqa:F821
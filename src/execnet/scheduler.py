@@ -0,0 +1,374 @@
+"""
+Deciding which gateway runs which task of an ``execnet.Executor``.
+"""
+
+from __future__ import annotations
+
+import time
+from collections import deque
+from collections.abc import Callable
+from concurrent import futures
+from threading import Lock
+from typing import TYPE_CHECKING
+from typing import Any
+
+if TYPE_CHECKING:
+    from .gateway import Gateway
+
+# number of recent task run times from which hedging thresholds are taken
+RUNTIMES_KEPT = 1000
+
+
+class Task:
+    """A call, or a chunk of calls from ``Executor.map()``, to run remotely."""
+
+    def __init__(
+        self,
+        taskid: int,
+        future: futures.Future[Any],
+        function: Callable[..., object],
+        calls: list[tuple[tuple[object, ...], dict[str, object] | None]],
+        single: bool,
+    ) -> None:
+        self.taskid = taskid
+        self.future = future
+        self.function = function
+        self.calls = calls
+        self.single = single
+
+    def __repr__(self) -> str:
+        return f"<Task {self.taskid} {self.function.__name__}>"
+
+    def start(self) -> bool:
+        """Mark the future running, return False if it was cancelled
+        or is done already."""
+        if self.future.running():
+            return True
+        return not self.future.done() and self.future.set_running_or_notify_cancel()
+
+
+class Scheduler:
+    """Keep the tasks of an Executor in one queue and send the next one
+    to the gateway with the fewest outstanding tasks, at most
+    'max_pending' to each.
+
+    With 'hedge' set to a percentile, a task which runs longer than
+    that percentile of the run times of finished tasks is sent to an
+    idle gateway as well, once ``hedge_samples`` tasks finished.  The
+    first result of the two is the result of the task, the other one
+    is discarded.  Hedging only pays off for tasks which may run
+    twice, and when some gateways are much slower than others.
+
+    A scheduler serves one executor, whose thread calls all methods
+    but ``stats()``.  That thread changes what ``stats()`` reads only
+    while holding ``_lock``.
+    """
+
+    hedge_samples = 10
+
+    def __init__(self, max_pending: int = 2, hedge: float | None = None) -> None:
+        if max_pending < 1:
+            raise ValueError(f"max_pending must be positive, got {max_pending!r}")
+        if hedge is not None and not 0 < hedge < 100:
+            raise ValueError(f"hedge must be a percentile, got {hedge!r}")
+        self.max_pending = max_pending
+        self.hedge = hedge
+        self._lock = Lock()
+        self._queue: deque[Task] = deque()
+        # the tasks sent to each gateway, in the order it runs them
+        self._outstanding: dict[Gateway, dict[Task, None]] = {}
+        # when the first outstanding task of a gateway started
+        self._since: dict[Gateway, float] = {}
+        self._stats: dict[Gateway, dict[str, float]] = {}
+        self._runtimes: deque[float] = deque(maxlen=RUNTIMES_KEPT)
+        # tasks running on two gateways
+        self._hedged: set[Task] = set()
+
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__name__} {len(self._outstanding)} gateways>"
+
+    def join(self, gateway: Gateway) -> None:
+        """Start scheduling tasks to 'gateway'."""
+        with self._lock:
+            self._outstanding[gateway] = {}
+            self._stats[gateway] = {
+                "sent": 0,
+                "done": 0,
+                "stolen": 0,
+                "hedged": 0,
+                "busy": 0.0,
+            }
+
+    def leave(self, gateway: Gateway) -> list[Task]:
+        """Stop scheduling tasks to 'gateway' and return its outstanding
+        tasks, but for those still running on another gateway."""
+        with self._lock:
+            self._since.pop(gateway, None)
+            tasks = self._outstanding.pop(gateway)
+        return [task for task in tasks if not self._copies(task)]
+
+    def submit(self, task: Task) -> None:
+        self._queue.append(task)
+
+    def drain(self) -> list[Task]:
+        """Remove and return the tasks which were not sent yet."""
+        tasks = list(self._queue)
+        self._queue.clear()
+        return tasks
+
+    def pending(self) -> int:
+        """Return the number of tasks which are not done yet."""
+        outstanding = {
+            task
+            for tasks in self._outstanding.values()
+            for task in tasks
+            if not task.future.done()
+        }
+        return len(self._queue) + len(outstanding)
+
+    def schedule(self) -> list[tuple[Gateway, Task]]:
+        """Return the tasks to send now, and to which gateways."""
+        scheduled = self._assign()
+        if self.hedge is not None:
+            scheduled.extend(self._hedges())
+        return scheduled
+
+    def next_check(self) -> float | None:
+        """Return the seconds after which ``schedule()`` is to be called
+        again even if nothing happens meanwhile, or None."""
+        threshold = self._threshold()
+        if threshold is None or all(self._outstanding.values()):
+            return None
+        deadlines = [
+            since + threshold
+            for gateway, since in self._since.items()
+            if next(iter(self._outstanding[gateway])) not in self._hedged
+        ]
+        if not deadlines:
+            return None
+        return max(0.0, min(deadlines) - time.monotonic())
+
+    def _assign(self) -> list[tuple[Gateway, Task]]:
+        scheduled = []
+        while self._queue and self._outstanding:
+            gateway = min(self._outstanding, key=lambda gw: len(self._outstanding[gw]))
+            if len(self._outstanding[gateway]) >= self.max_pending:
+                break
+            task = self._queue.popleft()
+            if task.start():
+                self._sent(gateway, task)
+                scheduled.append((gateway, task))
+        return scheduled
+
+    def steal(self) -> list[tuple[Gateway, Task]]:
+        """Return the sent tasks to ask back from their gateways, which
+        report ``returned()`` for those that did not start yet."""
+        return []
+
+    def done(self, gateway: Gateway, task: Task) -> None:
+        """Record that 'gateway' finished running 'task'."""
+        stats = self._stats[gateway]
+        seconds = self._forget(gateway, task)
+        stats["busy"] += seconds
+        stats["done"] += 1
+        if not task.future.done():
+            # the run time of a hedged copy finishing second says little
+            self._runtimes.append(seconds)
+
+    def returned(self, gateway: Gateway, task: Task) -> None:
+        """Record that 'gateway' handed back 'task' without running it."""
+        self._forget(gateway, task)
+        self._queue.appendleft(task)
+
+    def stats(self) -> dict[str, dict[str, float]]:
+        """Return counters for tuning, for each gateway id:
+
+        * ``queued``: tasks waiting locally to be sent to the gateway
+        * ``outstanding``: tasks sent but not done
+        * ``sent``, ``done``: tasks sent to and finished by the gateway
+        * ``stolen``: tasks the gateway took over from other gateways
+        * ``hedged``: copies of slow tasks the gateway ran
+        * ``busy``: seconds the gateway spent running tasks
+        """
+        with self._lock:
+            result = {}
+            for gateway, stats in self._stats.items():
+                result[gateway.id] = dict(
+                    stats,
+                    queued=self._queued(gateway),
+                    outstanding=len(self._outstanding.get(gateway, ())),
+                )
+            return result
+
+    def _queued(self, gateway: Gateway) -> int:
+        return 0
+
+    def _sent(self, gateway: Gateway, task: Task) -> None:
+        tasks = self._outstanding[gateway]
+        if not tasks:
+            self._since[gateway] = time.monotonic()
+        with self._lock:
+            tasks[task] = None
+            self._stats[gateway]["sent"] += 1
+
+    def _copies(self, task: Task) -> int:
+        if task not in self._hedged:
+            return 0
+        copies = sum(task in tasks for tasks in self._outstanding.values())
+        if not copies:
+            self._hedged.discard(task)
+        return copies
+
+    def _threshold(self) -> float | None:
+        if self.hedge is None or len(self._runtimes) < self.hedge_samples:
+            return None
+        runtimes = sorted(self._runtimes)
+        return runtimes[min(len(runtimes) - 1, int(len(runtimes) * self.hedge / 100))]
+
+    def _hedges(self) -> list[tuple[Gateway, Task]]:
+        idle = [gateway for gateway, tasks in self._outstanding.items() if not tasks]
+        threshold = self._threshold()
+        if not idle or threshold is None:
+            return []
+        now = time.monotonic()
+        hedges = []
+        # the longest running tasks first
+        for gateway, since in sorted(self._since.items(), key=lambda item: item[1]):
+            if not idle or now - since < threshold:
+                break
+            task = next(iter(self._outstanding[gateway]))
+            if task in self._hedged:
+                continue
+            other = idle.pop()
+            self._hedged.add(task)
+            self._sent(other, task)
+            self._stats[other]["hedged"] += 1
+            hedges.append((other, task))
+        return hedges
+
+    def _forget(self, gateway: Gateway, task: Task) -> float:
+        # a gateway runs its tasks in order, the first one since _since
+        tasks = self._outstanding[gateway]
+        first = next(iter(tasks)) is task
+        with self._lock:
+            del tasks[task]
+        self._copies(task)
+        if not first:
+            return 0.0
+        now = time.monotonic()
+        seconds = now - self._since.pop(gateway)
+        if tasks:
+            self._since[gateway] = now
+        return seconds
+
+
+class WorkStealingScheduler(Scheduler):
+    """Deal the tasks of an Executor out to a queue for each gateway,
+    so that a gateway gets consecutive tasks, and let gateways that
+    ran out of tasks steal them from others.
+
+    An idle gateway whose queue is empty takes the last tasks from the
+    longest other queue.  Once all queues are empty an idle gateway asks the
+    gateway with the most tasks waiting behind its running one to hand
+    back the last of them, so that no task waits for a slow gateway
+    while others are idle.
+    """
+
+    def __init__(self, max_pending: int = 2, hedge: float | None = None) -> None:
+        super().__init__(max_pending, hedge)
+        self._local: dict[Gateway, deque[Task]] = {}
+        # tasks asked back from their gateways, and the gateways to run them
+        self._stealing: dict[Task, Gateway] = {}
+
+    def join(self, gateway: Gateway) -> None:
+        super().join(gateway)
+        with self._lock:
+            self._local[gateway] = deque()
+
+    def leave(self, gateway: Gateway) -> list[Task]:
+        tasks = super().leave(gateway)
+        with self._lock:
+            local = self._local.pop(gateway)
+        self._queue.extendleft(reversed(local))
+        for task, thief in list(self._stealing.items()):
+            if thief is gateway or task in tasks:
+                del self._stealing[task]
+        return tasks
+
+    def drain(self) -> list[Task]:
+        tasks = super().drain()
+        for local in self._local.values():
+            tasks.extend(local)
+            local.clear()
+        return tasks
+
+    def pending(self) -> int:
+        return super().pending() + sum(map(len, self._local.values()))
+
+    def _assign(self) -> list[tuple[Gateway, Task]]:
+        local = self._local
+        while self._queue and local:
+            gateway = min(
+                local, key=lambda gw: len(local[gw]) + len(self._outstanding[gw])
+            )
+            local[gateway].append(self._queue.popleft())
+        scheduled = []
+        for gateway, tasks in local.items():
+            # only idle gateways steal, not the busy ones prefetching
+            idle = not self._outstanding[gateway]
+            while len(self._outstanding[gateway]) < self.max_pending:
+                stolen = False
+                if tasks:
+                    task = tasks.popleft()
+                elif idle:
+                    victim = max(local, key=lambda gw: len(local[gw]))
+                    if not local[victim]:
+                        break
+                    task = local[victim].pop()
+                    stolen = True
+                else:
+                    break
+                if task.start():
+                    if stolen:
+                        self._stats[gateway]["stolen"] += 1
+                    self._sent(gateway, task)
+                    scheduled.append((gateway, task))
+        return scheduled
+
+    def steal(self) -> list[tuple[Gateway, Task]]:
+        if self._queue or any(self._local.values()):
+            return []
+        thieves = set(self._stealing.values())
+        requests = []
+        for thief in self._local:
+            if self._outstanding[thief] or thief in thieves:
+                continue
+            waiting = {
+                gateway: [
+                    task for task in list(tasks)[1:] if task not in self._stealing
+                ]
+                for gateway, tasks in self._outstanding.items()
+            }
+            victim = max(waiting, key=lambda gw: len(waiting[gw]))
+            if not waiting[victim]:
+                break
+            task = waiting[victim][-1]
+            self._stealing[task] = thief
+            requests.append((victim, task))
+        return requests
+
+    def done(self, gateway: Gateway, task: Task) -> None:
+        self._stealing.pop(task, None)
+        super().done(gateway, task)
+
+    def returned(self, gateway: Gateway, task: Task) -> None:
+        thief = self._stealing.pop(task, None)
+        if thief is None:
+            super().returned(gateway, task)
+            return
+        self._forget(gateway, task)
+        self._local[thief].appendleft(task)
+        self._stats[thief]["stolen"] += 1
+
+    def _queued(self, gateway: Gateway) -> int:
+        return len(self._local.get(gateway, ()))
@@ -15,6 +15,7 @@ it can exeuted in 2 modes of operation
 from __future__ import annotations
 
 import os
+import stat
 import sys
 from typing import TYPE_CHECKING
 
@@ -51,7 +52,7 @@ exec(
 def exec_from_one_connection(serversock) -> None:
     print_(progname, "Entering Accept loop", serversock.getsockname())
     clientsock, address = serversock.accept()
-    print_(progname, "got new connection from {} {}".format(*address))
+    print_(progname, "got new connection from", address or "unix socket")
     clientfile = clientsock.makefile("rb")
     print_("reading line")
     # rstrip so that we can use \r\n for telnet testing
@@ -71,7 +72,16 @@ def exec_from_one_connection(serversock) -> None:
 
 
 def bind_and_listen(hostport: str | tuple[str, int], execmodel: ExecModel):
+    """Listen on 'hostport', a "host:port" string or tuple, or the path
+    of a unix socket (a string without a colon)."""
     socket = execmodel.socket
+    if isinstance(hostport, str) and ":" not in hostport:
+        if os.path.exists(hostport) and stat.S_ISSOCK(os.stat(hostport).st_mode):
+            os.unlink(hostport)  # left over by a server which died
+        serversock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        serversock.bind(hostport)
+        serversock.listen(5)
+        return serversock
     if isinstance(hostport, str):
         host, port = hostport.split(":")
         hostport = (host, int(port))
@@ -109,12 +119,15 @@ def startserver(serversock, loop: bool = False) -> None:
                 break
     finally:
         print_("leaving socketserver execloop")
+        if isinstance(serversock.getsockname(), str):  # unix socket
+            os.unlink(serversock.getsockname())
         serversock.shutdown(2)
 
 
 if __name__ == "__main__":
     import sys
 
+    # a path instead of host:port listens on a unix socket
     hostport = sys.argv[1] if len(sys.argv) > 1 else ":8888"
     from execnet.gateway_base import get_execmodel
 
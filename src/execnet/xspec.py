@@ -17,16 +17,21 @@ class XSpec:
 
     # XXX allow customization, for only allow specific key names
     chdir: str | None = None
+    coalesce: str | bool | None = None
+    compress: str | bool | None = None
     dont_write_bytecode: bool | None = None
     execmodel: str | None = None
+    forkserver: str | bool | None = None
     id: str | None = None
     installvia: str | None = None
+    maxexec: str | None = None
     nice: str | None = None
     popen: bool | None = None
     python: str | None = None
     socket: str | None = None
     ssh: str | None = None
     ssh_config: str | None = None
+    unix: str | bool | None = None
     vagrant_ssh: str | None = None
     via: str | None = None
 
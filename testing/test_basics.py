@@ -3,10 +3,12 @@ from __future__ import annotations
 
 import inspect
 import os
+import struct
 import subprocess
 import sys
 import textwrap
 from collections.abc import Callable
+from collections.abc import Iterator
 from dataclasses import dataclass
 from io import BytesIO
 from pathlib import Path
@@ -22,6 +24,8 @@ from execnet.gateway_base import ChannelFactory
 from execnet.gateway_base import ExecModel
 from execnet.gateway_base import Message
 from execnet.gateway_base import Popen2IO
+from execnet.gateway_base import ReadBuffer
+from execnet.gateway_base import WorkerPool
 
 skip_win_pypy = pytest.mark.xfail(
     condition=hasattr(sys, "pypy_version_info") and sys.platform.startswith("win"),
@@ -203,18 +207,53 @@ assert s == b"x"
 def test_popen_io_readloop(execmodel: ExecModel) -> None:
     sio = BytesIO(b"test")
     io = Popen2IO(sio, sio, execmodel)
-    real_read = io._read
+    real_readinto = io._reader._readinto
 
-    def newread(numbytes: int) -> bytes:
-        if numbytes > 1:
-            numbytes = numbytes - 1
-        return real_read(numbytes)  # type: ignore[no-any-return]
+    def newreadinto(view: memoryview) -> int | None:
+        if len(view) > 1:
+            view = view[:1]
+        return real_readinto(view)
 
-    io._read = newread
+    io._reader._readinto = newreadinto
     result = io.read(3)
     assert result == b"tes"
 
 
+class TestReadBuffer:
+    def shortreads(self, data: bytes, chunksize: int = 7) -> ReadBuffer:
+        sio = BytesIO(data)
+        return ReadBuffer(lambda view: sio.readinto(view[:chunksize]), size=16)
+
+    def test_small_reads(self) -> None:
+        reader = self.shortreads(b"0123456789" * 3)
+        assert reader.read(3) == b"012"
+        assert bytes(reader.readview(9)) == b"345678901"
+        assert reader.read(16) == b"2345678901234567"
+        assert reader.read(2) == b"89"
+
+    def test_large_read(self) -> None:
+        data = bytes(range(256)) * 10
+        reader = self.shortreads(data + b"tail")
+        assert reader.read(5) == data[:5]
+        assert reader.read(len(data) - 5) == data[5:]
+        assert reader.read(4) == b"tail"
+
+    def test_eof(self) -> None:
+        reader = self.shortreads(b"abc")
+        with pytest.raises(EOFError, match="expected 4 bytes, got 3"):
+            reader.read(4)
+        reader = self.shortreads(b"abc")
+        with pytest.raises(EOFError, match="expected 100 bytes, got 3"):
+            reader.read(100)
+
+    def test_pending(self) -> None:
+        reader = self.shortreads(b"0123456789")
+        assert reader.read(2) == b"01"
+        assert reader.pending() == b"23456"
+        assert reader.pending() == b""
+        assert reader.read(3) == b"789"
+
+
 def test_rinfo_source(checker: Checker) -> None:
     out = checker.run_check(
         f"""
@@ -317,6 +356,211 @@ class TestMessage:
             assert msg.data == data
             assert isinstance(repr(msg), str)
 
+    @pytest.mark.parametrize("name", sorted(gateway_base.COMPRESSION))
+    def test_compressed_frame(self, name: str) -> None:
+        pytest.importorskip(name)
+        message = Message(Message.CHANNEL_DATA, 42, b"x" * 1000)
+        message.codec = gateway_base.COMPRESSION[name]
+        message.data = gateway_base._get_compress(message.codec)(message.data)
+        one = BytesIO()
+        message.to_io(one)  # type: ignore[arg-type]
+        msg = Message.from_io(BytesIO(one.getvalue()))
+        assert (msg.msgcode, msg.channelid, msg.data) == (
+            Message.CHANNEL_DATA,
+            42,
+            b"x" * 1000,
+        )
+
+    def test_codec_fits_header(self) -> None:
+        message = Message(max(Message._types))
+        message.codec = max(gateway_base.COMPRESSION.values())
+        msgcode = struct.unpack("!bii", message.buffers()[0])[0]
+        assert msgcode >> gateway_base._CODEC_SHIFT == message.codec
+        assert msgcode & (1 << gateway_base._CODEC_SHIFT) - 1 == message.msgcode
+
+
+def test_write_all_continues_partial_writes() -> None:
+    written = []
+
+    def writev(buffers: list[bytes]) -> int:
+        # write at most 3 bytes per call
+        data = b"".join(bytes(b) for b in buffers)[:3]
+        written.append(data)
+        return len(data)
+
+    gateway_base.write_all(writev, [b"head", b"", b"payload"])
+    assert b"".join(written) == b"headpayload"
+    assert len(written) == 4
+
+
+@pytest.mark.skipif(not hasattr(os, "writev"), reason="needs os.writev")
+def test_popen_io_writev(execmodel: ExecModel) -> None:
+    r, w = os.pipe()
+    with open(r, "rb") as infile, open(w, "wb") as outfile:
+        io = Popen2IO(outfile, infile, execmodel)
+        io.writev([b"a" * 10, b"b" * 1000])
+        io.write(b"c")
+        assert io.read(1011) == b"a" * 10 + b"b" * 1000 + b"c"
+
+
+class TestMessageWriter:
+    def test_send(self, execmodel: ExecModel) -> None:
+        out = BytesIO()
+        out.execmodel = execmodel  # type: ignore[attr-defined]
+        writer = gateway_base.MessageWriter(out)  # type: ignore[arg-type]
+        writer.send(Message(Message.CHANNEL_DATA, 3, b"data"))
+        out.seek(0)
+        msg = Message.from_io(out)
+        assert (msg.msgcode, msg.channelid, msg.data) == (
+            Message.CHANNEL_DATA,
+            3,
+            b"data",
+        )
+
+    def test_concurrent_sends_are_coalesced(self, execmodel: ExecModel) -> None:
+        if execmodel.backend == "main_thread_only":
+            pytest.skip("needs multiple threads")
+        calls: list[list[bytes]] = []
+        release = execmodel.Event()
+
+        class SlowIO:
+            def writev(self, buffers: list[bytes]) -> None:
+                calls.append(list(buffers))
+                release.wait()
+
+        io = SlowIO()
+        io.execmodel = execmodel  # type: ignore[attr-defined]
+        writer = gateway_base.MessageWriter(io)  # type: ignore[arg-type]
+        pool = WorkerPool(execmodel)
+        pool.spawn(writer.send, Message(Message.CHANNEL_DATA, 1, b"first"))
+        while not calls:
+            execmodel.sleep(0.01)
+        replies = [
+            pool.spawn(writer.send, Message(Message.CHANNEL_DATA, i, b"x"))
+            for i in range(2, 5)
+        ]
+        while len(writer._queue) < 3:
+            execmodel.sleep(0.01)
+        release.set()
+        for reply in replies:
+            reply.get(timeout=5)
+        assert len(calls) == 2
+        assert [len(buffers) for buffers in calls] == [2, 6]
+
+    def test_frames_interleave_with_other_senders(self, execmodel: ExecModel) -> None:
+        if execmodel.backend == "main_thread_only":
+            pytest.skip("needs multiple threads")
+        written: list[int] = []
+        release = execmodel.Event()
+
+        class SlowIO:
+            def writev(self, buffers: list[bytes]) -> None:
+                for header in buffers[::2]:
+                    written.append(struct.unpack("!bii", header)[0])
+                release.wait()
+
+        io = SlowIO()
+        io.execmodel = execmodel  # type: ignore[attr-defined]
+        writer = gateway_base.MessageWriter(io)  # type: ignore[arg-type]
+
+        def send_frames() -> None:
+            for i in range(3):
+                writer.send(Message(Message.CHANNEL_DATA_PART, 1, b"%d" % i))
+            writer.send(Message(Message.CHANNEL_DATA, 1, b"last"))
+
+        pool = WorkerPool(execmodel)
+        bulk = pool.spawn(send_frames)
+        while not written:
+            execmodel.sleep(0.01)
+        small = pool.spawn(writer.send, Message(Message.CHANNEL_CLOSE, 3))
+        while not writer._queue:
+            execmodel.sleep(0.01)
+        release.set()
+        bulk.get(timeout=5)
+        small.get(timeout=5)
+        part, data, close = (
+            Message.CHANNEL_DATA_PART,
+            Message.CHANNEL_DATA,
+            Message.CHANNEL_CLOSE,
+        )
+        assert written == [part, close, part, part, data]
+
+    def test_error_is_reported_to_all_senders(self, execmodel: ExecModel) -> None:
+        class BrokenIO:
+            def write(self, data: bytes) -> None:
+                raise OSError("broken")
+
+        io = BrokenIO()
+        io.execmodel = execmodel  # type: ignore[attr-defined]
+        writer = gateway_base.MessageWriter(io)  # type: ignore[arg-type]
+        for i in range(2):
+            with pytest.raises(OSError, match="broken"):
+                writer.send(Message(Message.CHANNEL_DATA, 1, b"x"))
+
+
+class TestMessageWriterSender:
+    @pytest.fixture
+    def written(self, execmodel: ExecModel) -> list[list[Message]]:
+        if execmodel.backend == "main_thread_only":
+            pytest.skip("needs a sender thread")
+        return []
+
+    @pytest.fixture
+    def writer(
+        self, execmodel: ExecModel, written: list[list[Message]]
+    ) -> Iterator[gateway_base.MessageWriter]:
+        class RecordingIO:
+            def writev(self, buffers: list[bytes]) -> None:
+                stream = BytesIO(b"".join(buffers))
+                messages = []
+                while stream.tell() < len(stream.getvalue()):
+                    messages.append(Message.from_io(stream))
+                written.append(messages)
+
+        io = RecordingIO()
+        io.execmodel = execmodel  # type: ignore[attr-defined]
+        writer = gateway_base.MessageWriter(io)  # type: ignore[arg-type]
+        writer.start_sender(latency=60)
+        yield writer
+        writer.stop_sender()
+
+    def test_data_is_coalesced(
+        self, writer: gateway_base.MessageWriter, written: list[list[Message]]
+    ) -> None:
+        for i in range(3):
+            writer.send(Message(Message.CHANNEL_DATA, 1, b"%d" % i))
+        assert not written
+        writer.send(Message(Message.CHANNEL_CLOSE, 1))
+        assert len(written) == 1
+        assert [m.msgcode for m in written[0]] == [Message.CHANNEL_DATA] * 3 + [
+            Message.CHANNEL_CLOSE
+        ]
+        assert [m.data for m in written[0][:3]] == [b"0", b"1", b"2"]
+
+    def test_status_skips_data(
+        self, writer: gateway_base.MessageWriter, written: list[list[Message]]
+    ) -> None:
+        writer.send(Message(Message.CHANNEL_DATA, 1, b"x"))
+        writer.send(Message(Message.STATUS, 3))
+        assert [m.msgcode for m in written[0]] == [Message.STATUS, Message.CHANNEL_DATA]
+
+    def test_full_batch_is_written(
+        self, writer: gateway_base.MessageWriter, written: list[list[Message]]
+    ) -> None:
+        writer.send(Message(Message.CHANNEL_DATA, 1, b"x" * writer.batchsize))
+        writer.stop_sender()
+        assert len(written) == 1
+
+    def test_stop_writes_queued_data(
+        self, writer: gateway_base.MessageWriter, written: list[list[Message]]
+    ) -> None:
+        writer.send(Message(Message.CHANNEL_DATA, 1, b"x"))
+        writer.stop_sender()
+        assert len(written) == 1
+        # afterwards messages are written directly
+        writer.send(Message(Message.CHANNEL_DATA, 1, b"y"))
+        assert len(written) == 2
+
 
 class TestPureChannel:
     @pytest.fixture
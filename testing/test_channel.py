@@ -4,7 +4,9 @@ mostly functional tests of gateways.
 
 from __future__ import annotations
 
+import asyncio
 import time
+from collections.abc import Callable
 
 import pytest
 
@@ -16,6 +18,22 @@ needs_osdup = pytest.mark.skipif("not hasattr(os, 'dup')")
 TESTTIMEOUT = 10.0  # seconds
 
 
+async def double_items(channel) -> None:
+    async for item in channel:
+        channel.send(item * 2)
+
+
+async def sleep_until_cancelled(channel) -> None:
+    import asyncio
+
+    channel.send(1)
+    try:
+        await asyncio.sleep(60)
+    except asyncio.CancelledError:
+        channel.send("cleanup")
+        raise
+
+
 class TestChannelBasicBehaviour:
     def test_serialize_error(self, gw: Gateway) -> None:
         ch = gw.remote_exec("channel.send(ValueError(42))")
@@ -307,6 +325,208 @@ class TestChannelBasicBehaviour:
         channel.waitclose()
 
 
+class TestChannelFlowControl:
+    def test_window_blocks_sender(self, gw: Gateway) -> None:
+        channel = gw.remote_exec(
+            """
+            report = channel.receive()
+            channel.send(1)
+            channel.send(2)
+            try:
+                channel.send(3, timeout=0.2)
+            except channel.TimeoutError:
+                report.send("blocked")
+                channel.send(3)
+            report.send("sent")
+        """
+        )
+        report = gw.newchannel()
+        channel.setwindow(2)
+        channel.send(report)
+        assert report.receive(TESTTIMEOUT) == "blocked"
+        assert channel.receive(TESTTIMEOUT) == 1
+        assert report.receive(TESTTIMEOUT) == "sent"
+        assert channel.receive(TESTTIMEOUT) == 2
+        assert channel.receive(TESTTIMEOUT) == 3
+        channel.waitclose(TESTTIMEOUT)
+
+    def test_window_removed(self, gw: Gateway) -> None:
+        channel = gw.remote_exec(
+            """
+            channel.receive()
+            for i in range(10):
+                channel.send(i, timeout=5.0)
+            channel.receive()
+        """
+        )
+        channel.setwindow(1)
+        channel.setwindow(None)
+        channel.send(None)
+        # no item was consumed, so the window must have been lifted
+        for i in range(10):
+            assert channel.receive(TESTTIMEOUT) == i
+        channel.send(None)
+        channel.waitclose(TESTTIMEOUT)
+
+    def test_window_consumed_by_callback(self, gw: Gateway) -> None:
+        channel = gw.remote_exec(
+            """
+            channel.receive()
+            for i in range(100):
+                channel.send(i)
+        """
+        )
+        items: list[object] = []
+        channel.setwindow(1)
+        channel.setcallback(items.append)
+        channel.send(None)
+        channel.waitclose(TESTTIMEOUT)
+        assert items == list(range(100))
+
+    def test_close_wakes_blocked_sender(self, gw: Gateway) -> None:
+        channel = gw.remote_exec(
+            """
+            report = channel.receive()
+            channel.send(1)
+            report.send("sending")
+            try:
+                channel.send(2)
+            except OSError:
+                report.send("unblocked")
+        """
+        )
+        report = gw.newchannel()
+        channel.setwindow(1)
+        channel.send(report)
+        assert report.receive(TESTTIMEOUT) == "sending"
+        channel.close()
+        assert report.receive(TESTTIMEOUT) == "unblocked"
+
+
+class TestChannelLargeItems:
+    def test_send_in_frames(self, gw: Gateway, monkeypatch: pytest.MonkeyPatch) -> None:
+        monkeypatch.setattr(Channel, "_FRAMESIZE", 100)
+        channel = gw.remote_exec(
+            """
+            channel._FRAMESIZE = 100
+            for item in channel:
+                channel.send(item)
+        """
+        )
+        items = [b"x" * 1000, "y" * 250, {"data": [b"z" * 99, "", 1] * 30}, 1]
+        for item in items:
+            channel.send(item)
+            assert channel.receive(TESTTIMEOUT) == item
+        channel.close()
+        channel.waitclose(TESTTIMEOUT)
+
+    def test_send_in_frames_callback(self, gw: Gateway) -> None:
+        channel = gw.remote_exec(
+            """
+            channel._FRAMESIZE = 7
+            channel.send(b"a" * 100)
+            channel.send(b"b" * 70)
+        """
+        )
+        items: list[object] = []
+        channel.setcallback(items.append)
+        channel.waitclose(TESTTIMEOUT)
+        assert items == [b"a" * 100, b"b" * 70]
+
+
+class TestChannelAsync:
+    def test_areceive_many_channels(self, gw: Gateway) -> None:
+        channels = [
+            gw.remote_exec("channel.send(channel.receive() * 2)") for i in range(50)
+        ]
+
+        async def receive_all() -> list[object]:
+            return list(
+                await asyncio.gather(*[ch.areceive(TESTTIMEOUT) for ch in channels])
+            )
+
+        # the items are sent while the event loop waits for them
+        for i, channel in enumerate(channels):
+            channel.send(i)
+        assert asyncio.run(receive_all()) == [i * 2 for i in range(50)]
+        for channel in channels:
+            channel.waitclose(TESTTIMEOUT)
+
+    def test_async_iteration_and_awaitclose(self, gw: Gateway) -> None:
+        channel = gw.remote_exec("for i in range(5): channel.send(i)")
+
+        async def receive_all() -> list[object]:
+            items = [item async for item in channel]
+            await channel.awaitclose(TESTTIMEOUT)
+            return items
+
+        assert asyncio.run(receive_all()) == list(range(5))
+
+    def test_areceive_timeout(self, gw: Gateway) -> None:
+        channel = gw.remote_exec("channel.receive()")
+
+        async def receive() -> None:
+            with pytest.raises(channel.TimeoutError):
+                await channel.areceive(0.05)
+
+        asyncio.run(receive())
+        assert not channel._waiters
+        channel.send(None)
+        channel.waitclose(TESTTIMEOUT)
+
+    def test_awaitclose_remote_error(self, gw: Gateway) -> None:
+        channel = gw.remote_exec("channel.receive(); raise ValueError(42)")
+
+        async def waitclose() -> None:
+            await asyncio.sleep(0.01)
+            channel.send(None)
+            with pytest.raises(channel.RemoteError, match="ValueError"):
+                await channel.awaitclose(TESTTIMEOUT)
+
+        asyncio.run(waitclose())
+
+    def test_remote_async_function(self, gw: Gateway) -> None:
+        if gw.remote_status().execmodel != "thread":
+            pytest.skip("async functions need the 'thread' execution model")
+        channels = [gw.remote_exec(double_items) for i in range(100)]
+        for i, channel in enumerate(channels):
+            channel.send(i)
+        for i, channel in enumerate(channels):
+            assert channel.receive(TESTTIMEOUT) == i * 2
+        # all wait in the event loop of the worker
+        assert gw.remote_status().numexecuting >= 100
+        for channel in channels:
+            channel.close()
+        for _ in range(100):
+            if not gw.remote_status().numexecuting:
+                break
+            time.sleep(0.05)
+        else:
+            pytest.fail("async functions did not finish")
+
+    def test_remote_async_function_unsupported(
+        self, makegateway: Callable[[str], Gateway]
+    ) -> None:
+        gw = makegateway("popen//execmodel=main_thread_only")
+        channel = gw.remote_exec(double_items)
+        with pytest.raises(channel.RemoteError, match="'thread' execution model"):
+            channel.waitclose(TESTTIMEOUT)
+
+    def test_remote_async_function_cancel(self, gw: Gateway) -> None:
+        if gw.remote_status().execmodel != "thread":
+            pytest.skip("async functions need the 'thread' execution model")
+        channel = gw.remote_exec(sleep_until_cancelled)
+        assert channel.receive(TESTTIMEOUT) == 1
+        channel.cancel()
+        assert channel.receive(TESTTIMEOUT) == "cleanup"
+        with pytest.raises(channel.RemoteError, match="TaskCancelled"):
+            channel.waitclose(TESTTIMEOUT)
+        channel = gw.remote_exec(sleep_until_cancelled)
+        channel.cancel(after=0.1)
+        assert channel.receive(TESTTIMEOUT) == 1
+        assert channel.receive(TESTTIMEOUT) == "cleanup"
+
+
 class TestChannelFile:
     def test_channel_file_write(self, gw: Gateway) -> None:
         channel = gw.remote_exec(
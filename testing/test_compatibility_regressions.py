@@ -29,4 +29,7 @@ def test_opcodes() -> None:
         # causes a regression since it was ordered in
         # between CHANNEL and FALSE as "C" moving the other items
         "COMPLEX": b"T",
+        # added in 2.2 for strings longer than 2 GiB
+        "BIGBYTES": b"U",
+        "BIGPY3STRING": b"V",
     }
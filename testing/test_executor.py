@@ -0,0 +1,199 @@
+"""
+tests for the concurrent.futures Executor over gateway Groups
+"""
+
+from __future__ import annotations
+
+import time
+from concurrent import futures
+from functools import partial
+from typing import cast
+
+import pytest
+
+import execnet
+from execnet.gateway import Gateway
+from execnet.multi import Group
+from execnet.scheduler import Scheduler
+from execnet.scheduler import Task
+from execnet.scheduler import WorkStealingScheduler
+
+
+def square(x):
+    return x * x
+
+
+def getpid(delay):
+    import os
+    import time
+
+    time.sleep(delay)
+    return os.getpid()
+
+
+def fail(message):
+    raise ValueError(message)
+
+
+def degraded(x):
+    import os
+    import time
+
+    time.sleep(2.0 if os.environ.get("DEGRADED") else 0.01)
+    return x
+
+
+@pytest.fixture
+def group(group_function: Group) -> Group:
+    group_function.makegateways(["popen", "popen"])
+    return group_function
+
+
+class TestExecutor:
+    def test_submit(self, group: Group) -> None:
+        with execnet.Executor(group) as executor:
+            assert executor.submit(square, 3).result() == 9
+            future = executor.submit(fail, "oops")
+            with pytest.raises(execnet.RemoteError, match="ValueError: oops"):
+                future.result()
+        assert len(group) == 2
+
+    def test_map(self, group: Group) -> None:
+        with execnet.Executor(group) as executor:
+            assert list(executor.map(square, range(10))) == [x * x for x in range(10)]
+            results = executor.map(square, range(25), chunksize=4, ordered=False)
+            assert sorted(results) == [x * x for x in range(25)]
+            results = executor.map(getpid, [0.5, 0.0], ordered=False)
+            assert len(set(results)) == 2
+            with pytest.raises(futures.TimeoutError):
+                list(executor.map(getpid, [1.0], timeout=0.1))
+            with pytest.raises(ValueError):
+                executor.map(square, range(10), chunksize=0)
+
+    def test_balances_by_outstanding_tasks(self, group: Group) -> None:
+        with execnet.Executor(group, max_pending=1) as executor:
+            slow = executor.submit(getpid, 1.0)
+            pids = {future.result() for future in [executor.submit(getpid, 0.0)] * 5}
+            assert not slow.done()
+            assert slow.result() not in pids
+
+    def test_shutdown(self, group: Group) -> None:
+        executor = execnet.Executor(group, max_pending=1)
+        fs = [executor.submit(getpid, 0.2) for _ in range(6)]
+        executor.shutdown(cancel_futures=True)
+        assert any(future.cancelled() for future in fs)
+        assert all(future.done() for future in fs)
+        with pytest.raises(RuntimeError):
+            executor.submit(square, 1)
+
+    def test_gateways_going_away(self, group: Group) -> None:
+        executor = execnet.Executor(group)
+        fs = [executor.submit(getpid, 0.5) for _ in range(2)]
+        group.terminate(timeout=0.1)
+        for future in fs:
+            # the gateways may also be gone before the tasks were sent
+            with pytest.raises((EOFError, execnet.RemoteError, futures.BrokenExecutor)):
+                future.result(timeout=10)
+        with pytest.raises(futures.BrokenExecutor):
+            executor.submit(square, 2).result(timeout=10)
+        executor.shutdown()
+
+    def test_invalid_functions(self, group: Group) -> None:
+        with execnet.Executor(group) as executor:
+            with pytest.raises(ValueError, match="lambda"):
+                executor.submit(lambda: 1)
+            with pytest.raises(execnet.DumpError):
+                executor.submit(square, object()).result()
+            with pytest.raises(TypeError, match="only functions"):
+                executor.submit(len, [1])
+            with pytest.raises(TypeError, match="only functions"):
+                executor.submit(partial(square, 2))
+
+    def test_shutdown_from_callback(self, group: Group) -> None:
+        executor = execnet.Executor(group)
+        future = executor.submit(square, 2)
+        future.add_done_callback(lambda future: executor.shutdown())
+        assert future.result(timeout=10) == 4
+        executor.shutdown()
+        with pytest.raises(RuntimeError):
+            executor.submit(square, 1)
+
+    def test_own_group(self) -> None:
+        executor = execnet.Executor(max_workers=2)
+        assert len(executor.group) == 2
+        assert executor.submit(square, 4).result() == 16
+        executor.shutdown()
+        assert not executor.group
+        with pytest.raises(ValueError, match="no gateways"):
+            execnet.Executor(Group())
+
+
+class TestScheduler:
+    def test_stats(self, group: Group) -> None:
+        with execnet.Executor(group) as executor:
+            list(executor.map(getpid, [0.1] * 4))
+        stats = executor.scheduler.stats()
+        assert sorted(stats) == ["gw0", "gw1"]
+        assert sum(gwstats["done"] for gwstats in stats.values()) == 4
+        for gwstats in stats.values():
+            assert gwstats["sent"] == gwstats["done"] == 2
+            assert gwstats["queued"] == gwstats["outstanding"] == 0
+            assert 0.1 <= gwstats["busy"] < 1.0
+
+    def test_work_stealing(self, group: Group) -> None:
+        scheduler = WorkStealingScheduler()
+        with execnet.Executor(group, scheduler=scheduler) as executor:
+            slow = executor.submit(getpid, 1.0)
+            quick = [executor.submit(getpid, 0.0) for _ in range(7)]
+            pids = {future.result() for future in quick}
+            assert not slow.done()
+            assert pids == {quick[0].result()} != {slow.result()}
+        slowstats, quickstats = sorted(
+            scheduler.stats().values(), key=lambda gwstats: gwstats["done"]
+        )
+        assert slowstats["done"] == 1
+        assert quickstats["done"] == 7
+        assert quickstats["stolen"] >= 1
+        # a task sent behind the slow one was handed back
+        assert slowstats["sent"] == 2
+
+    def test_cancelled_tasks_are_not_stolen(self) -> None:
+        class PseudoGateway:
+            def __init__(self, id: str) -> None:
+                self.id = id
+
+        busy = cast("Gateway", PseudoGateway("busy"))
+        idle = cast("Gateway", PseudoGateway("idle"))
+        scheduler = WorkStealingScheduler(max_pending=1)
+        scheduler.join(busy)
+        tasks = [
+            Task(i, futures.Future(), square, [((i,), None)], True) for i in range(4)
+        ]
+        for task in tasks:
+            scheduler.submit(task)
+        assert scheduler.schedule() == [(busy, tasks[0])]
+        for task in tasks[1:]:
+            task.future.cancel()
+        scheduler.join(idle)
+        assert scheduler.schedule() == []
+        assert scheduler.stats()["idle"]["stolen"] == 0
+
+    def test_hedging(self, group_function: Group) -> None:
+        group_function.makegateways(["popen", "popen//env:DEGRADED=1"])
+        scheduler = Scheduler(max_pending=1, hedge=90)
+        scheduler.hedge_samples = 5
+        with execnet.Executor(group_function, scheduler=scheduler) as executor:
+            start = time.monotonic()
+            assert list(executor.map(degraded, range(20))) == list(range(20))
+            assert time.monotonic() - start < 1.5
+        stats = scheduler.stats()
+        assert stats["gw0"]["hedged"] == 1
+        assert stats["gw1"]["done"] == 0
+
+    def test_invalid_arguments(self, group: Group) -> None:
+        with pytest.raises(ValueError, match="max_pending"):
+            WorkStealingScheduler(max_pending=0)
+        with pytest.raises(ValueError, match="percentile"):
+            Scheduler(hedge=100)
+        with pytest.raises(ValueError, match="max_pending"):
+            execnet.Executor(group, max_pending=1, scheduler=WorkStealingScheduler())
@@ -4,11 +4,13 @@ mostly functional tests of gateways.
 
 from __future__ import annotations
 
+import importlib.util
 import os
 import pathlib
 import shutil
 import signal
 import sys
+import time
 from collections.abc import Callable
 from textwrap import dedent
 
@@ -16,6 +18,7 @@ import pytest
 
 import execnet
 from execnet import gateway_base
+from execnet import gateway_bootstrap
 from execnet import gateway_io
 from execnet.gateway import Gateway
 
@@ -48,8 +51,17 @@ class TestBasicGateway:
         assert name == "__channelexec__"
 
     def test_gateway_status_simple(self, gw: Gateway) -> None:
-        status = gw.remote_status()
-        assert status.numexecuting == 0
+        # executions of earlier tests may still be finishing
+        for i in range(100):
+            status = gw.remote_status()
+            if status.numexecuting == 0:
+                break
+            time.sleep(0.05)
+        else:
+            pytest.fail(f"still {status.numexecuting} executions")
+        # not reported on all platforms
+        assert status.rss is None or status.rss > 0
+        assert status.maxrss is None or status.maxrss > 0
 
     def test_exc_info_is_clear_after_gateway_startup(self, gw: Gateway) -> None:
         ch = gw.remote_exec(
@@ -81,14 +93,17 @@ class TestBasicGateway:
         numchannels = gw.remote_status().numchannels
         ch1 = gw.remote_exec("channel.send(1); channel.receive()")
         ch2 = gw.remote_exec("channel.receive()")
-        ch1.receive()
-        status = gw.remote_status()
-        assert status.numexecuting == 2  # number of active execution threads
-        assert status.numchannels == numchannels + 2
-        ch1.send(None)
-        ch2.send(None)
-        ch1.waitclose()
-        ch2.waitclose()
+        try:
+            ch1.receive()
+            status = gw.remote_status()
+            assert status.numexecuting == 2  # number of active execution threads
+            assert status.numchannels == numchannels + 2
+        finally:
+            # don't leave executions behind for the other tests of gw
+            ch1.send(None)
+            ch2.send(None)
+            ch1.waitclose(TESTTIMEOUT)
+            ch2.waitclose(TESTTIMEOUT)
         for i in range(10):
             status = gw.remote_status()
             if status.numexecuting == 0:
@@ -98,6 +113,11 @@ class TestBasicGateway:
         # race condition
         assert status.numchannels <= numchannels
 
+    def test_features(self, gw: Gateway) -> None:
+        assert gw.features == gateway_base.local_features()
+        channel = gw.remote_exec("channel.send(sorted(channel.gateway._features))")
+        assert channel.receive() == sorted(gw.features)
+
     def test_remote_exec_module(self, tmp_path: pathlib.Path, gw: Gateway) -> None:
         p = tmp_path / "remotetest.py"
         p.write_text("channel.send(1)")
@@ -111,6 +131,52 @@ class TestBasicGateway:
         name = channel.receive()
         assert name == 2
 
+    def test_remote_exec_caches_code(self, gw: Gateway) -> None:
+        sent: list[bytes] = []
+        send = gw._send
+
+        def record(msgcode: int, channelid: int = 0, data: bytes = b"") -> None:
+            if msgcode == gateway_base.Message.CHANNEL_EXEC:
+                sent.append(data)
+            send(msgcode, channelid, data)
+
+        gw._send = record  # type: ignore[method-assign]
+        source = "import sys; channel.send(id(sys._getframe().f_code))"
+        codeids = [gw.remote_exec(source).receive() for _ in range(3)]
+        # the source went over once, and was compiled once
+        sources = [gateway_base.loads_internal(data)[0] for data in sent]
+        assert sources == [source, None, None]
+        assert len(set(codeids)) == 1
+
+    def test_remote_exec_codecache_size(
+        self, gw: Gateway, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        monkeypatch.setattr(execnet.gateway, "CODECACHE_SIZE", 2)
+        for i in range(4):
+            channel = gw.remote_exec(
+                f"channel.send(len(channel.gateway._codecache))  # {i}"
+            )
+            assert channel.receive() <= 2
+        assert len(gw._sentcode) == 2
+
+    def test_remote_exec_function_source_is_memoized(
+        self, gw: Gateway, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        calls = []
+        find_globals = execnet.gateway._find_non_builtin_globals
+
+        def counting(*args):
+            calls.append(args)
+            return find_globals(*args)
+
+        monkeypatch.setattr(execnet.gateway, "_find_non_builtin_globals", counting)
+
+        def func(channel, arg) -> None:
+            channel.send(arg)
+
+        assert [gw.remote_exec(func, arg=i).receive() for i in range(3)] == [0, 1, 2]
+        assert len(calls) == 1
+
     def test_remote_exec_module_is_removed(
         self, gw: Gateway, tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
     ) -> None:
@@ -218,6 +284,86 @@ class TestBasicGateway:
             channel.waitclose(TESTTIMEOUT)
         assert "explicit" in excinfo.value.formatted
 
+    def test_remote_exec_cancel(self, gw: Gateway) -> None:
+        busy = gw.remote_exec("channel.send(1)\nwhile 1: pass")
+        waiting = gw.remote_exec("channel.send(1)\nchannel.receive()")
+        for channel in busy, waiting:
+            assert channel.receive(TESTTIMEOUT) == 1
+            channel.cancel()
+            with pytest.raises(channel.RemoteError, match="TaskCancelled"):
+                channel.waitclose(TESTTIMEOUT)
+        # cancelling a closed channel does nothing
+        channel.cancel()
+
+    def test_remote_exec_cancel_cleanup(self, gw: Gateway) -> None:
+        channel = gw.remote_exec(
+            """
+            try:
+                channel.send(1)
+                while 1: pass
+            except channel.TaskCancelled:
+                channel.send("cleanup")
+            """
+        )
+        assert channel.receive(TESTTIMEOUT) == 1
+        channel.cancel()
+        assert channel.receive(TESTTIMEOUT) == "cleanup"
+        channel.waitclose(TESTTIMEOUT)
+
+    def test_remote_exec_cancel_while_communicating(self, gw: Gateway) -> None:
+        # cancellations arriving in execnet code leave the worker threads
+        # cancellable and the number of executions right
+        for i in range(20):
+            channel = gw.remote_exec(
+                """
+                channel.send(1)
+                while 1:
+                    channel.send(None)
+                    try:
+                        channel.receive(0.001)
+                    except channel.TimeoutError:
+                        pass
+                """
+            )
+            assert channel.receive(TESTTIMEOUT) == 1
+            time.sleep(i * 0.001)
+            channel.cancel()
+            with pytest.raises(channel.RemoteError, match="TaskCancelled"):
+                channel.waitclose(TESTTIMEOUT)
+        channel = gw.remote_exec("channel.send(1)\nwhile 1: pass")
+        assert channel.receive(TESTTIMEOUT) == 1
+        channel.cancel()
+        with pytest.raises(channel.RemoteError, match="TaskCancelled"):
+            channel.waitclose(TESTTIMEOUT)
+        for _ in range(100):
+            if not gw.remote_status().numexecuting:
+                break
+            time.sleep(0.05)
+        assert gw.remote_status().numexecuting == 0
+
+    def test_remote_exec_deadline(self, gw: Gateway) -> None:
+        channel = gw.remote_exec("channel.send(1)\nwhile 1: pass")
+        channel.cancel(after=0.2)
+        assert channel.receive(TESTTIMEOUT) == 1
+        with pytest.raises(channel.RemoteError, match="TaskCancelled"):
+            channel.waitclose(TESTTIMEOUT)
+        channel = gw.remote_exec("channel.send(channel.receive())")
+        channel.cancel(after=5.0)
+        channel.send(3)
+        assert channel.receive(TESTTIMEOUT) == 3
+        channel.waitclose(TESTTIMEOUT)
+
+    def test_remote_exec_function_option_arguments(self, gw: Gateway) -> None:
+        def echo(channel, deadline, priority):
+            channel.send((deadline, priority))
+
+        channel = gw.remote_exec(echo, deadline=1.5, priority=3)
+        assert channel.receive(TESTTIMEOUT) == (1.5, 3)
+        channel.waitclose(TESTTIMEOUT)
+        channel = gw.remote_exec_ex(echo, {"deadline": 2, "priority": 4})
+        assert channel.receive(TESTTIMEOUT) == (2, 4)
+        channel.waitclose(TESTTIMEOUT)
+
     def test_remote_exec_channel_anonymous(self, gw: Gateway) -> None:
         channel = gw.remote_exec(
             """
@@ -273,8 +419,8 @@ class TestBasicGateway:
             """
             import os.path
             cwd = os.getcwd()
-            channel.send(os.path.basename(cwd))
             os.chdir('..')
+            channel.send(os.path.basename(cwd))
         """
         ).receive()
         try:
@@ -287,6 +433,76 @@ class TestBasicGateway:
             gw.remote_exec("import os ; os.chdir(%r)" % old).waitclose()
 
 
+class TestRPC:
+    def test_register_and_call(self, gw: Gateway) -> None:
+        def power(base, exponent=2):
+            return [base**exponent, __name__]
+
+        gw.register(power)
+        gw.register(power, name="pow")
+        assert gw.call("power", 3) == [9, "__channelexec__"]
+        assert gw.call("pow", 2, exponent=10) == [1024, "__channelexec__"]
+
+    def test_reregister(self, gw: Gateway) -> None:
+        def one():
+            return 1
+
+        def two():
+            return 2
+
+        gw.register(one, name="number")
+        assert gw.call("number") == 1
+        gw.register(two, name="number")
+        assert gw.call("number") == 2
+
+    def test_errors(self, gw: Gateway) -> None:
+        def fail(x):
+            return 1 / x
+
+        def unserializable():
+            return object()
+
+        gw.register(fail)
+        gw.register(unserializable)
+        with pytest.raises(execnet.RemoteError, match="ZeroDivisionError"):
+            gw.call("fail", 0)
+        with pytest.raises(execnet.RemoteError, match="DumpError"):
+            gw.call("unserializable")
+        with pytest.raises(LookupError, match="notregistered"):
+            gw.call("notregistered")
+        # the channel is still usable
+        assert gw.call("fail", 2) == 0.5
+
+    def test_concurrent_register(self, gw: Gateway) -> None:
+        def negate(x):
+            return -x
+
+        def square(x):
+            return x * x
+
+        def half(x):
+            return x / 2
+
+        functions = [negate, square, half]
+        pool = gateway_base.WorkerPool(gw.execmodel)
+        replies = [pool.spawn(gw.register, function) for function in functions]
+        for reply in replies:
+            reply.get(TESTTIMEOUT)
+        assert [gw.call(function.__name__, 4) for function in functions] == [-4, 16, 2]
+
+    def test_call_nowait_pipelines(self, gw: Gateway) -> None:
+        def double(x):
+            return 2 * x
+
+        gw.register(double)
+        numchannels = gw.remote_status().numchannels
+        replies = [gw.call_nowait("double", i) for i in range(100)]
+        assert [reply.get(TESTTIMEOUT) for reply in replies] == list(range(0, 200, 2))
+        # all went over the channel of the registration, channels
+        # of other tests may have been closed meanwhile
+        assert gw.remote_status().numchannels <= numchannels
+
+
 class TestPopenGateway:
     gwtype = "popen"
 
@@ -320,12 +536,100 @@ class TestPopenGateway:
             ret = channel.receive()
             assert ret == 42
 
+    def test_features_unsupported_by_remote(
+        self, makegateway: Callable[[str], Gateway]
+    ) -> None:
+        gw = makegateway("popen")
+        # pretend the remote side predates feature negotiation
+        gw.remote_exec(
+            """
+            del channel.gateway.__class__.__bases__[0]._agree_features
+            channel.gateway._features = frozenset()
+        """
+        ).waitclose()
+        gw._negotiate_features()
+        assert gw.features == frozenset()
+        channel = gw.remote_exec("for item in channel: channel.send(item)")
+        channel.setwindow(1)  # ignored
+        item = b"x" * (channel._FRAMESIZE * 2)
+        for i in range(3):
+            channel.send(item)
+        for i in range(3):
+            assert channel.receive() == item
+        channel.close()
+        channel.waitclose()
+        with pytest.raises(OSError, match="cancelling"):
+            channel.cancel()
+        with pytest.raises(OSError, match="cancelling"):
+            channel.cancel(after=1.0)
+        with pytest.raises(OSError, match="priorities"):
+            gw.remote_exec_ex("pass", priority=1)
+        with pytest.raises(OSError, match="limits"):
+            gw.setexeclimit(1)
+
+    def test_exec_limit(self, makegateway: Callable[[str], Gateway]) -> None:
+        gw = makegateway("popen//maxexec=1")
+        blocker = gw.remote_exec("channel.send(1)\nchannel.receive()")
+        assert blocker.receive(TESTTIMEOUT) == 1
+        channels = [
+            gw.remote_exec_ex("channel.send(%d)" % priority, priority=priority)
+            for priority in (0, 5, 1, 5, 9)
+        ]
+        status = gw.remote_status()
+        assert status.execlimit == 1
+        assert status.numexecuting == 1
+        assert status.numqueued == 5
+        waited = status.numwaited
+        blocker.send(None)
+        queue = execnet.MultiChannel(channels).make_receive_queue()
+        # higher priorities first, in order of arrival otherwise
+        assert [queue.get(timeout=TESTTIMEOUT)[1] for _ in channels] == [9, 5, 5, 1, 0]
+        status = gw.remote_status()
+        assert status.numqueued == 0
+        assert status.numwaited == waited + 5
+        assert 0 < status.maxqueuewait <= status.queuewait
+        with pytest.raises(ValueError):
+            gw.setexeclimit(0)
+
+    def test_exec_limit_raised(self, makegateway: Callable[[str], Gateway]) -> None:
+        gw = makegateway("popen")
+        gw.setexeclimit(1)
+        channels = [
+            gw.remote_exec("channel.send(1)\nchannel.receive()") for _ in range(3)
+        ]
+        assert channels[0].receive(TESTTIMEOUT) == 1
+        assert gw.remote_status().numqueued == 2
+        gw.setexeclimit(None)
+        for channel in channels[1:]:
+            assert channel.receive(TESTTIMEOUT) == 1
+        for channel in channels:
+            channel.send(None)
+            channel.waitclose(TESTTIMEOUT)
+        status = gw.remote_status()
+        assert status.execlimit is None
+        assert status.numwaited >= 2
+
     def test_rinfo_popen(self, gw: Gateway) -> None:
         rinfo = gw._rinfo()
         assert rinfo.executable == sys.executable
         assert rinfo.cwd == os.getcwd()
         assert rinfo.version_info == sys.version_info
 
+    def test_call_after_exit(self, makegateway: Callable[[str], Gateway]) -> None:
+        def wait():
+            import time
+
+            time.sleep(10)
+
+        gw = makegateway("popen")
+        gw.register(wait)
+        reply = gw.call_nowait("wait")
+        gw._io.kill()
+        with pytest.raises((EOFError, execnet.RemoteError, OSError)):
+            reply.get(TESTTIMEOUT)
+        with pytest.raises((EOFError, execnet.RemoteError, OSError)):
+            gw.call("wait")
+
     def test_waitclose_on_remote_killed(
         self, makegateway: Callable[[str], Gateway]
     ) -> None:
@@ -371,6 +675,49 @@ class TestPopenGateway:
         ret = channel.receive()
         assert ret
 
+    def test_bootstrap_bytecode(
+        self, monkeypatch: pytest.MonkeyPatch, makegateway: Callable[[str], Gateway]
+    ) -> None:
+        sent: list[str] = []
+
+        def sendexec(io, *sources: str) -> None:
+            sent.append("\n".join(sources))
+            orig_sendexec(io, *sources)
+
+        orig_sendexec = gateway_bootstrap.sendexec
+        monkeypatch.setattr(gateway_bootstrap, "sendexec", sendexec)
+        monkeypatch.setattr(gateway_bootstrap, "_target_magic", {})
+        spec = "popen//python=%s" % sys.executable
+        for i in range(2):
+            gw = makegateway(spec)
+            assert gw.remote_exec("channel.send(1)").receive() == 1
+        # the first gateway reported the magic number, the second got bytecode
+        assert list(gateway_bootstrap._target_magic.values()) == [
+            importlib.util.MAGIC_NUMBER
+        ]
+        assert "marshal.loads" not in sent[0]
+        assert "marshal.loads" in sent[1]
+
+    def test_bootstrap_bytecode_mismatch(
+        self, monkeypatch: pytest.MonkeyPatch, makegateway: Callable[[str], Gateway]
+    ) -> None:
+        spec = "popen//python=%s" % sys.executable
+        target = gateway_bootstrap._target(execnet.XSpec(spec))
+        # pretend a different interpreter version answered before
+        monkeypatch.setattr(importlib.util, "MAGIC_NUMBER", b"xx\r\n")
+        monkeypatch.setattr(gateway_bootstrap, "_target_magic", {target: b"xx\r\n"})
+        gw = makegateway(spec)
+        assert gw.remote_exec("channel.send(1)").receive() == 1
+        assert gateway_bootstrap._target_magic[target] != b"xx\r\n"
+        # several bootstraps at once may all find the target changed
+        gateway_bootstrap._target_magic[target] = b"xx\r\n"
+        group = execnet.Group()
+        try:
+            results = group.makegateways([spec] * 4, max_parallel=4)
+            assert all(isinstance(gw, Gateway) for gw in results), results
+        finally:
+            group.terminate()
+
 
 @pytest.mark.skipif("config.option.broken_isp")
 def test_socket_gw_host_not_found(makegateway: Callable[[str], Gateway]) -> None:
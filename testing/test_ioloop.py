@@ -0,0 +1,135 @@
+"""
+tests for serving many gateways from a single selector loop
+"""
+
+from __future__ import annotations
+
+import sys
+import time
+from collections.abc import Iterator
+
+import pytest
+
+import execnet
+from execnet.gateway_base import get_execmodel
+from execnet.ioloop import READSIZE
+from execnet.ioloop import IOLoop
+from execnet.multi import Group
+
+
+@pytest.fixture
+def group() -> Iterator[Group]:
+    group = execnet.Group(ioengine="selector")
+    yield group
+    group.terminate(timeout=5.0)
+
+
+needs_selectable_pipes = pytest.mark.skipif(
+    sys.platform == "win32", reason="pipes are not selectable on windows"
+)
+
+
+def test_unknown_ioengine() -> None:
+    with pytest.raises(ValueError):
+        execnet.Group(ioengine="nonexistent")  # type: ignore[arg-type]
+
+
+def test_ioloop_requires_thread_execmodel() -> None:
+    with pytest.raises(ValueError):
+        IOLoop(get_execmodel("gevent"))
+
+
+@needs_selectable_pipes
+def test_popen_gateways_share_one_loop(group: Group) -> None:
+    gateways = [group.makegateway("popen") for i in range(4)]
+    for gw in gateways:
+        assert gw._ioloop is group._ioloop
+        assert gw.hasreceiver()
+        # no per-gateway receiver thread got started
+        assert gw._receivepool.active_count() == 0
+    mch = group.remote_exec("channel.send(channel.receive() + 1)")
+    mch.send_each(41)
+    assert mch.receive_each() == [42] * 4
+    mch.waitclose()
+    ioloop = group._ioloop
+    assert ioloop is not None
+    group.terminate(timeout=5.0)
+    for gw in gateways:
+        assert not gw.hasreceiver()
+    assert not ioloop._running
+    assert ioloop._wakeup_recv.fileno() == -1
+    assert group._ioloop is None
+
+
+def test_close_releases_descriptors() -> None:
+    ioloop = IOLoop(get_execmodel("thread"))
+    ioloop.close()
+    assert ioloop._wakeup_recv.fileno() == ioloop._wakeup_send.fileno() == -1
+    group = execnet.Group(ioengine="selector")
+    grouploop = group._get_ioloop()
+    assert grouploop is not None
+    group.set_execmodel("thread")
+    assert group._ioloop is None
+    assert grouploop._wakeup_send.fileno() == -1
+
+
+@needs_selectable_pipes
+def test_large_and_many_small_messages(group: Group) -> None:
+    gw = group.makegateway("popen")
+    channel = gw.remote_exec(
+        """
+        for item in channel:
+            channel.send(item)
+        """
+    )
+    data = b"x" * (READSIZE * 3 + 17)
+    channel.send(data)
+    for i in range(1000):
+        channel.send(i)
+    assert channel.receive() == data
+    assert [channel.receive() for i in range(1000)] == list(range(1000))
+    channel.close()
+    channel.waitclose()
+
+
+@needs_selectable_pipes
+def test_callbacks_and_remote_status(group: Group) -> None:
+    gw = group.makegateway("popen")
+    channel = gw.remote_exec("for i in range(3): channel.send(i)")
+    queue = group.execmodel.queue.Queue()
+    channel.setcallback(queue.put, endmarker=None)
+    assert [queue.get(timeout=5) for i in range(4)] == [0, 1, 2, None]
+    # the worker may still finish the execution after the channel closed
+    for i in range(100):
+        if gw.remote_status().numexecuting == 0:
+            break
+        time.sleep(0.05)
+    else:
+        pytest.fail("numexecuting didn't drop to zero")
+
+
+@needs_selectable_pipes
+def test_remote_death_is_detected(group: Group) -> None:
+    gw = group.makegateway("popen")
+    channel = gw.remote_exec("import os; os._exit(0)")
+    with pytest.raises(EOFError):
+        channel.receive()
+    gw.join(timeout=5.0)
+    assert not gw.hasreceiver()
+
+
+def test_via_gateway_falls_back_to_thread(group: Group) -> None:
+    group.makegateway("popen//id=master")
+    gw = group.makegateway("popen//via=master")
+    assert gw._ioloop is None
+    assert gw._receivepool.active_count() == 1
+    assert gw.remote_exec("channel.send(1)").receive() == 1
+
+
+def test_socket_gateway(group: Group) -> None:
+    group.makegateway("popen//id=sproxy")
+    gw = group.makegateway("socket//installvia=sproxy")
+    assert gw._ioloop is group._ioloop
+    channel = gw.remote_exec("channel.send(channel.receive())")
+    channel.send(3)
+    assert channel.receive() == 3
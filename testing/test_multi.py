@@ -4,6 +4,7 @@ tests for multi channels and gateway Groups
 
 from __future__ import annotations
 
+import asyncio
 import gc
 from collections.abc import Callable
 from time import sleep
@@ -159,6 +160,70 @@ class TestGroup:
         group._cleanup_atexit()
         assert not group._gateways
 
+    def test_group_makegateways(self) -> None:
+        group = Group()
+        specs = [
+            "socket//installvia=p1//id=s1",
+            "popen//id=p1//env:NAME=value",
+            "socket=qwepoipqwe:9000//id=broken",
+            "popen//id=p2",
+        ]
+        results = group.makegateways(specs, max_parallel=2)
+        assert [getattr(x, "id", None) for x in results] == ["s1", "p1", None, "p2"]
+        assert isinstance(results[2], execnet.HostNotFound)
+        # the via gateway was made first, but the order of specs is kept
+        assert [gw.id for gw in group] == ["s1", "p1", "p2"]
+        channel = group["p1"].remote_exec("import os; channel.send(os.environ['NAME'])")
+        assert channel.receive() == "value"
+        group.terminate()
+
+    def test_group_makegateways_via_implicit_id(self) -> None:
+        group = Group(["popen", "popen//via=gw0", "popen"])
+        assert [gw.id for gw in group] == ["gw0", "gw1", "gw2"]
+        assert group["gw1"].spec.via == "gw0"
+        assert group["gw1"].remote_exec("channel.send(1)").receive() == 1
+        group.terminate()
+
+    def test_group_makegateways_invalid_max_parallel(self) -> None:
+        with pytest.raises(ValueError, match="max_parallel"):
+            Group().makegateways(["popen"], max_parallel=0)
+
+    def test_group_init_raises_failure(self) -> None:
+        with pytest.raises(ValueError):
+            Group(["not-existing-type"])
+
+    def test_group_init_terminates_made_gateways(
+        self, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        made = []
+        makegateway = Group.makegateway
+
+        def record(group: Group, spec: XSpec | str | None = None) -> Gateway:
+            gw = makegateway(group, spec)
+            made.append(gw)
+            return gw
+
+        monkeypatch.setattr(Group, "makegateway", record)
+        with pytest.raises(ValueError):
+            Group(["popen", "not-existing-type"])
+        [gw] = made
+        assert not gw.hasreceiver()
+        assert gw._io.wait() is not None
+
+    def test_group_amakegateway(self) -> None:
+        group = Group()
+
+        async def makegateways() -> list[Gateway]:
+            specs = ["popen//id=a1", "popen//id=a2", "popen//id=a3"]
+            return await asyncio.gather(*[group.amakegateway(x) for x in specs])
+
+        gateways = asyncio.run(makegateways())
+        assert sorted(gw.id for gw in gateways) == ["a1", "a2", "a3"]
+        assert sorted(gw.id for gw in group) == ["a1", "a2", "a3"]
+        for gw in gateways:
+            assert gw.remote_exec("channel.send(1)").receive() == 1
+        group.terminate()
+
     def test_group_ordering_and_termination(self) -> None:
         group = Group()
         group.makegateway("popen//id=3")
@@ -232,6 +297,80 @@ class TestGroup:
         group.terminate(1.0)
 
 
+class TestGatewayPool:
+    def test_lease_reuses_gateways(self) -> None:
+        pool = execnet.GatewayPool(["popen", "popen//env:NAME=value"], size=2)
+        assert len(pool.group) == 4
+        with pool.lease() as gw1:
+            pass
+        with pool.lease() as gw2, pool.lease() as gw3:
+            assert gw2 is gw1
+            assert gw3 is not gw1
+        with pool.lease("popen//env:NAME=value") as gw:
+            channel = gw.remote_exec("import os; channel.send(os.environ['NAME'])")
+            assert channel.receive() == "value"
+        assert len(pool.group) == 4
+        pool.close()
+        assert not pool.group
+
+    def test_lease_timeout(self) -> None:
+        pool = execnet.GatewayPool("popen")
+        with (
+            pool.lease(),
+            pytest.raises(execnet.TimeoutError),
+            pool.lease(timeout=0.1),
+        ):
+            pass
+        pool.close()
+
+    def test_invalid_specs(self) -> None:
+        with pytest.raises(ValueError, match="id"):
+            execnet.GatewayPool("popen//id=one")
+        pool = execnet.GatewayPool("popen")
+        with pytest.raises(ValueError, match="not a spec"), pool.lease("popen//x"):
+            pass
+        pool.close()
+        with pytest.raises(ValueError, match="closed"), pool.lease():
+            pass
+
+    def test_max_tasks(self) -> None:
+        group = Group()
+        pool = execnet.GatewayPool("popen", group=group, max_tasks=2)
+        ids = []
+        for _ in range(3):
+            with pool.lease() as gw:
+                ids.append(gw.id)
+        assert ids[0] == ids[1] != ids[2]
+        assert [gw.id for gw in group] == [ids[2]]
+        pool.close()
+        assert not group
+
+    def test_max_rss(self) -> None:
+        pool = execnet.GatewayPool("popen")
+        with pool.lease() as gw:
+            rss = gw.remote_status().rss
+            if rss is None:
+                pool.close()
+                pytest.skip("the current memory use is only known on Linux")
+            pool.max_rss = rss + 50 * 2**20
+            # grow the worker, writing to the pages to make them resident
+            gw.remote_exec("import sys; sys.ballast = b'x' * 100 * 2**20").waitclose()
+        with pool.lease() as newgw:
+            assert newgw is not gw
+        pool.close()
+
+    def test_unhealthy_gateway_is_replaced(self) -> None:
+        pool = execnet.GatewayPool("popen", timeout=1.0)
+        with pool.lease() as gw:
+            pass
+        gw._io.kill()
+        gw.join()
+        with pool.lease() as newgw:
+            assert newgw is not gw
+            assert newgw.remote_exec("channel.send(1)").receive() == 1
+        pool.close()
+
+
 @pytest.mark.xfail(reason="active_count() has been broken for some time")
 def test_safe_terminate(execmodel: ExecModel) -> None:
     if execmodel.backend not in ("thread", "main_thread_only"):
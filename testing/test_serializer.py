@@ -3,7 +3,9 @@ from __future__ import annotations
 import os
 import subprocess
 import sys
+import weakref
 from pathlib import Path
+from typing import Any
 
 import pytest
 
@@ -169,3 +171,41 @@ def test_tuple_nested_with_empty_in_between(dump, load) -> None:
 def test_py2_string_loads() -> None:
     """Regression test for #267."""
     assert execnet.loads(b"\x02M\x00\x00\x00\x01aQ") == b"a"
+
+
+@pytest.mark.parametrize("obj", [b"x" * 20, "€" * 10])
+def test_big_strings(monkeypatch: pytest.MonkeyPatch, obj: bytes | str) -> None:
+    from execnet import gateway_base
+
+    # strings beyond the 4 byte length limit are written with an 8 byte length
+    monkeypatch.setattr(gateway_base, "FOUR_BYTE_INT_MAX", 10)
+    dumped = execnet.dumps(obj)
+    assert dumped[1:2] in (
+        gateway_base.opcode.BIGBYTES,
+        gateway_base.opcode.BIGPY3STRING,
+    )
+    assert execnet.loads(dumped) == obj
+
+
+def test_parts_released_once_read() -> None:
+    from execnet import gateway_base
+
+    # bytes cannot be weakly referenced
+    class Part(bytearray):
+        pass
+
+    dumped = gateway_base.dumps_internal((b"x" * 100, b"y" * 100))
+    parts: list[Any] = [Part(dumped[i : i + 50]) for i in range(0, len(dumped), 50)]
+    refs = [weakref.ref(part) for part in parts]
+    io = gateway_base._PartsIO(parts)
+    assert io.read(60) == dumped[:60]
+    assert refs[0]() is None
+    assert refs[-1]() is not None
+    io.read(len(dumped))
+    assert parts == []
+    assert all(ref() is None for ref in refs)
+
+    parts = [Part(dumped[i : i + 50]) for i in range(0, len(dumped), 50)]
+    refs = [weakref.ref(part) for part in parts]
+    assert gateway_base.loads_internal(parts) == (b"x" * 100, b"y" * 100)
+    assert all(ref() is None for ref in refs)
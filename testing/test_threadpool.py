@@ -72,9 +72,8 @@ def test_waitfinish_on_reply(pool: WorkerPool) -> None:
     pytest.raises(ZeroDivisionError, reply.get)
 
 
-@pytest.mark.xfail(reason="WorkerPool does not implement limited size")
 def test_limited_size(execmodel: ExecModel) -> None:
-    pool = WorkerPool(execmodel, size=1)  # type: ignore[call-arg]
+    pool = WorkerPool(execmodel, size=1, backlog=0)
     q = execmodel.queue.Queue()
     q2 = execmodel.queue.Queue()
     q3 = execmodel.queue.Queue()
@@ -100,6 +99,50 @@ def test_limited_size(execmodel: ExecModel) -> None:
     assert pool.waitall()
 
 
+def test_reuses_threads(execmodel: ExecModel) -> None:
+    pool = WorkerPool(execmodel, idle_timeout=0.5)
+    idents = {pool.spawn(execmodel.get_ident).get(1.0) for _ in range(5)}
+    assert len(idents) == 1
+    assert pool._threads == 1
+    # the idle thread goes away
+    for _ in range(100):
+        if not pool._threads:
+            break
+        execmodel.sleep(0.02)
+    assert pool._threads == 0
+    assert pool.spawn(execmodel.get_ident).get(1.0)
+    assert pool.waitall(1.0)
+
+
+def test_size_queues_spawns(execmodel: ExecModel) -> None:
+    pool = WorkerPool(execmodel, size=2, idle_timeout=10.0)
+    q = execmodel.queue.Queue()
+
+    def f(i: int) -> int:
+        q.get()
+        return i
+
+    replies = [pool.spawn(f, i) for i in range(6)]
+    assert pool._threads == 2
+    assert pool._queued == 4
+    assert pool.active_count() == 6
+    for _ in replies:
+        q.put(None)
+    assert [reply.get(1.0) for reply in replies] == list(range(6))
+    assert pool.waitall(1.0)
+    assert pool._threads == 2
+    pool.trigger_shutdown()
+    for _ in range(100):
+        if not pool._threads:
+            break
+        execmodel.sleep(0.02)
+    assert pool._threads == 0
+    with pytest.raises(ValueError):
+        WorkerPool(execmodel, size=0)
+    with pytest.raises(ValueError, match="backlog"):
+        WorkerPool(execmodel, backlog=1)
+
+
 def test_get(pool: WorkerPool) -> None:
     def f() -> int:
         return 42
@@ -2,8 +2,10 @@ from __future__ import annotations
 
 import os
 import shutil
+import signal
 import subprocess
 import sys
+import time
 from collections.abc import Callable
 from pathlib import Path
 
@@ -165,6 +167,129 @@ class TestMakegateway:
         value = ch.receive()
         assert value == "123"
 
+    def test_popen_coalesce(self, makegateway: Callable[[str], Gateway]) -> None:
+        gw = makegateway("popen//coalesce=5")
+        assert gw._writer._sending
+        ch = gw.remote_exec(
+            """
+            assert channel.gateway._writer._sending
+            for item in channel:
+                channel.send(item)
+        """
+        )
+        for i in range(1000):
+            ch.send(i)
+        assert [ch.receive() for i in range(1000)] == list(range(1000))
+        assert gw.remote_status().numchannels == 1
+        ch.close()
+        ch.waitclose()
+
+    def test_popen_compress(self, makegateway: Callable[[str], Gateway]) -> None:
+        gw = makegateway("popen//compress")
+        assert gw._compression is not None
+        ch = gw.remote_exec(
+            """
+            assert channel.gateway._compression is not None
+            for item in channel:
+                channel.send(item)
+        """
+        )
+        for item in ["x" * 100000, b"small", list(range(1000))]:
+            ch.send(item)
+            assert ch.receive() == item
+        ch.close()
+        ch.waitclose()
+
+    def test_popen_via_compress(
+        self, makegateway: Callable[[str], Gateway], monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        makegateway("popen//id=master")
+        gw = makegateway("popen//via=master//compress")
+        read, write = gw._io.read, gw._io.write
+        counts = {"read": 0, "write": 0}
+
+        def counting_read(nbytes: int) -> bytes:
+            data = read(nbytes)
+            counts["read"] += len(data)
+            return data
+
+        def counting_write(data: bytes) -> None:
+            counts["write"] += len(data)
+            write(data)
+
+        monkeypatch.setattr(gw._io, "read", counting_read)
+        monkeypatch.setattr(gw._io, "write", counting_write)
+        ch = gw.remote_exec("channel.send(channel.receive())")
+        item = b"x" * 3000000
+        ch.send(item)
+        assert ch.receive() == item
+        ch.waitclose()
+        # the proxy passes the compressed frames on in both directions
+        assert counts["write"] < 100000
+        assert counts["read"] < 100000
+
+    def test_popen_compress_unknown(
+        self, makegateway: Callable[[str], Gateway]
+    ) -> None:
+        with pytest.raises(ValueError, match="unknown compression 'snappy'"):
+            makegateway("popen//compress=snappy")
+
+    @pytest.mark.parametrize("key", ["maxexec", "maxexec=0", "maxexec=two"])
+    def test_popen_maxexec_invalid(
+        self, key: str, group_function: execnet.Group
+    ) -> None:
+        with pytest.raises(ValueError, match="maxexec"):
+            group_function.makegateway("popen//" + key)
+        assert not group_function
+
+    @pytest.mark.skipif("sys.platform == 'win32'")
+    def test_popen_forkserver(
+        self, tmp_path: Path, makegateway: Callable[[str], Gateway]
+    ) -> None:
+        spec = "popen//forkserver=json//chdir=%s//env:FORKED=1" % tmp_path
+        gw1 = makegateway(spec)
+        gw2 = makegateway(spec)
+        assert type(gw1._io).__name__ == "ForkedIOMaster"
+        source = """
+            import os, sys
+            channel.send((os.getpid(), "json" in sys.modules,
+                          os.getcwd(), os.environ["FORKED"]))
+            channel.send(channel.receive())
+        """
+        pids = set()
+        for gw in [gw1, gw2]:
+            ch = gw.remote_exec(source)
+            pid, preloaded, cwd, env = ch.receive()
+            assert preloaded
+            assert cwd == str(tmp_path.resolve())
+            assert env == "1"
+            ch.send([1, "two"])
+            assert ch.receive() == [1, "two"]
+            pids.add(pid)
+        assert len(pids) == 2
+        assert len(gw1._group._forkservers) == 1
+
+    @pytest.mark.skipif("sys.platform == 'win32'")
+    def test_popen_forkserver_exit_status(
+        self, makegateway: Callable[[str], Gateway]
+    ) -> None:
+        gw = makegateway("popen//forkserver")
+        gw.remote_exec("import os; os._exit(3)")
+        assert gw._io.wait() == 3
+        gw = makegateway("popen//forkserver")
+        gw.exit()
+        gw.join()
+        assert gw._io.wait() == 0
+        gw = makegateway("popen//forkserver")
+        gw._io.kill()
+        assert gw._io.wait() == -signal.SIGKILL
+
+    @pytest.mark.skipif("sys.platform == 'win32'")
+    def test_popen_forkserver_via(self, makegateway: Callable[[str], Gateway]) -> None:
+        makegateway("popen//id=master")
+        with pytest.raises(ValueError, match="forkserver"):
+            makegateway("popen//forkserver//via=master")
+
     @skip_win_pypy
     def test_popen_explicit(self, makegateway: Callable[[str], Gateway]) -> None:
         gw = makegateway("popen//python=%s" % sys.executable)
@@ -254,3 +379,73 @@ class TestMakegateway:
         assert gw.id == "s1"
         assert gw.remote_status()
         group.terminate()
+
+    @pytest.mark.skipif("sys.platform == 'win32'")
+    def test_unix_installvia(self) -> None:
+        group = execnet.Group()
+        group.makegateway("popen//id=p1")
+        gw = group.makegateway("unix//installvia=p1//id=u1")
+        assert gw.id == "u1"
+        assert gw.remote_status()
+        assert "fds" in gw.features
+        path = gw.remoteaddress
+        group.terminate()
+        assert not os.path.exists(path)
+
+    @pytest.mark.skipif("sys.platform == 'win32'")
+    def test_unix_socketserver(self, tmp_path: Path) -> None:
+        path = str(tmp_path / "server.sock")
+        script = Path(execnet.__file__).parent / "script" / "socketserver.py"
+        server = subprocess.Popen([sys.executable, str(script), path])
+        try:
+            for _ in range(100):
+                if os.path.exists(path):
+                    break
+                time.sleep(0.05)
+            group = execnet.Group()
+            gw = group.makegateway("unix=%s//id=u1" % path)
+            assert gw.remote_exec("channel.send(42)").receive() == 42
+            group.terminate()
+        finally:
+            server.kill()
+            server.wait()
+
+    @pytest.mark.skipif("sys.platform == 'win32'")
+    def test_unix_sendfd(self, tmp_path: Path) -> None:
+        group = execnet.Group()
+        group.makegateway("popen//id=p1")
+        gw = group.makegateway("unix//installvia=p1//id=u1")
+        ch = gw.remote_exec(
+            """
+            import os
+            fd = channel.receive()
+            channel.send(os.read(fd, 100))
+            os.close(fd)
+            r, w = os.pipe()
+            os.write(w, b"from remote")
+            os.close(w)
+            channel.sendfd(r)
+            os.close(r)
+        """
+        )
+        path = tmp_path / "data"
+        path.write_bytes(b"passed file")
+        with open(path, "rb") as f:
+            ch.sendfd(f.fileno())
+        assert ch.receive() == b"passed file"
+        fd = ch.receive()
+        try:
+            assert os.read(fd, 100) == b"from remote"
+        finally:
+            os.close(fd)
+        ch.waitclose()
+        group.terminate()
+
+    def test_sendfd_unsupported(self, makegateway: Callable[[str], Gateway]) -> None:
+        gw = makegateway("popen")
+        assert "fds" not in gw.features
+        ch = gw.remote_exec("channel.receive()")
+        with pytest.raises(OSError, match="cannot pass file descriptors"):
+            ch.sendfd(0)
+        ch.send(None)
+        ch.waitclose()